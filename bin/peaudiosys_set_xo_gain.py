@@ -28,64 +28,23 @@
 import sys
 import os
 UHOME = os.path.expanduser("~")
-sys.path.append(f'{UHOME}/pe.audio.sys/share/services/preamp_mod')
-from core import bf_cli
+sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
+import brutefir_mod as bf
 
 
 def get_filters():
-    """ Get runnning filter parameters
+    """ Get runnning filter parameters, from the Brutefir runtime model
+        (only the xover filters, i.e. not the level, eq and drc stages)
     """
-
-    lines = bf_cli('lf').split('\n')
-    filters = {}
-
-    # Starting from the 1st xover filter, i.e: the '6:....'.
-    i = lines.index('> Filters:') + 1 + (7*6)
-
-    while True:
-
-        fname = lines[i].split(':')[1].strip().replace('"', '')
-
-        filters[fname] = {
-            'fnum':         lines[i].split(':')[0].strip(),
-            'coeff':        lines[i+1].split(':')[1].strip(),
-            'delay_blocks': lines[i+2].split(':')[1].strip().split()[0],
-            'from_inputs':  lines[i+3].split(':')[1].strip(),
-            'to_outputs':   lines[i+4].split(':')[1].strip(),
-            'from_filters': lines[i+5].split(':')[1].strip(),
-            'to_filters':   lines[i+6].split(':')[1].strip()
-        }
-
-        i += 7
-        if not lines[i] or lines[i] == '':
-            break
-
-    return filters
+    filters = bf.get_runtime()["filters"]
+    return { k: v for k, v in filters.items()
+                  if not k.split('.')[1] in ('lev', 'eq', 'drc') }
 
 
 def get_outputs():
     """ Get running outputs parameters
     """
-
-    lines = bf_cli('lo').split('\n')
-    outputs = {}
-
-    i = lines.index('> Output channels:') + 1
-
-    while True:
-
-        onum = lines[i].split(':')[0].strip()
-
-        outputs[onum] = {
-            'name':  lines[i].split(':')[1].strip().split()[0].replace('"', ''),
-            'delay': lines[i].split()[-1].strip().replace(')', '')
-        }
-
-        i += 1
-        if not lines[i] or lines[i] == '':
-            break
-
-    return outputs
+    return bf.get_current_outputs()
 
 
 def get_to_output(fname):
@@ -96,15 +55,9 @@ def get_to_output(fname):
     filters = get_filters()
     f = filters[fname]
 
-    tmp = f['to_outputs'].split('/')
-    out, att = tmp[:2]
-
-    if len(tmp) == 2:
-        pol = '1'
-    else:
-        pol = tmp[2]
+    out, (att, pol) = list( f['to_outputs'].items() )[0]
 
-    return [out, float(att), int(pol), f['to_outputs']]
+    return [out, att, pol, f'{out}/{att}' + ('/-1' if pol < 0 else '')]
 
 
 def set_filter_gain(fname, gain):
@@ -118,13 +71,16 @@ def set_filter_gain(fname, gain):
             out = get_to_output(f'f.{fname}.{ch}')[0]
             cmd = f'cfoa "f.{fname}.{ch}" {str(out)} {-gain}'
             #print(cmd)
-            bf_cli( cmd )
+            bf.cli( cmd )
 
     else:
         out = get_to_output(f'f.{fname}')[0]
         cmd = f'cfoa "f.{fname}" {str(out)} {-gain}'
         #print(cmd)
-        bf_cli( cmd )
+        bf.cli( cmd )
+
+    # The server runtime model is resynced to the new gains
+    bf.get_runtime(verify=True)
 
 
 def print_curr(way):
@@ -162,7 +118,7 @@ def list_filters():
     filters = get_filters()
     for f in filters:
         # omit 'f.' prefix
-        print(f'{f[2:].ljust(10)}', filters[f]['to_outputs'])
+        print(f'{f[2:].ljust(10)}', get_to_output(f)[3])
 
 
 if __name__ == '__main__':
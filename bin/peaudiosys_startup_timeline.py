@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+"""
+    Shows the pe.audio.sys startup timeline as a waterfall chart,
+    as recorded by the last 'start.py all' run.
+
+    usage:  peaudiosys_startup_timeline.py  [ --history  [phase] ]
+
+        --history   lists the total startup time of past runs,
+                    optionally showing the time of a given phase,
+                    e.g.:  --history start_brutefir
+"""
+
+import sys
+import os
+
+UHOME = os.path.expanduser("~")
+sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
+
+import timeline
+
+
+def print_history(phase=''):
+
+    history = timeline.load_history()
+
+    if not history:
+        print('no startup history found')
+        return
+
+    prev = None
+    for run in history:
+
+        total = run["total"]
+        delta = f'({total - prev:+6.2f})' if prev is not None else ' ' * 8
+        line  = f'{run["date"]}  {total:6.2f} s {delta}'
+
+        if phase:
+            secs = [ v for k, v in run["phases"].items() if k.endswith(f': {phase}') ]
+            line += f'   {phase}: ' + (f'{secs[0]:.2f} s' if secs else '-')
+
+        print(line)
+        prev = total
+
+
+if __name__ == "__main__":
+
+    if '-h' in sys.argv[1:]:
+        print(__doc__)
+
+    elif '--history' in sys.argv[1:]:
+        args = [ x for x in sys.argv[1:] if x != '--history' ]
+        print_history( args[0] if args else '' )
+
+    else:
+        print( timeline.waterfall( timeline.load() ) )
@@ -1,5 +1,5 @@
 #!/bin/bash
 
-# See plugins/peak_monitor.py
+# See plugins/peak_monitor.py and miscel/peaks_store.py
 
-tail -F ~/pe.audio.sys/log/brutefir_peaks.log
+watch -n 2 python3 ~/pe.audio.sys/share/miscel/peaks_store.py ${1:-today}
@@ -26,89 +26,40 @@
 
 """
 
-from socket import socket
+import sys
+import os
 from time import sleep
 from subprocess import call
 
+UHOME = os.path.expanduser("~")
+sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
-def cli(cmd):
-    """ A socket client that queries commands to Brutefir
-    """
-    # using 'with' will disconnect the socket when done
-    ans = ''
-    with socket() as s:
-        try:
-            s.settimeout(1)
-            s.connect( ('localhost', 3000) )
-            s.send( f'{cmd}; quit;\n'.encode() )
-            while True:
-                tmp = s.recv(1024)
-                if not tmp:
-                    break
-                ans += tmp.decode()
-            s.close()
-        except:
-            print( f'(brutefir_mod) error: unable to connect to Brutefir:3000' )
-    return ans
+import brutefir_mod as bf
 
 
 def main():
-    # Excample of filters printout from Brutefir CLI (left ch inverted)
-    #  0: "f.lev.L"
-    #      coeff set: -1 (no filter)
-    #      delay blocks: 0 (0 samples)
-    #      from inputs:  0/37.5/-1 1/inf
-    #      to outputs:
-    #      from filters:
-    #      to filters:   2
-    #  1: "f.lev.R"
-    #      coeff set: -1 (no filter)
-    #      delay blocks: 0 (0 samples)
-    #      from inputs:  0/inf 1/37.5
-    #      ...
-    #      ...
-
-    tmp = cli('lf').split('Filters:\n')[-1].split('\n')
-
-    if not tmp[0]:
-        print('Cannot connect to Brutefir CLI')
-        return False
-
-    tmp = [x for x in tmp if x]
-
-    niveles = []
-
-    empezado = False
+    # The level filters as per the Brutefir runtime model (see brutefir_mod),
+    # 'from_inputs' example when left ch inverted:
+    #   f.lev.L  {'0': [37.5, -1], '1': [None, 1]}
+    #   f.lev.R  {'0': [None, 1],  '1': [37.5, 1]}
 
-    for line in tmp:
+    filters = bf.get_runtime()["filters"]
 
-        if line[6:12] == 'f.lev.':
-            empezado = True
-
-        if 'from inputs' in line and empezado:
-            #print(line)
-            mix = line.split(':')[-1].strip().split()
-            mix = [x.split('/')[1:] for x in mix]
-            for x in mix:
-                # Bf CLI only prints 3 fields when inverted
-                if not x[1:]:
-                    x.append('+')
-                else:
-                    x[1] = '-'
-
-            niveles.append(mix)
+    if not 'f.lev.L' in filters:
+        print('Cannot connect to Brutefir CLI')
+        return False
 
-        if 'to filters' in line:
-            empezado = False
+    def att_pol(fname, in_idx):
+        att, sign = filters[fname]["from_inputs"].get(in_idx, [None, 1])
+        att = 'inf' if att is None else str(att)
+        return att.rjust(5), {1: '+', -1: '-'}[sign]
 
-    LL_att =  niveles[0][0][0];    LR_att =  niveles[0][1][0]
-    RL_att =  niveles[1][0][0];    RR_att =  niveles[1][1][0]
-    LL_pol =  niveles[0][0][1];    LR_pol =  niveles[0][1][1]
-    RL_pol =  niveles[1][0][1];    RR_pol =  niveles[1][1][1]
+    LL_att, LL_pol = att_pol('f.lev.L', '0');   LR_att, LR_pol = att_pol('f.lev.L', '1')
+    RL_att, RL_pol = att_pol('f.lev.R', '0');   RR_att, RR_pol = att_pol('f.lev.R', '1')
 
     print('      ',  '  in L:      in R:')
-    print('out L:', f'{LL_att.rjust(5)} ({LL_pol})  {LR_att.rjust(5)} ({LR_pol})')
-    print('out R:', f'{RL_att.rjust(5)} ({RL_pol})  {RR_att.rjust(5)} ({RR_pol})')
+    print('out L:', f'{LL_att} ({LL_pol})  {LR_att} ({LR_pol})')
+    print('out R:', f'{RL_att} ({RL_pol})  {RR_att} ({RR_pol})')
     return True
 
 
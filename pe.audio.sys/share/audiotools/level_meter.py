@@ -22,13 +22,18 @@
 
 """
 import sys
+import os
 import argparse
 import numpy as np
 import queue
 import threading
+from time import time
 # Thanks to https://python-sounddevice.readthedocs.io
 import sounddevice as sd
 
+sys.path.append( os.path.dirname( os.path.realpath(__file__) ) )
+from true_peak import TruePeak, dBTP
+
 
 def int_or_str(text):
     """Helper function for argument parsing."""
@@ -52,7 +57,7 @@ def parse_cmdline():
 
     parser.add_argument('-m', '--mode', type=str,
             default='rms',
-            help='\'rms\' or \'peak\'')
+            help='\'rms\', \'peak\' or \'truepeak\'')
 
     args = parser.parse_args()
 
@@ -72,20 +77,34 @@ class Meter(object):
 
         .device         The sound device identifier (see -l command line option)
 
-        .mode           'rms' or 'peak'
+        .mode           'rms', 'peak' or 'truepeak' (4x oversampled dBTP)
 
         .bar            (boolean) On console use, will display a meter bar
 
         .L              The measured level
 
+        .hold           Seconds to hold the max measured level
+
+        .L_max          The max measured level during the last 'hold' seconds
+
+        .stop()         Stop measuring
+
     """
 
 
-    def __init__(self, device, mode='rms', bar=True):
+    def __init__(self, device, mode='rms', bar=True, hold=5.0):
         self.device = device
         self.mode   = mode
         self.bar    = bar
+        self.hold   = hold
         self.L      = -100.0
+        self.L_max  = -100.0
+        self.stop_flag = threading.Event()
+
+
+    def stop(self):
+        """ Breaks the measuring loop, then the audio stream is closed """
+        self.stop_flag.set()
 
 
     def start(self):
@@ -111,13 +130,16 @@ class Meter(object):
                     M = -100.0
 
             elif mode == 'peak':
-                ML, MR = np.max(block[:,0]), np.max(block[:,1])
-                M = max(ML, MR)
+                # (i) abs() so that negative excursions are also detected
+                M = np.max( np.abs(block[:, :2]) )
                 if M:
                     M = 20 * np.log10(M)
                 else:
                     M = -100.0
 
+            elif mode == 'truepeak':
+                M = dBTP( np.max( tp.process( block[:, :2] ) ) )
+
             else:
                 print('bad mode')
                 sys.exit()
@@ -125,6 +147,15 @@ class Meter(object):
             return round(M, 1)
 
 
+        def update_max_hold():
+            """ Keeps the max level measured during the last 'hold' seconds """
+            now = time()
+            history.append( (now, self.L) )
+            while history and (now - history[0][0]) > self.hold:
+                history.pop(0)
+            self.L_max = max( [ x[1] for x in history ] )
+
+
         def loop_forever():
             """ loop capturing stream and processing audio blocks """
 
@@ -134,11 +165,15 @@ class Meter(object):
                                   samplerate=fs,
                                   channels= 2,
                                   dither_off=True):
-                while True:
+                while not self.stop_flag.is_set():
                     # Reading captured (b)locks:
-                    b = qIn.get()
+                    try:
+                        b = qIn.get(timeout=1)
+                    except queue.Empty:
+                        continue
                     # Compute the measured level
                     self.L = measure(block=b, duration=dur, mode=self.mode)
+                    update_max_hold()
                     # Print a nice bar meter
                     if self.bar:
                         I = max(-60, int(self.L))
@@ -156,6 +191,15 @@ class Meter(object):
         # Prepare an internal FIFO queue for the callback function
         qIn    = queue.Queue()
 
+        # (time, level) measurements history for the max hold level
+        history = []
+
+        # The oversampling true peak estimator keeps the filter history
+        # between consecutive blocks
+        tp = TruePeak(channels=2)
+
+        self.stop_flag.clear()
+
         # Getting current Fs
         fs = sd.query_devices(self.device, 'input')['default_samplerate']
 
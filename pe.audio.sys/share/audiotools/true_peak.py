@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Rafael Sánchez
+# This file is part of 'audiotools'
+#
+# 'audiotools' is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# 'audiotools' is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with 'pe.audio.sys'.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+    A true-peak (inter-sample peak) estimator as per ITU-R BS.1770-4 Annex 2.
+
+    The signal is 4x oversampled by a 48 taps polyphase FIR (4 phases
+    of 12 taps), then the absolute peak is searched on the oversampled
+    signal. The filter history is kept between blocks, so an audio stream
+    can be fed block by block.
+
+    Usage example:
+
+        tp = TruePeak(channels=2)
+        while streaming:
+            peaks = tp.process( block )   # block[frames, channels]
+            print( dBTP( max(peaks) ) )
+"""
+
+import numpy as np
+
+
+# ITU-R BS.1770-4 Annex 2, 4x oversampling interpolating filter,
+# arranged as 4 phases of 12 taps.
+POLYPHASE_COEFFS = np.array( [
+  [  0.0017089843750,  0.0109863281250, -0.0196533203125,  0.0332031250000,
+    -0.0594482421875,  0.1373291015625,  0.9721679687500, -0.1022949218750,
+     0.0476074218750, -0.0266113281250,  0.0148925781250, -0.0083007812500 ],
+  [ -0.0291748046875,  0.0292968750000, -0.0517578125000,  0.0891113281250,
+    -0.1665039062500,  0.4650878906250,  0.7797851562500, -0.2003173828125,
+     0.1015625000000, -0.0582275390625,  0.0330810546875, -0.0189208984375 ],
+  [ -0.0189208984375,  0.0330810546875, -0.0582275390625,  0.1015625000000,
+    -0.2003173828125,  0.7797851562500,  0.4650878906250, -0.1665039062500,
+     0.0891113281250, -0.0517578125000,  0.0292968750000, -0.0291748046875 ],
+  [ -0.0083007812500,  0.0148925781250, -0.0266113281250,  0.0476074218750,
+    -0.1022949218750,  0.9721679687500,  0.1373291015625, -0.0594482421875,
+     0.0332031250000, -0.0196533203125,  0.0109863281250,  0.0017089843750 ]
+  ], dtype='float32' )
+
+
+def dBTP(x):
+    """ Linear amplitude to dB True Peak """
+    if x > 0:
+        return round( 20 * np.log10(x), 1 )
+    else:
+        return -100.0
+
+
+class TruePeak(object):
+    """
+        Streamed 4x oversampled true-peak estimator.
+
+
+        .process(block)     Feed an audio block[frames, channels],
+                            returns the block true-peak per channel
+                            as linear amplitude (numpy array)
+
+        .reset()            Clears the filter history
+
+        .channels           Number of channels
+
+    """
+
+
+    def __init__(self, channels=2):
+        self.channels = channels
+        self.ntaps    = POLYPHASE_COEFFS.shape[1]
+        # Samples from the previous block needed to filter the current one
+        self.history  = np.zeros( (self.ntaps - 1, channels), dtype='float32' )
+
+
+    def reset(self):
+        self.history[:] = 0.0
+
+
+    def process(self, block):
+        """ Polyphase filtering: each phase is an interpolated sub-sample
+            stream at the original rate, so we convolve the block with the
+            4 phases at once by accumulating the 12 delayed copies of it.
+        """
+        block  = np.asarray(block, dtype='float32').reshape(-1, self.channels)
+        frames = block.shape[0]
+
+        if not frames:
+            return np.zeros(self.channels)
+
+        x = np.concatenate( (self.history, block) )
+
+        # y[frame, channel, phase]
+        y = np.zeros( (frames, self.channels, POLYPHASE_COEFFS.shape[0]),
+                      dtype='float32' )
+        for k in range(self.ntaps):
+            d = self.ntaps - 1 - k
+            y += x[d : d + frames, :, None] * POLYPHASE_COEFFS[:, k]
+
+        # Keep the tail for the next block
+        self.history = x[-(self.ntaps - 1):].copy()
+
+        # The sample peak is also taken into account, so the result never
+        # underestimates the plain digital peak.
+        oversampled_peak = np.max( np.abs(y), axis=(0, 2) )
+        sample_peak      = np.max( np.abs(block), axis=0 )
+
+        return np.maximum( oversampled_peak, sample_peak )
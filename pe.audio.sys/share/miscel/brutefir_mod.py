@@ -8,29 +8,54 @@ import  numpy as np
 from    scipy import signal
 import  os
 import  sys
-from    subprocess  import Popen
-from    time        import sleep
+import  shlex
+import  json
+import  threading
+from    time        import sleep, time
 from    socket      import socket
 
-from    config      import  CONFIG, UHOME, LSPK_FOLDER, EQ_CURVES, \
+import  config
+from    config      import  CONFIG, UHOME, LSPK_FOLDER, \
                             BFCFG_PATH, LOG_FOLDER
 
 from    miscel      import  read_bf_config_fs, read_bf_config_port, Fmt, \
                             process_is_running, send_cmd, calc_gain
 
+from    proc_registry import spawn
+
 import  jack_mod as jack
 
 
-if CONFIG["web_config"]["show_graphs"]:
-    sys.path.append ( os.path.dirname(__file__) )
-    from   brutefir_eq2png import do_graph as bf_eq2png_do_graph
-    import threading
+# Server side EQ graph PNG rendering, only if the web page does not draw it
+PNG_GRAPHS = CONFIG["web_config"]["show_graphs"] and \
+             not CONFIG["web_config"]["client_graphs"]
 
 
 BFLOGPATH = f'{LOG_FOLDER}/brutefir.log'
 
+# The Brutefir CLI port, read from brutefir_config on first use (see get_bf_port)
+BF_PORT = None
+
+# Seconds between runtime model verifications (see BfRuntime)
+VERIFY_PERIOD = 60
+
 # Global to avoid dumping EQ magnitude graph to a PNG file if not changed
-last_eq_mag = np.zeros( EQ_CURVES["freqs"].shape[0] )
+last_eq_mag = None
+
+
+def get_bf_port():
+    global BF_PORT
+    if BF_PORT is None:
+        BF_PORT = read_bf_config_port()
+    return BF_PORT
+
+
+def bf_eq2png_do_graph(*args, **kwargs):
+    """ matplotlib is heavy, so it is imported on the first rendering
+    """
+    sys.path.append ( os.path.dirname(__file__) )
+    from   brutefir_eq2png import do_graph
+    return do_graph(*args, **kwargs)
 
 
 def readPCM(fname, dtype='float32'):
@@ -48,7 +73,7 @@ def cli(cmd):
     with socket() as s:
         try:
             s.settimeout(1)
-            s.connect( ('localhost', BF_PORT) )
+            s.connect( ('localhost', get_bf_port()) )
             s.send( f'{cmd}; quit;\n'.encode() )
             while True:
                 tmp = s.recv(1024)
@@ -61,6 +86,73 @@ def cli(cmd):
     return ans
 
 
+class CliSession(object):
+    """ A persistent Brutefir CLI connection, intended for clients
+        that query Brutefir periodically (e.g. the peak monitor),
+        so that a new socket is not opened for each command.
+
+        .cmd(command)   sends a command, returns Brutefir's answer
+        .close()        quits the CLI session
+
+        If the connection breaks (e.g. Brutefir was restarted), it will
+        reconnect on the next command.
+    """
+
+    def __init__(self, timeout=1):
+        self.timeout = timeout
+        self.sock    = None
+
+
+    def _connect(self):
+        self.sock = socket()
+        self.sock.settimeout(self.timeout)
+        self.sock.connect( ('localhost', get_bf_port()) )
+        # discard the welcome prompt, if any
+        try:
+            self.sock.recv(1024)
+        except:
+            pass
+
+
+    def _read_answer(self):
+        """ Brutefir ends each answer by printing the '> ' prompt
+        """
+        ans = ''
+        while not ans.endswith('> '):
+            try:
+                tmp = self.sock.recv(1024)
+            except:
+                # timeout, return what we have
+                break
+            if not tmp:
+                raise ConnectionError('Brutefir closed the CLI connection')
+            ans += tmp.decode()
+        return ans
+
+
+    def cmd(self, cmd):
+        for _ in (1, 2):
+            try:
+                if not self.sock:
+                    self._connect()
+                self.sock.sendall( f'{cmd};\n'.encode() )
+                return self._read_answer()
+            except:
+                self.close()
+        print( f'(brutefir_mod) error: unable to connect to Brutefir:{get_bf_port()}' )
+        return ''
+
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.sendall( b'quit;\n' )
+                self.sock.close()
+            except:
+                pass
+        self.sock = None
+
+
 def set_subsonic(mode):
     """ Subsonic filter is applied into the 'level' filtering stage.
         Coefficients must be named: "subsonic.mp" and/or "subsonic.lp"
@@ -75,7 +167,7 @@ def set_subsonic(mode):
     else:
         cmd = 'cfc "f.lev.L" -1; cfc "f.lev.R" -1;'
 
-    result = cli(cmd)
+    result = BF_RUNTIME.cli(cmd)
 
     if "There is no coefficient set" in result:
         return 'subsonic coeff not available'
@@ -162,36 +254,66 @@ def set_gains( state, nolevel=False, dBextra=0 ):
     Lcmd = f'cfia "f.lev.L" "in.L" m{LL} ; cfia "f.lev.L" "in.R" m{LR}'
     Rcmd = f'cfia "f.lev.R" "in.L" m{RL} ; cfia "f.lev.R" "in.R" m{RR}'
 
-    cli( f'{Lcmd}; {Rcmd}' )
+    BF_RUNTIME.cli( f'{Lcmd}; {Rcmd}' )
 
 
-def set_eq( eq_mag, eq_pha ):
-    """ Adjust the Brutefir EQ module,
-        also will dump an EQ graph png file
+class EqPngRenderer(object):
+    """ Renders the EQ graph PNG file in a background thread.
+
+        Renders are coalesced: at most one render is in flight, and
+        only the latest submitted curve will be drawn when it finishes.
     """
 
-    def save_png():
+    def __init__(self):
+        self.lock   = threading.Lock()
+        self.wakeup = threading.Event()
+        self.latest = None
+        self.thread = None
 
-        def do_graph(e):
-            bf_eq2png_do_graph(freqs, eq_mag, CONFIG["bfeq_linear_phase"])
-            e.set()
 
-        def flag_to_aux_info(e):
-            e.wait()    # waits until set flag is true
+    def submit(self, freqs, eq_mag):
+
+        with self.lock:
+            self.latest = (freqs, eq_mag)
+
+        if not self.thread:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+        self.wakeup.set()
+
+
+    def _run(self):
+
+        while True:
+
+            self.wakeup.wait()
+            self.wakeup.clear()
+
+            with self.lock:
+                job, self.latest = self.latest, None
+
+            if job is None:
+                continue
+
+            freqs, eq_mag = job
+            bf_eq2png_do_graph(freqs, eq_mag, CONFIG["bfeq_linear_phase"])
             send_cmd('aux alert_new_eq_graph')
 
 
-        # Threading because saving the PNG file can take too long
-        e  = threading.Event()
-        j1 = threading.Thread(target=do_graph,         args=(e,))
-        j2 = threading.Thread(target=flag_to_aux_info, args=(e,))
-        j1.start()
-        j2.start()
+if PNG_GRAPHS:
+    EQ_PNG_RENDERER = EqPngRenderer()
+
 
+def set_eq( eq_mag, eq_pha ):
+    """ Adjust the Brutefir EQ module,
+        also will dump an EQ graph png file if PNG_GRAPHS
+    """
 
     global last_eq_mag
 
-    freqs = EQ_CURVES["freqs"]
+    # (i) EQ_CURVES are loaded on first access, see config.py
+    freqs = config.EQ_CURVES["freqs"]
     mag_pairs = []
     pha_pairs = []
 
@@ -206,11 +328,12 @@ def set_eq( eq_mag, eq_pha ):
 
     cli('lmc eq "c.eq" mag '   + mag_str)
     cli('lmc eq "c.eq" phase ' + pha_str)
+    BF_RUNTIME.set_eq(eq_mag, eq_pha)
 
     # Dumping the EQ graph to a png file if curves have changed
-    if not (last_eq_mag == eq_mag).all():
-        if CONFIG["web_config"]["show_graphs"]:
-            save_png()
+    if last_eq_mag is None or not (last_eq_mag == eq_mag).all():
+        if PNG_GRAPHS:
+            EQ_PNG_RENDERER.submit(freqs, eq_mag)
         last_eq_mag = eq_mag
 
 
@@ -328,7 +451,7 @@ def set_drc( drcID ):
         cmd = ( f'cfc "f.drc.L" "drc.L.{drcID}";'
                 f'cfc "f.drc.R" "drc.R.{drcID}";' )
 
-    cli( cmd )
+    BF_RUNTIME.cli( cmd )
 
 
 def set_xo( ways, xo_coeffs, xoID ):
@@ -371,7 +494,7 @@ def set_xo( ways, xo_coeffs, xoID ):
         cmd += f'cfc "{way}" "{BMcoeff}"; '
 
     #print (cmd)
-    cli( cmd )
+    BF_RUNTIME.cli( cmd )
 
 
 def get_config():
@@ -597,7 +720,7 @@ def get_in_connections():
 
 
 def restart_and_reconnect(bf_sources=[], delay=0.0):
-    """ Restarts Brutefir as external process (Popen),
+    """ Restarts Brutefir as external process (registered Popen),
         then check Brutefir spawn connections to system ports,
         then reconnects Brutefir inputs.
         (i) Notice that Brutefir inputs can have sources
@@ -608,7 +731,7 @@ def restart_and_reconnect(bf_sources=[], delay=0.0):
     # Restarts Brutefir (external process)
     os.chdir(LSPK_FOLDER)
     with open(BFLOGPATH, 'w') as f:
-        Popen(['brutefir', 'brutefir_config'], stdout=f, stderr=f)
+        spawn('brutefir', ['brutefir', 'brutefir_config'], stdout=f, stderr=f)
     os.chdir(UHOME)
     sleep(1)  # wait a bit for Brutefir to be running
 
@@ -674,6 +797,9 @@ def restart_and_reconnect(bf_sources=[], delay=0.0):
         if res != 'done':
             warnings += f' {res}'
 
+    # A new Brutefir process, the runtime model will be read again
+    BF_RUNTIME.clear()
+
 
     if not warnings:
         return 'done'
@@ -681,91 +807,113 @@ def restart_and_reconnect(bf_sources=[], delay=0.0):
         return warnings
 
 
-def get_running_filters():
-
-    # auxiliary to sum all attenuations inside a filter stage
-    def add_atten_pol(f):
-        at = 0.0 # atten total
-        pol = 1
+def get_config_inputs():
+    """ Read the input names from 'brutefir_config', example:
 
-        for key in ['from inputs', 'to outputs', 'from filters', 'to filters']:
-            tmp = f[key].split()
-            # index/atten/multiplier, for instance:
-            # 0/0.0    1/inf
-            # 3/0.0
-            # 4/-9.0/-1
-            for item in [ x for x in tmp if '/' in x ]:
+            {'in.L': '0', 'in.R': '1'}
+    """
+    with open(BFCFG_PATH, 'r') as f:
+        bfconfig = f.read().split('\n')
 
-                # atten
-                a = item.split('/')[1]
-                if a != 'inf':
-                    at += float(a)
+    for line in bfconfig:
+        line = line.split('#')[0].strip()
+        if line.startswith('input') and '{' in line:
+            names = line.replace('input', '').replace('{', '').split(',')
+            names = [ x.replace('"', '').strip() for x in names ]
+            return { name: str(i) for i, name in enumerate(names) }
 
-                # multiplier (polarity)
-                try:
-                    tmp = item.split('/')[2]
-                    pol *= (int( tmp ) )
-                except:
-                    pass
+    return {}
 
-        f["atten tot"]  = at
-        f["pol"]        = pol
 
-        return f
+def parse_atten_items(text):
+    """ Parses a filter connections field from Brutefir 'lf' printout,
+        items are 'index/atten[/multiplier]', example:
 
-    filters = []
-    f_blank = { 'f_num':    None,
-                'f_name':   None,
-                }
+            '0/37.5/-1 1/inf'  -->  {'0': [37.5, -1], '1': [None, 1]}
 
-    # query list of filter in Brutefir
-    lines = cli('lf').split('\n')
+        (i) None stands for an 'inf' attenuation, i.e. no signal.
+    """
+    items = {}
+    for item in text.split():
+        fields = item.split('/')
+        if len(fields) < 2:
+            continue
+        atten = None if fields[1] == 'inf' else float(fields[1])
+        sign  = -1 if fields[2:] and float(fields[2]) < 0 else 1
+        items[ fields[0] ] = [atten, sign]
+    return items
+
+
+def parse_lf(text):
+    """ Parses the Brutefir 'lf' printout, example:
+
+            0: "f.lev.L"
+                coeff set: -1 (no filter)
+                delay blocks: 0 (0 samples)
+                from inputs:  0/37.5/-1 1/inf
+                to outputs:
+                from filters:
+                to filters:   2
+
+        returns a dict of filters:
+
+            { 'f.lev.L': {'index': '0', 'coeff': '-1', 'delay_blocks': '0',
+                          'from_inputs': {'0': [37.5, -1], '1': [None, 1]},
+                          'to_outputs': {}, 'from_filters': {},
+                          'to_filters': ['2'] },
+              ... }
+    """
+    filters = {}
+    f = None
 
-    # scanning filters
-    f = {}
-    for line in lines:
+    for line in text.split('\n'):
 
         if line and ':' in line[ :5]:   # ':' pos can vary
+            fname = line.split(':')[1].strip().replace('"', '')
+            f = filters[fname] = { 'index':         line.split(':')[0].strip(),
+                                   'coeff':         '-1',
+                                   'delay_blocks':  '0',
+                                   'from_inputs':   {},
+                                   'to_outputs':    {},
+                                   'from_filters':  {},
+                                   'to_filters':    [] }
+            continue
 
-            if f:
-                f = add_atten_pol(f)
-                filters.append( f )
-
-            f = f_blank.copy()
-            f["f_num"]  = line.split(':')[0].strip()
-            f["f_name"] = line.split(':')[1].strip().replace('"','')
-
-        if 'coeff set:' in line:
-            f["coeff set"] = line.split(':')[1].strip()
-        if 'delay blocks:' in line:
-            f["delay blocks"] = line.split(':')[1].strip()
-        if 'from inputs:' in line:
-            f["from inputs"] = line.split(':')[1].strip()
-        if 'to outputs:' in line:
-            f["to outputs"] = line.split(':')[1].strip()
-        if 'from filters:' in line:
-            f["from filters"] = line.split(':')[1].strip()
-        if 'to filters:' in line:
-            f["to filters"] = line.split(':')[1].strip()
-
-    # adding the last
-    if f:
-        f = add_atten_pol(f)
-        filters.append( f )
+        if f is None or not ':' in line:
+            continue
+
+        key, value = [ x.strip() for x in line.split(':', 1) ]
+
+        if key == 'coeff set':
+            f["coeff"] = value.split()[0] if value else '-1'
+        elif key == 'delay blocks':
+            f["delay_blocks"] = value.split()[0] if value else '0'
+        elif key == 'from inputs':
+            f["from_inputs"] = parse_atten_items(value)
+        elif key == 'to outputs':
+            f["to_outputs"] = parse_atten_items(value)
+        elif key == 'from filters':
+            f["from_filters"] = parse_atten_items(value)
+        elif key == 'to filters':
+            f["to_filters"] = value.split()
 
     return filters
 
 
-def get_current_outputs():
-    """ Read outputs from running Brutefir, then gets a dictionary.
-    """
+def parse_lo(text):
+    """ Parses the Brutefir 'lo' printout, returns a dict of outputs:
 
-    lines = cli('lo').split('\n')
+            {'0': {'name': 'fr.L', 'delay': 0}, '1': ... }
+    """
+    lines = text.split('\n')
     outputs = {}
 
+    if not '> Output channels:' in lines:
+        return outputs
+
     i = lines.index('> Output channels:') + 1
 
-    while True:
+    while i < len(lines) and lines[i]:
 
         onum = lines[i].split(':')[0].strip()
 
@@ -775,12 +923,330 @@ def get_current_outputs():
         }
 
         i += 1
-        if not lines[i] or lines[i] == '':
-            break
 
     return outputs
 
 
+class BfRuntime(object):
+    """ A mirrored model of the running Brutefir: filters (coefficient
+        assignments, input, output and filter attenuations and polarities,
+        delay blocks), outputs delays and the EQ.
+
+        The model is read from Brutefir ('lf' and 'lo' commands) when
+        needed, then it is kept updated from the commands sent through
+        .cli(), so that querying it does not need to talk to Brutefir.
+
+        The preamp server runs a background job to verify the model
+        periodically against Brutefir, any difference is recorded as a
+        drift then the model is reloaded.
+
+        .cli(command)       sends commands to Brutefir and updates the model
+        .get(verify=False)  the model as a dict (JSON serializable)
+        .verify()           compares the model to Brutefir
+        .clear()            the model will be read again on next query
+    """
+
+    def __init__(self):
+        self.lock       = threading.RLock()
+        self.filters    = {}
+        self.outputs    = {}
+        self.eq         = {}
+        self.version    = 0
+        self.loaded     = False
+        self.verified   = 0         # last verification timestamp
+        self.drifts     = []        # last found differences
+        self.verifier   = None
+        # name to index maps
+        self.inputs_map = {}
+        self.coeffs_map = {}
+
+
+    def clear(self):
+        with self.lock:
+            self.loaded = False
+
+
+    def _read_brutefir(self):
+        """ returns filters, outputs as running in Brutefir
+        """
+        return parse_lf( cli('lf') ), parse_lo( cli('lo') )
+
+
+    def load(self):
+        """ Reads the model from Brutefir
+        """
+        with self.lock:
+
+            if not self.inputs_map:
+                self.inputs_map = get_config_inputs()
+                self.coeffs_map = { c["name"]: c["index"]
+                                    for c in get_config()["coeffs"] }
+
+            filters, outputs = self._read_brutefir()
+            if not filters:
+                return False
+
+            self.filters, self.outputs = filters, outputs
+            freqs, mag, pha = read_eq()
+            self.eq = { 'freqs': freqs.tolist(),
+                        'mag':   np.round(mag, 3).tolist(),
+                        'pha':   np.round(pha, 3).tolist() }
+            self.loaded   = True
+            self.version += 1
+            return True
+
+
+    def cli(self, cmd):
+        """ Sends a command phrase to Brutefir, then the model
+            is updated as per the successfully done commands.
+        """
+        with self.lock:
+
+            ans = cli(cmd)
+
+            if not self.loaded:
+                return ans
+
+            low = ans.lower()
+            if not ans or 'unknown'  in low or 'invalid' in low or \
+                          'error'    in low or 'no coefficient' in low or \
+                          'out of range' in low:
+                # it is not known what was done, so the model is reloaded
+                self.loaded = False
+                return ans
+
+            for c in [ x.strip() for x in cmd.split(';') if x.strip() ]:
+                try:
+                    self._apply( shlex.split(c) )
+                except:
+                    self.loaded = False
+
+            self.version += 1
+
+            return ans
+
+
+    def _apply(self, args):
+        """ Updates the model as per a Brutefir command
+        """
+
+        def filter_name(x):
+            if x in self.filters:
+                return x
+            return [ k for k, v in self.filters.items() if v["index"] == x ][0]
+
+        def atten_item(value, prev_sign):
+            # 'mX' are multipliers, otherwise attenuations in dB
+            if value.startswith('m'):
+                m = float(value[1:])
+                atten = None if m == 0 else round( float(-20 * np.log10(abs(m))), 2 )
+                return [atten, -1 if m < 0 else 1]
+            return [float(value), prev_sign]
+
+        if not args:
+            return
+
+        cmd = args[0]
+
+        if cmd == 'cfc':
+            coeff = args[2]
+            if coeff != '-1' and not coeff.lstrip('-').isdigit():
+                coeff = self.coeffs_map[coeff]
+            self.filters[ filter_name(args[1]) ]["coeff"] = coeff
+
+        elif cmd in ('cfia', 'cfoa'):
+            f     = self.filters[ filter_name(args[1]) ]
+            field = {'cfia': 'from_inputs', 'cfoa': 'to_outputs'}[cmd]
+            if cmd == 'cfia':
+                idx = self.inputs_map.get( args[2], args[2] )
+            else:
+                idx = args[2]
+                for o, v in self.outputs.items():
+                    if v["name"] == idx:
+                        idx = o
+            prev_sign = f[field].get(idx, [0, 1])[1]
+            f[field][idx] = atten_item( args[3], prev_sign )
+
+        elif cmd == 'cod':
+            o = args[1]
+            self.outputs[o]["delay"] = int( args[2].split('/')[0] )
+
+
+    def set_eq(self, mag, pha):
+        """ Updates the model EQ, as sent to Brutefir (see set_eq)
+        """
+        with self.lock:
+            if self.loaded:
+                self.eq["mag"] = np.round(mag, 3).tolist()
+                self.eq["pha"] = np.round(pha, 3).tolist()
+                self.version  += 1
+
+
+    def verify(self):
+        """ Compares the model to the running Brutefir, differences
+            are saved into .drifts, then the model is reloaded.
+        """
+        with self.lock:
+
+            if not self.loaded:
+                self.load()
+                return []
+
+            filters, outputs = self._read_brutefir()
+            if not filters:
+                return ['Brutefir not available']
+
+            drifts = []
+
+            def same_items(a, b):
+                if a.keys() != b.keys():
+                    return False
+                for k in a:
+                    if a[k][1] != b[k][1]:
+                        return False
+                    if (a[k][0] is None) != (b[k][0] is None):
+                        return False
+                    if a[k][0] is not None and abs(a[k][0] - b[k][0]) > 0.1:
+                        return False
+                return True
+
+            for fname, f in filters.items():
+                m = self.filters.get(fname)
+                if not m:
+                    drifts.append( f'{fname}: not in model' )
+                    continue
+                for key in ('coeff', 'delay_blocks', 'to_filters'):
+                    if m[key] != f[key]:
+                        drifts.append( f'{fname} {key}: {m[key]} != {f[key]}' )
+                for key in ('from_inputs', 'to_outputs', 'from_filters'):
+                    if not same_items(m[key], f[key]):
+                        drifts.append( f'{fname} {key}: {m[key]} != {f[key]}' )
+
+            for o, v in outputs.items():
+                if self.outputs.get(o) != v:
+                    drifts.append( f'output {o}: {self.outputs.get(o)} != {v}' )
+
+            _, mag, _ = read_eq()
+            if mag.size != len(self.eq["mag"]) or \
+               np.max( np.abs(mag - np.array(self.eq["mag"])) ) > 0.01:
+                drifts.append( 'eq magnitude' )
+
+            self.verified = time()
+            self.drifts   = drifts
+
+            if drifts:
+                print( f'{Fmt.MAGENTA}(brutefir_mod) runtime model drifts: '
+                       f'{"; ".join(drifts)}{Fmt.END}' )
+                self.load()
+
+            return drifts
+
+
+    def get(self, verify=False):
+        """ returns the model as a dict
+        """
+        with self.lock:
+
+            if verify:
+                self.verify()
+
+            elif not self.loaded:
+                self.load()
+
+            return { 'version':     self.version,
+                     'loaded':      self.loaded,
+                     'verified':    self.verified,
+                     'drifts':      self.drifts,
+                     'filters':     self.filters,
+                     'outputs':     self.outputs,
+                     'eq':          self.eq }
+
+
+    def start_verifier(self, period=VERIFY_PERIOD):
+        """ A background job to verify the model periodically,
+            intended to be run from the preamp server.
+        """
+
+        def verify_loop():
+            while True:
+                sleep(period)
+                if is_running():
+                    try:
+                        self.verify()
+                    except Exception as e:
+                        print( f'(brutefir_mod) error verifying runtime model: {str(e)}' )
+
+        if not self.verifier:
+            self.verifier = threading.Thread( name='bf runtime verifier',
+                                              target=verify_loop, daemon=True )
+            self.verifier.start()
+
+
+BF_RUNTIME = BfRuntime()
+
+
+def get_runtime(verify=False):
+    """ The Brutefir runtime model as kept by the preamp server,
+        or read from Brutefir if the server is not available.
+    """
+    # This is the preamp server process
+    if BF_RUNTIME.verifier:
+        return BF_RUNTIME.get(verify)
+
+    ans = send_cmd( f'preamp get_bf_runtime {"verify" if verify else ""}',
+                    timeout=5 )
+    try:
+        return json.loads(ans)
+    except:
+        return BF_RUNTIME.get()
+
+
+def get_running_filters():
+    """ A list of filters as running in Brutefir, example item:
+
+            {'f_num': '8', 'f_name': 'f.sw', 'coeff set': '8',
+             'delay blocks': '0', 'from inputs': '', 'to outputs': '7/0.0',
+             'from filters': '2/3.0 3/3.0', 'to filters': '',
+             'atten tot': 6.0, 'pol': 1}
+    """
+
+    def items_str(items):
+        return ' '.join( [ f'{k}/{"inf" if a is None else a}' +
+                           ( '/-1' if sign < 0 else '' )
+                           for k, (a, sign) in items.items() ] )
+
+    filters = []
+
+    for fname, f in get_runtime()["filters"].items():
+
+        at  = 0.0
+        pol = 1
+        for key in ('from_inputs', 'to_outputs', 'from_filters'):
+            for a, sign in f[key].values():
+                if a is not None:
+                    at += a
+                pol *= sign
+
+        filters.append( { 'f_num':          f["index"],
+                          'f_name':         fname,
+                          'coeff set':      f["coeff"],
+                          'delay blocks':   f["delay_blocks"],
+                          'from inputs':    items_str( f["from_inputs"] ),
+                          'to outputs':     items_str( f["to_outputs"] ),
+                          'from filters':   items_str( f["from_filters"] ),
+                          'to filters':     ' '.join( f["to_filters"] ),
+                          'atten tot':      at,
+                          'pol':            pol } )
+
+    return filters
+
+
+def get_current_outputs():
+    """ Outputs as running in Brutefir, then gets a dictionary.
+    """
+    return get_runtime()["outputs"]
+
+
 def add_delay(ms):
     """ Will add a delay to all outputs, relative to the  delay values
         as configured under 'brutefir_config'.
@@ -816,7 +1282,7 @@ def add_delay(ms):
 
     # Issue new delay to Brutefir's outputs
     if not too_much:
-        ans = cli( cmd ).lower()
+        ans = BF_RUNTIME.cli( cmd ).lower()
         if not ans:
             result = 'Brutefir error'
         elif not 'unknown command' in ans and \
@@ -833,22 +1299,13 @@ def add_delay(ms):
     return result
 
 
-# Autoexec on loading this module
 def init():
-
-    global BF_PORT
-
-    BF_PORT = read_bf_config_port()
-
-
-    if not process_is_running('brutefir'):
+    """ To be called by the preamp service when starting,
+        importing this module has no side effects.
+    """
+    if not PNG_GRAPHS or not process_is_running('brutefir'):
         return
 
     # Dumping the EQ graph to a png file
-    if CONFIG["web_config"]["show_graphs"]:
-        freqs, eq_mag, _ = read_eq()
-        bf_eq2png_do_graph(freqs, eq_mag, is_lin_phase=CONFIG["bfeq_linear_phase"])
-
-
-# AUTOEXEC on loading this module
-init()
+    freqs, eq_mag, _ = read_eq()
+    bf_eq2png_do_graph(freqs, eq_mag, is_lin_phase=CONFIG["bfeq_linear_phase"])
@@ -7,6 +7,7 @@
 import os
 import sys
 import subprocess as sp
+import shlex
 from   time import sleep
 from   camilladsp import CamillaClient
 
@@ -15,6 +16,7 @@ sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
 from   miscel   import process_is_running, LOG_FOLDER, Fmt
 import jack_mod as jack
+from   proc_registry import spawn
 
 COMPRESSOR_CYCLE = ['off', '1.0:1', '2.0:1', '3.0:1']
 
@@ -101,7 +103,8 @@ def _init(compressor='off'):
                    f'--logfile "{LOG_FOLDER}/camilladsp.log" {config_file}'
 
         print(f'{Fmt.MAGENTA}Pleae wait for CamillaDSP to start ...{Fmt.END}')
-        p = sp.Popen( cdsp_cmd, shell=True )
+        # (i) no shell, so that the registered pid is the camilladsp one
+        p = spawn( 'camilladsp', shlex.split(cdsp_cmd) )
 
         tries = 120
         while tries:
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    A slim client entry point to the pe.audio.sys server.
+
+    It only uses the standard library, so that small tools and daemons
+    needing nothing but sending commands (remote controls, monitors ...)
+    start quickly, without loading config, numpy, psutil or JACK.
+
+        from client import send_cmd, read_state_from_disk, USER
+"""
+
+import  socket
+import  os
+import  sys
+from    json    import loads as json_loads
+from    time    import sleep
+from    getpass import getuser
+
+from    fmt     import Fmt
+
+USER        = getuser()
+UHOME       = os.path.expanduser("~")
+MAINFOLDER  = f'{UHOME}/pe.audio.sys'
+STATE_PATH  = f'{MAINFOLDER}/.state'
+
+# The server port, read from config.yml on first use
+_SERVER_PORT = None
+
+
+def get_server_port():
+    """ Taken from config if already loaded, otherwise the top level
+        'peaudiosys_port' line is read from config.yml (default 9990)
+    """
+    global _SERVER_PORT
+
+    if _SERVER_PORT:
+        return _SERVER_PORT
+
+    if 'config' in sys.modules:
+        _SERVER_PORT = sys.modules['config'].CONFIG['peaudiosys_port']
+        return _SERVER_PORT
+
+    port = 9990
+    try:
+        with open(f'{MAINFOLDER}/config/config.yml', 'r') as f:
+            for line in f:
+                if line.startswith('peaudiosys_port:'):
+                    port = int( line.split(':')[1].split('#')[0] )
+                    break
+    except Exception as e:
+        print( f'(client) cannot read the server port: {str(e)}' )
+
+    _SERVER_PORT = port
+    return _SERVER_PORT
+
+
+def send_cmd( cmd, sender='', verbose=False, timeout=60,
+              host='127.0.0.1', port=None ):
+    """
+        Sends a command to a pe.audio.sys server.
+        Returns a string about the execution response or an error if so.
+    """
+    # (i) socket timeout 60 because Brutefir can need some time
+    #     in slow machines after powersave shot it down.
+
+    if not sender:
+        sender = 'share.miscel'
+
+    if not port:
+        port = get_server_port()
+
+    # Default answer: "no answer from ...."
+    ans = f'no answer from {host}:{port}'
+
+    # (i) We prefer high-level socket function 'create_connection()',
+    #     rather than low level 'settimeout() + connect()'
+    try:
+
+        with socket.create_connection( (host, port), timeout=timeout ) as s:
+
+            s.send( cmd.encode() )
+
+            if verbose:
+                print( f'{Fmt.BLUE}(send_cmd) ({sender}) Tx: \'{cmd}\'{Fmt.END}' )
+
+            ans = ''
+
+            while True:
+
+                tmp = s.recv(1024)
+
+                if not tmp:
+                    break
+
+                ans += tmp.decode()
+
+            if verbose:
+                print( f'{Fmt.BLUE}(send_cmd) ({sender}) Rx: \'{ans}\'{Fmt.END}' )
+
+            s.close()
+
+    except Exception as e:
+
+        ans = str(e)
+
+        if verbose:
+            print( f'{Fmt.RED}(send_cmd) ({sender}) {host}:{port} \'{ans}\' {Fmt.END}' )
+
+    return ans
+
+
+def read_state_from_disk(timeout=2):
+    """ reads the .state file, retrying in case it is being written
+        (dictionary)
+    """
+    period = 0.25
+    tries  = int(timeout / period)
+    while tries:
+        try:
+            with open(STATE_PATH, 'r') as f:
+                return json_loads( f.read() )
+        except:
+            tries -= 1
+            sleep(period)
+
+    print( f'{Fmt.RED}(client) Cannot read `{STATE_PATH}`{Fmt.END}' )
+    return {}
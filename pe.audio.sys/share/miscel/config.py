@@ -14,6 +14,8 @@
         EQ_CURVES       The set of curves to be used by the
                         EQ stage in Brutefir for tone and
                         loudness contour compensation
+                        (read only, memory mapped from a cache,
+                        loaded on first access)
 
         xxx_FOLDER      Common usage folder paths
 
@@ -21,10 +23,11 @@
 
 """
 import  yaml
-from    numpy import loadtxt as np_loadtxt
+from    json  import loads as json_loads, dumps as json_dumps
 import  os
 import  sys
 from    getpass import getuser
+import  timeline
 
 USER                = getuser()
 UHOME               = os.path.expanduser("~")
@@ -34,7 +37,7 @@ VALID_SAMPLE_RATES  = [44100, 48000, 88200, 96000, 192000]
 
 CONFIG              = {}
 LOUDSPEAKER         = ''
-EQ_CURVES           = {}
+# EQ_CURVES         is loaded on first access, see __getattr__()
 LSPK_FOLDER         = ''
 BFCFG_PATH          = ''
 
@@ -43,13 +46,17 @@ STATE_PATH          = f'{MAINFOLDER}/.state'
 TONE_MEMO_PATH      = f'{MAINFOLDER}/.tone_memo'            # a tone_defeat helper
 LOG_FOLDER          = f'{MAINFOLDER}/log'
 EQ_FOLDER           = f'{MAINFOLDER}/share/eq'
+EQ_CACHE_FOLDER     = f'{MAINFOLDER}/.eq_curves_cache'      # binary EQ_CURVES
 
 CAMILLA_CFG_PATH    = f'{MAINFOLDER}/config/camilladsp.yml'
+SCENES_PATH         = f'{MAINFOLDER}/config/scenes.json'     # audio scenes
 
 MACROS_FOLDER       = f'{MAINFOLDER}/macros'
 LDCTRL_PATH         = f'{MAINFOLDER}/.loudness_control'
 LDMON_PATH          = f'{MAINFOLDER}/.loudness_monitor'
 AUX_INFO_PATH       = f'{MAINFOLDER}/.aux_info'
+PROC_REGISTRY_PATH  = f'{MAINFOLDER}/.process_registry'     # spawned helpers
+ZITA_LINK_PATH      = f'{MAINFOLDER}/.zita_link_ports'      # multiroom links
 AMP_STATE_PATH      = f'{UHOME}/.amplifier'
 
 PLAYER_META_PATH    = f'{MAINFOLDER}/.player_metadata'
@@ -74,64 +81,147 @@ CDDA_META_TEMPLATE    = { 'discid': '', 'artist': '', 'album': '',
                         }
 
 
-def _init():
-    """ Autoexec on loading this module
+def _eq_cache_key(sources):
+    """ The cache is valid for the given source .dat files (name, mtime, size)
+        and refSPL, as the loudness curves file depends on it.
     """
+    files = {}
+    for cname, fname in sources.items():
+        st = os.stat( f'{EQ_FOLDER}/{fname}' )
+        files[cname] = [fname, st.st_mtime_ns, st.st_size]
+    return {'refSPL': CONFIG["refSPL"], 'files': files}
 
-    global CONFIG, LOUDSPEAKER, EQ_CURVES, LSPK_FOLDER, BFCFG_PATH
 
+def _load_eq_cache(key):
+    """ Memory mapped loading of the cached .npy files, so that
+        processes share the same pages instead of private copies.
+        returns: a dict of curves, empty if no valid cache
+    """
+    try:
+        from numpy import load as np_load
+        with open(f'{EQ_CACHE_FOLDER}/meta.json', 'r') as f:
+            if json_loads( f.read() ) != key:
+                return {}
+        return { cname: np_load( f'{EQ_CACHE_FOLDER}/{cname}.npy', mmap_mode='r' )
+                 for cname in key["files"] }
+    except:
+        return {}
 
-    def find_eq_curves():
-        """ Scans share/eq/ and try to collect the whole set of EQ curves
-            needed for the EQ stage in Brutefir (tone and loudness countour)
-            (void)
-        """
-        eq_files = os.listdir(EQ_FOLDER)
 
-        # file names ( 2x loud + 4x tones + freq = total 7 curves)
-        fnames = (  'loudness_mag.dat', 'bass_mag.dat', 'treble_mag.dat',
-                    'loudness_pha.dat', 'bass_pha.dat', 'treble_pha.dat',
-                    'freq.dat' )
+def _save_eq_cache(key, curves):
+    """ Files are atomically replaced, the meta file is the last one
+    """
+    try:
+        from numpy import save as np_save
+        os.makedirs(EQ_CACHE_FOLDER, exist_ok=True)
+        tmp = f'{EQ_CACHE_FOLDER}/tmp_{os.getpid()}'
+        for cname, curve in curves.items():
+            with open(tmp, 'wb') as f:
+                np_save(f, curve)
+            os.replace(tmp, f'{EQ_CACHE_FOLDER}/{cname}.npy')
+        with open(tmp, 'w') as f:
+            f.write( json_dumps(key) )
+        os.replace(tmp, f'{EQ_CACHE_FOLDER}/meta.json')
+    except Exception as e:
+        print(f'(config) cannot save the EQ curves cache: {str(e)}')
+
+
+def _find_eq_curves():
+    """ Scans share/eq/ and try to collect the whole set of EQ curves
+        needed for the EQ stage in Brutefir (tone and loudness countour)
+        (dict of curves, empty if not found)
+    """
+    eq_files = os.listdir(EQ_FOLDER)
 
-        # map dict to get the curve name from the file name
-        cnames = {  'loudness_mag.dat'  : 'loud_mag',
-                    'bass_mag.dat'      : 'bass_mag',
-                    'treble_mag.dat'    : 'treb_mag',
-                    'loudness_pha.dat'  : 'loud_pha',
-                    'bass_pha.dat'      : 'bass_pha',
-                    'treble_pha.dat'    : 'treb_pha',
-                    'freq.dat'          : 'freqs'     }
+    # file names ( 2x loud + 4x tones + freq = total 7 curves)
+    fnames = (  'loudness_mag.dat', 'bass_mag.dat', 'treble_mag.dat',
+                'loudness_pha.dat', 'bass_pha.dat', 'treble_pha.dat',
+                'freq.dat' )
 
-        pendings = len(fnames)  # 7 curves
-        for fname in fnames:
+    # map dict to get the curve name from the file name
+    cnames = {  'loudness_mag.dat'  : 'loud_mag',
+                'bass_mag.dat'      : 'bass_mag',
+                'treble_mag.dat'    : 'treb_mag',
+                'loudness_pha.dat'  : 'loud_pha',
+                'bass_pha.dat'      : 'bass_pha',
+                'treble_pha.dat'    : 'treb_pha',
+                'freq.dat'          : 'freqs'     }
 
-            # Only one file named as <fname> must be found
+    # the source file for each curve name
+    sources  = {}
 
-            if 'loudness' in fname:
-                prefixedfname = f'ref_{CONFIG["refSPL"]}_{fname}'
-                files = [ x for x in eq_files if prefixedfname in x]
-            else:
-                files = [ x for x in eq_files if fname in x]
+    pendings = len(fnames)  # 7 curves
+    for fname in fnames:
 
-            if files:
+        # Only one file named as <fname> must be found
 
-                if len (files) == 1:
-                    EQ_CURVES[ cnames[fname] ] = \
-                             np_loadtxt( f'{EQ_FOLDER}/{files[0]}' )
-                    pendings -= 1
-                else:
-                    print(f'(config) too much \'...{fname}\' '
-                           'files under share/eq/')
-            else:
-                print(f'(config) ERROR finding a \'...{fname}\' '
-                       'file under share/eq/')
+        if 'loudness' in fname:
+            prefixedfname = f'ref_{CONFIG["refSPL"]}_{fname}'
+            files = [ x for x in eq_files if prefixedfname in x]
+        else:
+            files = [ x for x in eq_files if fname in x]
+
+        if files:
 
-        #if not pendings:
-        if pendings == 0:
-            return EQ_CURVES
+            if len (files) == 1:
+                sources[ cnames[fname] ] = files[0]
+                pendings -= 1
+            else:
+                print(f'(config) too much \'...{fname}\' '
+                       'files under share/eq/')
         else:
-            return {}
+            print(f'(config) ERROR finding a \'...{fname}\' '
+                   'file under share/eq/')
+
+    #if not pendings:
+    if pendings != 0:
+        return {}
+
+    # Parsing the text .dat files is slow, so they are parsed
+    # only when changed, then cached as binary .npy files
+    key    = _eq_cache_key(sources)
+    curves = _load_eq_cache(key)
+
+    if not curves:
+        from numpy import loadtxt as np_loadtxt
+        print(f'(config) parsing EQ curves under share/eq/ and caching them')
+        curves = { cname: np_loadtxt( f'{EQ_FOLDER}/{fname}' )
+                   for cname, fname in sources.items() }
+        _save_eq_cache(key, curves)
+        # Using the memory mapped ones as the other processes will do
+        curves = _load_eq_cache(key) or curves
+
+    return curves
+
 
+def _load_eq_curves():
+
+    global EQ_CURVES
+
+    curves = _find_eq_curves()
+    if not curves:
+        print( '(config) ERROR loading EQ_CURVES from share/eq/' )
+        sys.exit()
+
+    EQ_CURVES = curves
+    return EQ_CURVES
+
+
+def __getattr__(name):
+    """ EQ_CURVES is loaded on first access, so that importing
+        this module is cheap for the modules that do not need it.
+    """
+    if name == 'EQ_CURVES':
+        with timeline.phase('config EQ_CURVES'):
+            return _load_eq_curves()
+    raise AttributeError(f"module 'config' has no attribute '{name}'")
+
+
+def _init():
+    """ Autoexec on loading this module
+    """
+
+    global CONFIG, LOUDSPEAKER, LSPK_FOLDER, BFCFG_PATH
 
     try:
         with open(f'{MAINFOLDER}/config/config.yml', 'r') as f:
@@ -145,11 +235,6 @@ def _init():
     LSPK_FOLDER         = f'{MAINFOLDER}/loudspeakers/{LOUDSPEAKER}/{FS}'
     BFCFG_PATH          = f'{LSPK_FOLDER}/brutefir_config'
 
-    EQ_CURVES = find_eq_curves()
-    if not EQ_CURVES:
-        print( '(config) ERROR loading EQ_CURVES from share/eq/' )
-        sys.exit()
-
     # cd-rom device
     if not 'cdrom_device' in CONFIG or not CONFIG["cdrom_device"]:
         CONFIG["cdrom_device"] = '/dev/cdrom'
@@ -158,6 +243,12 @@ def _init():
     if not 'use_compressor' in CONFIG:
         CONFIG['use_compressor'] = False
 
+    # EQ and DRC graphs are drawn by the web page itself,
+    # otherwise will be rendered as PNG files on the server side.
+    if not 'client_graphs' in CONFIG["web_config"]:
+        CONFIG["web_config"]["client_graphs"] = True
+
 
 # AUTOEXEC
-_init()
+with timeline.phase('config._init'):
+    _init()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+""" Command registries for the service modules (preamp, players, aux)
+
+    A registry is a dict built once when importing the service module:
+
+        { 'command': { 'func':      callable,
+                       'arg':       an argument schema or None,
+                       'readonly':  True | False,
+                       'log':       True | False,
+                       'queries':   first argument words making a read only
+                                    query of a changing command (optional)
+                       ...          other module specific flags
+                     },
+          ...
+        }
+
+    Argument schemas check the first word of the argument string,
+    the whole string is passed to the function:
+
+        ('float', min, max)     a number, min or max can be None
+        ('enum',  (w1, w2...))  one of the given words (case insensitive)
+        ('word',)               any non empty word
+
+    Read only commands do not need to save the state, and are not logged.
+"""
+
+
+def is_readonly(entry, arg=''):
+    """ A command is read only as a whole, or as per its first argument word
+    """
+    if entry["readonly"]:
+        return True
+    words = arg.split()
+    return bool(words) and words[0].lower() in entry.get('queries', ())
+
+
+def command(func, arg=None, readonly=False, log=None, **flags):
+    """ returns a registry entry
+    """
+    entry = { 'func':       func,
+              'arg':        arg,
+              'readonly':   readonly,
+              'log':        (not readonly) if log is None else log }
+    entry.update(flags)
+    return entry
+
+
+def check_arg(schema, arg, relative=False):
+    """ Validates the first word of the argument string against the schema.
+        Range limits do not apply to relative values.
+
+        returns: '' if valid, otherwise a message explaining the error
+    """
+    if not schema:
+        return ''
+
+    kind  = schema[0]
+    word  = arg.split()[0] if arg.split() else ''
+
+    if not word:
+        return 'missing argument'
+
+    if kind == 'float':
+
+        try:
+            value = float(word)
+        except:
+            return f'bad value \'{word}\', a number is expected'
+
+        if relative:
+            return ''
+
+        vmin, vmax = (list(schema[1:]) + [None, None])[:2]
+
+        if vmin is not None and value < vmin:
+            return f'value {word} out of range, min is {vmin}'
+        if vmax is not None and value > vmax:
+            return f'value {word} out of range, max is {vmax}'
+
+    elif kind == 'enum':
+
+        if word.lower() not in schema[1]:
+            return f'bad option \'{word}\', expected: {" | ".join(schema[1])}'
+
+    return ''
+
+
+def must_log(registry, cmd, arg=''):
+    """ Unknown commands are logged, as they may be a client issue
+    """
+    entry = registry.get( cmd.lower() )
+    if not entry:
+        return True
+    if is_readonly(entry, arg or ''):
+        return False
+    return entry["log"]
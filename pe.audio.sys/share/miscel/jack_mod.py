@@ -5,24 +5,48 @@
 # 'pe.audio.sys', a PC based personal audio system.
 
 """ A JACK wrapper
+
+    The JACK client is opened on first use, so that importing
+    this module does not create any JACK client.
 """
 
 from time import sleep, time
 import jack
+import threading
 from subprocess import check_output
 
-JCLI = jack.Client(name=str(int(time())), no_start_server=True)
-JCLI.activate()
+_JCLI       = None
+_JCLI_LOCK  = threading.Lock()
+
+
+def get_client():
+    """ The module JACK client, it is opened and activated on first use
+    """
+    global _JCLI
+    with _JCLI_LOCK:
+        if _JCLI is None:
+            jcli = jack.Client(name=str(int(time())), no_start_server=True)
+            jcli.activate()
+            _JCLI = jcli
+    return _JCLI
+
+
+def __getattr__(name):
+    """ 'jack_mod.JCLI' is still available, as a lazy attribute
+    """
+    if name == 'JCLI':
+        return get_client()
+    raise AttributeError(f"module 'jack_mod' has no attribute '{name}'")
 
 
 def get_samplerate():
     """ wrap function """
-    return JCLI.samplerate
+    return get_client().samplerate
 
 
 def get_bufsize():
     """ wrap function """
-    return JCLI.blocksize
+    return get_client().blocksize
 
 
 def get_device():
@@ -49,7 +73,7 @@ def get_device():
 
 def get_all_connections(pname):
     """ wrap function """
-    ports = JCLI.get_all_connections(pname)
+    ports = get_client().get_all_connections(pname)
     return ports
 
 
@@ -58,7 +82,7 @@ def get_ports(pattern='',  is_audio=True, is_midi=False,
                                 is_physical=False, can_monitor=False,
                                 is_terminal=False ):
     """ wrap function """
-    ports = JCLI.get_ports(pattern, is_audio, is_midi,
+    ports = get_client().get_ports(pattern, is_audio, is_midi,
                                     is_input, is_output,
                                     is_physical, can_monitor,
                                     is_terminal )
@@ -75,9 +99,9 @@ def connect(p1, p2, mode='connect', verbose=True):
 
         try:
             if 'dis' in mode or 'off' in mode:
-                JCLI.disconnect(p1, p2)
+                get_client().disconnect(p1, p2)
             else:
-                JCLI.connect(p1, p2)
+                get_client().connect(p1, p2)
             result = 'done'
             break
 
@@ -98,18 +122,18 @@ def connect_bypattern( cap_pattern, pbk_pattern, mode='connect' ):
     """
 
     # Try to get ports by a port name pattern
-    cap_ports = JCLI.get_ports( cap_pattern, is_output=True )
-    pbk_ports = JCLI.get_ports( pbk_pattern, is_input=True )
+    cap_ports = get_client().get_ports( cap_pattern, is_output=True )
+    pbk_ports = get_client().get_ports( pbk_pattern, is_input=True )
 
     # If not found, it can be an ALIAS pattern
     if not cap_ports:
-        for p in JCLI.get_ports( is_output=True ):
+        for p in get_client().get_ports( is_output=True ):
             # A port can have 2 alias
             for palias in p.aliases:
                 if cap_pattern in palias:
                     cap_ports.append(p)
     if not pbk_ports:
-        for p in JCLI.get_ports( is_input=True ):
+        for p in get_client().get_ports( is_input=True ):
             # A port can have 2 alias
             for palias in p.aliases:
                 if pbk_pattern in palias:
@@ -142,9 +166,9 @@ def connect_bypattern( cap_pattern, pbk_pattern, mode='connect' ):
 def clear_preamp():
     """ Force clearing ANY clients, no matter what input was selected
     """
-    preamp_ports = JCLI.get_ports('pre_in_loop', is_input=True)
+    preamp_ports = get_client().get_ports('pre_in_loop', is_input=True)
     for preamp_port in preamp_ports:
-        for client in JCLI.get_all_connections(preamp_port):
+        for client in get_client().get_all_connections(preamp_port):
             connect( client, preamp_port, mode='off' )
 
 
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    An in-process journal of the commands processed by a service.
+
+    Records are dicts:
+
+        { 'seq':        a sequence number,
+          'ts':         seconds since the epoch,
+          'client':     the client IP address, if known,
+          'prefix':     preamp | player | aux,
+          'cmd':        the command,
+          'args':       the argument string,
+          'result':     the command result (a string),
+          'duration':   the processing time in seconds }
+
+    .record(...) only appends the record to a bounded ring and queues it,
+    then a background thread writes the queued records as JSON lines to
+    a rotating file, and delivers them to the subscribers:
+
+        .subscribe( func )      func(record) will be called for each record,
+                                from the journal thread, so it must not block
+                                for long.
+
+        .last( n )              the last n records from the ring
+"""
+
+import  os
+import  json
+import  queue
+import  threading
+from    collections import deque
+from    time        import time
+
+
+class Journal(object):
+
+    def __init__(self, path, ring_size=1000, max_bytes=1e6, backups=3):
+
+        self.path           = path
+        self.max_bytes      = max_bytes
+        self.backups        = backups
+
+        self.ring           = deque(maxlen=ring_size)
+        self.pending        = queue.SimpleQueue()
+        self.subscribers    = []
+        self.seq            = 0
+        self.lock           = threading.Lock()
+
+        self.thread = threading.Thread( name='journal', target=self._run,
+                                        daemon=True )
+        self.thread.start()
+
+
+    def record(self, prefix, cmd, args, result, duration=0.0, client=''):
+
+        with self.lock:
+            self.seq += 1
+            rec = { 'seq':      self.seq,
+                    'ts':       round(time(), 3),
+                    'client':   client,
+                    'prefix':   prefix,
+                    'cmd':      cmd,
+                    'args':     args,
+                    'result':   result,
+                    'duration': round(duration, 4) }
+            self.ring.append(rec)
+
+        self.pending.put(rec)
+        return rec
+
+
+    def last(self, n=10):
+        with self.lock:
+            return list(self.ring)[-n:]
+
+
+    def subscribe(self, func):
+        if func not in self.subscribers:
+            self.subscribers.append(func)
+
+
+    def unsubscribe(self, func):
+        if func in self.subscribers:
+            self.subscribers.remove(func)
+
+
+    def _rotate(self):
+        """ file.log --> file.log.1 --> file.log.2 ...
+        """
+        for n in range(self.backups - 1, 0, -1):
+            src = f'{self.path}.{n}'
+            if os.path.exists(src):
+                os.replace(src, f'{self.path}.{n + 1}')
+        os.replace(self.path, f'{self.path}.1')
+
+
+    def _write(self, recs):
+        try:
+            if os.path.exists(self.path) and \
+               os.path.getsize(self.path) > self.max_bytes:
+                self._rotate()
+            with open(self.path, 'a') as f:
+                for rec in recs:
+                    f.write( json.dumps(rec) + '\n' )
+        except Exception as e:
+            print( f'(journal) cannot write \'{self.path}\': {str(e)}' )
+
+
+    def _run(self):
+
+        while True:
+
+            # Waiting for a record, then batching any others already queued
+            recs = [ self.pending.get() ]
+            while True:
+                try:
+                    recs.append( self.pending.get_nowait() )
+                except queue.Empty:
+                    break
+
+            self._write(recs)
+
+            for rec in recs:
+                for func in list(self.subscribers):
+                    try:
+                        func(rec)
+                    except Exception as e:
+                        print( f'(journal) subscriber error: {str(e)}' )
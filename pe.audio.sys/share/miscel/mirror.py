@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    Mirrors the state and metadata of a remote pe.audio.sys system,
+    e.g. the sender of a 'remoteXXXX' source in a multiroom receiver.
+
+    A single persistent session (see share/miscel/server.py) subscribes
+    once to the remote updates, so the last state and metadata are kept
+    here without polling. Commands to the remote system are sent through
+    the same session.
+
+        m = RemoteMirror(host, port, on_meta=func)
+        m.start()
+
+        m.connected     the session is up
+        m.state         the last remote state (a dict)
+        m.meta          the last remote player metadata (a dict)
+        m.ask(cmd)      sends a command, returns its result
+
+    If the session is lost, it is opened again in background.
+"""
+
+import  socket
+import  json
+import  threading
+
+
+# Seconds to wait for the remote system to connect
+CONNECT_TIMEOUT = 2
+# Seconds between reconnection tries (doubling up to the max)
+RETRY_MIN       = 1
+RETRY_MAX       = 30
+
+
+class RemoteMirror(object):
+
+    def __init__(self, host, port, on_meta=None, on_state=None):
+
+        self.host       = host
+        self.port       = int(port)
+        self.on_meta    = on_meta
+        self.on_state   = on_state
+
+        self.connected  = False
+        self.state      = {}
+        self.meta       = {}
+
+        self.sock       = None
+        self.stopped    = threading.Event()
+        self.thread     = None
+
+        # Results are matched with the asked commands by their order
+        self.cond       = threading.Condition()
+        self.ask_lock   = threading.Lock()
+        self.sent       = 0
+        self.received   = 0
+        self.results    = {}
+
+
+    def _update(self, update):
+
+        if 'state' in update:
+            self.state = update['state']
+            if self.on_state:
+                self.on_state(self.state)
+
+        if 'meta' in update:
+            self.meta = update['meta']
+            if self.on_meta:
+                self.on_meta(self.meta)
+
+
+    def _session(self):
+        """ Connects, subscribes, then reads lines until the session is lost
+        """
+        sock = socket.create_connection( (self.host, self.port),
+                                         timeout=CONNECT_TIMEOUT )
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.sendall( b'session\n' )
+        f = sock.makefile('rb')
+
+        if f.readline().strip() != b'"ok"':
+            sock.close()
+            raise ConnectionError('session not available')
+
+        sock.settimeout(None)
+
+        with self.cond:
+            self.sock       = sock
+            self.sent       = self.received = 0
+            self.results    = {}
+            self.connected  = True
+
+        # The 'subscribe' result is not waited for
+        self._send('subscribe')
+        print( f'(mirror) mirroring {self.host}:{self.port}' )
+
+        for line in f:
+
+            obj = json.loads(line)
+
+            # Results are JSON strings, pushed updates are JSON objects
+            if type(obj) == str:
+                with self.cond:
+                    self.received += 1
+                    self.results[self.received] = obj
+                    self.cond.notify_all()
+            else:
+                self._update(obj)
+
+
+    def _send(self, cmd):
+        """ returns the order number of the expected result
+        """
+        with self.cond:
+            self.sock.sendall( f'{cmd}\n'.encode() )
+            self.sent += 1
+            return self.sent
+
+
+    def ask(self, cmd, timeout=1):
+        """ Sends a command through the session, returns its result,
+            or None if not connected.
+        """
+        if not self.connected:
+            return None
+
+        with self.ask_lock:
+
+            try:
+                n = self._send(cmd)
+            except Exception as e:
+                return str(e)
+
+            with self.cond:
+                self.cond.wait_for( lambda: n in self.results or not self.connected,
+                                    timeout )
+                # older results were not waited for
+                for k in [ x for x in self.results if x <= n ]:
+                    result = self.results.pop(k)
+                    if k == n:
+                        return result
+
+        return f'no answer from {self.host}:{self.port}'
+
+
+    def _run(self):
+
+        delay = RETRY_MIN
+
+        while not self.stopped.is_set():
+
+            try:
+                self._session()
+                delay = RETRY_MIN
+            except Exception as e:
+                if not self.stopped.is_set():
+                    print( f'(mirror) {self.host}:{self.port} {str(e)}' )
+
+            with self.cond:
+                self.connected = False
+                self.cond.notify_all()
+                if self.sock:
+                    self.sock.close()
+                    self.sock = None
+
+            self.stopped.wait(delay)
+            delay = min( delay * 2, RETRY_MAX )
+
+
+    def start(self):
+        if not self.thread:
+            self.thread = threading.Thread( name=f'mirror {self.host}',
+                                            target=self._run, daemon=True )
+            self.thread.start()
+
+
+    def stop(self):
+        self.stopped.set()
+        with self.cond:
+            if self.sock:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
@@ -15,15 +15,22 @@ from    datetime import datetime
 import  subprocess as sp
 import  configparser
 import  os
+import  fcntl
 import  threading
-import  psutil
 import  inspect
 import  shlex
-import  jack
+import  signal
 
 from    config      import  *
 from    fmt         import  Fmt
 from    sound_cards import  remove_cards_in_pulseaudio
+from    client      import  send_cmd
+import  proc_registry
+import  timeline
+
+# (i) psutil and jack are imported where needed, as they are slow
+#     to import and most clients of this module do not need them.
+#     Tools that only need send_cmd can use the slim 'client' module.
 
 
 # --- MPD auxiliary
@@ -305,7 +312,9 @@ def start_jack_stuff(config=CONFIG):
 
         # Emerging JACKLOOPS (external daemon)
         run_jloops()
-        if not check_jloops():
+        with timeline.phase('check_jloops'):
+            jloops_ok = check_jloops()
+        if not jloops_ok:
             warnings += ' JACKLOOPS FAILED.'
 
     if warnings:
@@ -345,6 +354,8 @@ def check_jloops(config=CONFIG):
     if not cfg_loops:
         return True
 
+    import jack
+
     # Waiting 5 s for all loops to be spawned
     tries = 25
     with jack.Client(name='tmp', no_start_server=True) as jc:
@@ -715,26 +726,101 @@ def get_remote_zita_params(rem_src_name):
 
     # The ZITA's UDP PORT was assigned at the start.
     try:
-        with open(f'{MAINFOLDER}/.zita_link_ports', 'r') as f:
-            zports = json_loads( f.read() )
-            zport  = zports[rem_src_name]['udpport']
+        zport = read_zita_link_ports()[rem_src_name]['udpport']
     except Exception as e:
         print( f'(miscel.py) ERROR with .zita_link_ports: {str(e)}' )
 
     return raddr, cport, zport
 
 
-def remote_zita_restart(raddr, ctrl_port, zita_port):
+# Seconds to wait for a multiroom sender to answer (it needs
+# some time to run zita-j2n and connect its ports)
+ZITA_CTRL_TIMEOUT   = 5
+
+
+def read_zita_link_ports():
+    """ The multiroom links as assigned at the start:
+            { source_name: { 'addr':     sender IP,
+                             'ctrlport': sender control port,
+                             'udpport':  zita UDP port,
+                             'linked':   the sender has answered } }
+    """
+    try:
+        with open(ZITA_LINK_PATH, 'r') as f:
+            return json_loads( f.read() )
+    except:
+        return {}
+
+
+def _update_zita_link_ports(func):
+    """ Runs func(zports) under the file lock, then the file is replaced
+        atomically if func returns True.
+        (i) The lock is shared among processes (start.py, the services).
+    """
+    with open(f'{ZITA_LINK_PATH}.lock', 'w') as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        zports = read_zita_link_ports()
+        if func(zports):
+            tmp_path = f'{ZITA_LINK_PATH}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write( json_dumps(zports) )
+            os.replace(tmp_path, ZITA_LINK_PATH)
+
+
+def write_zita_link_ports(zports):
+
+    def replace(old):
+        old.clear()
+        old.update(zports)
+        return True
+
+    _update_zita_link_ports(replace)
+
+
+def mark_zita_link(raddr, linked):
+    """ Flags the links from the sender at <raddr>, the not linked ones
+        will be retried in background (see zita_link.py)
+    """
+    def mark(zports):
+        changed = False
+        for item in zports.values():
+            if item['addr'] == raddr and item.get('linked') != linked:
+                item['linked'] = linked
+                changed = True
+        return changed
+
+    _update_zita_link_ports(mark)
+
+
+def remote_zita_restart(raddr, ctrl_port, zita_port, timeout=ZITA_CTRL_TIMEOUT):
     """
         Restarting zita-j2n on the multiroom sender's end,
         pointing to our ip.
 
-        (i) The sender will run zita_j2n only when a receiver request it
+        (i) The sender will run zita_j2n only when a receiver request it.
+            An offline sender will not stall the caller longer than
+            <timeout>, its link will be retried in background.
     """
     zargs     = json_dumps( (get_my_ip(), zita_port, 'start') )
     remotecmd = f'aux zita_j2n {zargs}'
-    result = send_cmd(remotecmd, host=raddr, port=ctrl_port)
+    result = send_cmd(remotecmd, host=raddr, port=ctrl_port, timeout=timeout)
     print(f'(miscel.py) SENDING TO REMOTE: {remotecmd}')
+    mark_zita_link(raddr, result == 'done')
+    return result
+
+
+def remote_zita_check(raddr, ctrl_port, zita_port, timeout=ZITA_CTRL_TIMEOUT):
+    """ Asks the multiroom sender if it still runs zita-j2n pointing to us,
+        otherwise the link is flagged as not linked, to be retried.
+
+        (i) A sender not knowing 'check' will restart its zita-j2n,
+            so that the link is established again anyway.
+    """
+    zargs     = json_dumps( (get_my_ip(), zita_port, 'check') )
+    remotecmd = f'aux zita_j2n {zargs}'
+    result = send_cmd(remotecmd, host=raddr, port=ctrl_port, timeout=timeout)
+    if result != 'done':
+        mark_zita_link(raddr, False)
     return result
 
 
@@ -755,7 +841,8 @@ def local_zita_restart(raddr, udp_port, buff_size):
 
         # Ignore if zita-njbridge is not available
         try:
-            sp.Popen( zitacmd.split(), stdout=zitalog, stderr=zitalog )
+            proc_registry.spawn( zitajname, zitacmd.split(),
+                                 stdout=zitalog, stderr=zitalog )
             wait4ports(zitajname, 3)
             sp.Popen( f'jack_alias {zitajname}:out_1 {raddr}:out_1'.split() )
             sp.Popen( f'jack_alias {zitajname}:out_2 {raddr}:out_2'.split() )
@@ -783,58 +870,6 @@ def wait4ports( pattern, timeout=10 ):
         return False
 
 
-def send_cmd( cmd, sender='', verbose=False, timeout=60,
-              host='127.0.0.1', port=CONFIG['peaudiosys_port'] ):
-    """
-        Sends a command to a pe.audio.sys server.
-        Returns a string about the execution response or an error if so.
-    """
-    # (i) socket timeout 60 because Brutefir can need some time
-    #     in slow machines after powersave shot it down.
-
-    if not sender:
-        sender = 'share.miscel'
-
-    # Default answer: "no answer from ...."
-    ans = f'no answer from {host}:{port}'
-
-    # (i) We prefer high-level socket function 'create_connection()',
-    #     rather than low level 'settimeout() + connect()'
-    try:
-
-        with socket.create_connection( (host, port), timeout=timeout ) as s:
-
-            s.send( cmd.encode() )
-
-            if verbose:
-                print( f'{Fmt.BLUE}(send_cmd) ({sender}) Tx: \'{cmd}\'{Fmt.END}' )
-
-            ans = ''
-
-            while True:
-
-                tmp = s.recv(1024)
-
-                if not tmp:
-                    break
-
-                ans += tmp.decode()
-
-            if verbose:
-                print( f'{Fmt.BLUE}(send_cmd) ({sender}) Rx: \'{ans}\'{Fmt.END}' )
-
-            s.close()
-
-    except Exception as e:
-
-        ans = str(e)
-
-        if verbose:
-            print( f'{Fmt.RED}(send_cmd) ({sender}) {host}:{port} \'{ans}\' {Fmt.END}' )
-
-    return ans
-
-
 def check_Mplayer_config_file(profile='istreams'):
     """ Checks the Mplayer config file
         (result: string)
@@ -878,6 +913,7 @@ def detect_spotify_client():
     """ Detection of the Spotify Client in use.
         return: 'desktop', 'librespot' or ''
     """
+    import psutil
 
     # Iterate through all running processes
     for proc in psutil.process_iter(['cmdline']):
@@ -962,6 +998,12 @@ def read_json_from_file(fpath, timeout=2):
 def get_pid_cmdline(process_name=''):
     """ gets all the pid and cmdline of the given process name
     """
+    # Helpers spawned by us are found in the process registry
+    found = proc_registry.find(exe=process_name)
+    if found is not None:
+        return [ {'pid': e["pid"], 'cmdline': e["cmdline"].split()} for e in found ]
+
+    import psutil
 
     pids = []
 
@@ -976,6 +1018,14 @@ def get_pid_cmdline(process_name=''):
 
 
 def process_is_running(process_name):
+    # Helpers spawned by us are checked in O(1) from the process registry,
+    # even if dead, so the process table is only scanned for other ones.
+    found = proc_registry.lookup(process_name)
+    if found is not None:
+        return found
+
+    import psutil
+
     # Iterate through all running processes
     for proc in psutil.process_iter(['cmdline']):
         try:
@@ -998,6 +1048,8 @@ def kill_bill(pid=0):
     if not pid:
         return 'a pid is needed'
 
+    import psutil
+
     try:
         process = psutil.Process(pid)
         pid_cmdline = os.path.basename( process.cmdline()[1] )
@@ -1013,6 +1065,19 @@ def kill_bill(pid=0):
 
     errors = ''
 
+    # Previous instances spawned by us are found in the process registry
+    found = proc_registry.find(pid_cmdline)
+    if found is not None:
+        for entry in found:
+            # Avoids harakiri
+            if entry["pid"] != pid:
+                print(f"Killing {entry['cmdline']} PID: {entry['pid']}")
+                try:
+                    os.kill(entry["pid"], signal.SIGKILL)
+                except Exception as e:
+                    errors += f'{str(e)}\n'
+        return errors
+
     for proc in psutil.process_iter():
 
         try:
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    A Brutefir peaks history store, based on SQLite.
+
+    The peak_monitor plugin writes one row per peaking output and
+    aggregation window, the server queries it for the web page.
+
+        table peaks:    ts (epoch seconds), output, dB, events
+
+    Rows are indexed by timestamp, so range queries do not depend on
+    the store age. Old rows are purged as per the 'peaks_retention_days'
+    config.yml setting (default 30 days).
+
+    Command line usage, prints peaks records and a summary:
+
+        peaks_store.py  [ today | hour | day | week | all | <seconds> ]
+"""
+
+import  sqlite3
+import  sys
+import  os
+from    time    import time, localtime, mktime, strftime
+
+UHOME = os.path.expanduser("~")
+sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
+
+from    config  import CONFIG, LOG_FOLDER
+
+
+DB_PATH         = f'{LOG_FOLDER}/brutefir_peaks.sqlite'
+
+RETENTION_DAYS  = CONFIG.get('peaks_retention_days', 30)
+
+RANGES          = { 'hour': 3600, 'day': 86400, 'week': 7 * 86400 }
+
+
+def connect():
+    """ returns an sqlite3 connection, the schema is created if needed
+    """
+    con = sqlite3.connect(DB_PATH, timeout=2)
+
+    # WAL journal allows the server to read while the plugin writes
+    con.execute('PRAGMA journal_mode=WAL')
+
+    con.execute('''CREATE TABLE IF NOT EXISTS peaks (
+                        ts      REAL    NOT NULL,
+                        output  TEXT    NOT NULL,
+                        dB      REAL    NOT NULL,
+                        events  INTEGER NOT NULL DEFAULT 1 )''')
+    con.execute('CREATE INDEX IF NOT EXISTS peaks_ts ON peaks (ts)')
+    con.execute('CREATE INDEX IF NOT EXISTS peaks_out_ts ON peaks (output, ts)')
+
+    return con
+
+
+def range_to_since(rng='today'):
+    """ Translates a range word, or a number of seconds, into
+        an epoch timestamp to query since.
+    """
+    if rng == 'today':
+        t = localtime()
+        return mktime( (t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1) )
+
+    elif rng == 'all':
+        return 0
+
+    elif rng in RANGES:
+        return time() - RANGES[rng]
+
+    else:
+        return time() - float(rng)
+
+
+def add_window(ts, events, peaks):
+    """ Stores a peak monitor aggregation window
+
+        peaks:  dict {output_name: dB, ...}
+    """
+    if not peaks:
+        return
+
+    con = connect()
+    with con:
+        con.executemany( 'INSERT INTO peaks (ts, output, dB, events) VALUES (?, ?, ?, ?)',
+                         [ (ts, out, dB, events) for out, dB in peaks.items() ] )
+    con.close()
+
+
+def query(since=0, until=None, output=None):
+    """ returns a list of rows, one per window, example:
+
+            [ {'ts': 1726829260.1, 'events': 3, 'peaks': {'lo.L': 5.3, 'hi.L': 10.1}},
+              ... ]
+    """
+    if until is None:
+        until = time()
+
+    sql  = 'SELECT ts, output, dB, events FROM peaks WHERE ts >= ? AND ts <= ?'
+    args = [since, until]
+
+    if output:
+        sql  += ' AND output = ?'
+        args.append(output)
+
+    sql += ' ORDER BY ts'
+
+    con = connect()
+    cur = con.execute(sql, args)
+
+    rows = []
+    for ts, out, dB, events in cur:
+        if not rows or rows[-1]["ts"] != ts:
+            rows.append( {'ts': ts, 'events': events, 'peaks': {}} )
+        rows[-1]["peaks"][out] = dB
+
+    con.close()
+
+    return rows
+
+
+def summary(since=0, until=None):
+    """ Per output statistics, example:
+
+            { 'hi.L': {'windows': 12, 'events': 40, 'max': 10.1,
+                       'avg': 7.2,   'last': 1726829260.1},
+              ... }
+    """
+    if until is None:
+        until = time()
+
+    con = connect()
+    cur = con.execute( '''SELECT output, COUNT(*), SUM(events), MAX(dB), AVG(dB), MAX(ts)
+                          FROM peaks WHERE ts >= ? AND ts <= ?
+                          GROUP BY output ORDER BY output''', (since, until) )
+
+    result = {}
+    for out, windows, events, dBmax, dBavg, last in cur:
+        result[out] = { 'windows':  windows,
+                        'events':   events,
+                        'max':      dBmax,
+                        'avg':      round(dBavg, 1),
+                        'last':     last }
+
+    con.close()
+
+    return result
+
+
+def purge(days=RETENTION_DAYS):
+    """ Removes rows older than the retention limit
+    """
+    con = connect()
+    with con:
+        cur = con.execute( 'DELETE FROM peaks WHERE ts < ?',
+                           (time() - days * 86400,) )
+    con.close()
+    return cur.rowcount
+
+
+if __name__ == '__main__':
+
+    rng = 'today'
+    if sys.argv[1:]:
+        rng = sys.argv[1]
+
+    if rng in ('-h', '--help'):
+        print(__doc__)
+        sys.exit()
+
+    since = range_to_since(rng)
+
+    for row in query(since):
+        pstr = '  '.join( [ f'{k}: {v:4}' for k, v in row["peaks"].items() ] )
+        print( f'{strftime("%c", localtime(row["ts"]))}  ({row["events"]:3})  {pstr}' )
+
+    print()
+    for out, s in summary(since).items():
+        print( f'{out:6} max: {s["max"]:4}  avg: {s["avg"]:4}  '
+               f'windows: {s["windows"]}  events: {s["events"]}' )
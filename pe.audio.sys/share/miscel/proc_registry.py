@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    A registry of the helper processes spawned by pe.audio.sys
+    (Brutefir, Mplayer, zita-njbridge, CamillaDSP, plugins ...)
+
+    Each entry keeps the process pid and its kernel start time,
+    so that checking if a helper is alive is just reading its
+    /proc/<pid>/stat, instead of scanning the whole process table.
+    The start time protects against a recycled pid.
+
+    The registry is shared among processes in a JSON file:
+
+        { 'brutefir': { 'pid': 1234, 'start': 56789,
+                        'cmdline': 'brutefir brutefir_config' },
+          ...
+        }
+
+    Writers take an exclusive lock, then the file is atomically
+    replaced, so readers do not need any lock.
+
+    Dead entries are kept until their name is registered again, so that
+    the registry still owns them: a dead helper is known as not running
+    without scanning the process table. Therefore the registered helpers
+    must be (re)started through by spawn().
+"""
+
+import  os
+import  fcntl
+import  subprocess as sp
+from    json import loads as json_loads, dumps as json_dumps
+
+from    config import PROC_REGISTRY_PATH
+
+
+# Readers reload the file only when it has been replaced
+_cache = { 'stamp': None, 'entries': {} }
+
+
+def _stamp():
+    try:
+        st = os.stat(PROC_REGISTRY_PATH)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except:
+        return None
+
+
+def _load():
+    stamp = _stamp()
+    if stamp != _cache["stamp"]:
+        try:
+            with open(PROC_REGISTRY_PATH, 'r') as f:
+                entries = json_loads( f.read() )
+        except:
+            entries = {}
+        _cache["stamp"], _cache["entries"] = stamp, entries
+    return _cache["entries"]
+
+
+def _update(func):
+    """ Runs func(entries) under the registry lock, then saves the entries
+    """
+    with open(f'{PROC_REGISTRY_PATH}.lock', 'w') as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        _cache["stamp"] = None
+        entries = dict( _load() )
+        func(entries)
+        tmp = f'{PROC_REGISTRY_PATH}.tmp'
+        with open(tmp, 'w') as f:
+            f.write( json_dumps(entries) )
+        os.replace(tmp, PROC_REGISTRY_PATH)
+
+
+def get_start_time(pid):
+    """ The process start time (clock ticks after boot), from /proc/<pid>/stat
+        returns None if the process does not exist or it is a zombie
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            stat = f.read()
+    except:
+        return None
+
+    # The command name field can have blanks, so lets split after it
+    fields = stat[ stat.rfind(')') + 2: ].split()
+    state, start = fields[0], fields[19]
+    if state in ('Z', 'X'):
+        return None
+    return int(start)
+
+
+def is_alive(entry):
+    """ O(1) check for a registry entry
+    """
+    if not entry:
+        return False
+    return get_start_time( entry["pid"] ) == entry["start"]
+
+
+def register(name, pid, cmdline=''):
+    """ Registers a helper process by a given name,
+        any previous entry with the same name is replaced
+    """
+    start = get_start_time(pid)
+    if start is None:
+        return
+
+    def add(entries):
+        entries[name] = {'pid': pid, 'start': start, 'cmdline': cmdline}
+
+    try:
+        _update(add)
+    except Exception as e:
+        print( f'(proc_registry) cannot register \'{name}\': {str(e)}' )
+
+
+def unregister(name):
+
+    def remove(entries):
+        entries.pop(name, None)
+
+    try:
+        _update(remove)
+    except Exception as e:
+        print( f'(proc_registry) cannot unregister \'{name}\': {str(e)}' )
+
+
+def spawn(name, args, **popen_kwargs):
+    """ A subprocess.Popen wrapper that registers the spawned process
+    """
+    p = sp.Popen(args, **popen_kwargs)
+    cmdline = args if type(args) == str else ' '.join(args)
+    register(name, p.pid, cmdline)
+    return p
+
+
+def find(pattern='', exe=''):
+    """ Looks for registered processes by name, or by a case-insensitive
+        pattern inside the command line, or by the executable name.
+
+        returns:    None     the registry does not own any matching helper,
+                             so the caller should fall back to a process
+                             table scan, because it could be run from outside.
+                    [entry, ...]    the alive matching helpers, if any
+    """
+    pattern = pattern.lower()
+    owned   = False
+    alive   = []
+
+    for name, entry in _load().items():
+
+        if exe:
+            args = entry["cmdline"].split()
+            match = name == exe or ( args and os.path.basename(args[0]) == exe )
+        else:
+            match = pattern == name.lower() or pattern in entry["cmdline"].lower()
+
+        if match:
+            owned = True
+            if is_alive(entry):
+                alive.append(entry)
+
+    return alive if owned else None
+
+
+def lookup(pattern):
+    """ returns:    True     a matching helper is alive
+                    False    the matching helpers are dead
+                    None     the registry does not own any matching helper
+    """
+    found = find(pattern)
+    if found is None:
+        return None
+    return bool(found)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    A system monitor sampler: CPU temperature, fans speed and wifi link.
+
+    A background thread reads the kernel files directly, at the
+    'sysmon_period' config.yml setting (default 5 s), then keeps the
+    last snapshot in memory, so readers do not do any I/O.
+
+        /proc/net/wireless
+        /sys/class/thermal/thermal_zone0/temp
+        /sys/class/hwmon/hwmon*/fan*_input
+
+    Snapshot example:
+
+        { 'wifi': {'iface': 'wlan0', 'Quality': '61/70', 'Signal-level': '-49'},
+          'temp': 51.2,
+          'fans': {'fan1': '1200', 'fan2': '', 'fan3': ''} }
+"""
+
+import  os
+import  threading
+from    glob    import glob
+from    time    import sleep
+
+
+WIRELESS_PATH   = '/proc/net/wireless'
+TEMP_PATH       = '/sys/class/thermal/thermal_zone0/temp'
+# The max link quality reported by most drivers (/proc does not tell it)
+WIFI_MAX_QUALITY = 70
+
+
+def read_file(path):
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+
+def get_wifi_ifaces():
+    """ Wireless interfaces have a 'wireless' folder under /sys/class/net
+    """
+    return sorted( [ x.split('/')[-2] for x in glob('/sys/class/net/*/wireless') ] )
+
+
+def get_wifi(iface):
+    """ Returns a dict, empty if the interface is not associated.
+
+        $ cat /proc/net/wireless
+        Inter-| sta-|   Quality        |   Discarded packets               | Missed | WE
+         face | tus | link level noise |  nwid  crypt   frag  retry   misc | beacon | 22
+         wlan0: 0000   61.  -49.  -256        0      0      0      0      0        0
+    """
+    d = {'iface': iface}
+
+    try:
+        for line in read_file(WIRELESS_PATH).split('\n')[2:]:
+            if line.strip().startswith(f'{iface}:'):
+                fields = line.split(':')[1].split()
+                link   = int( float(fields[1]) )
+                level  = int( float(fields[2]) )
+                if link:
+                    d['Quality']      = f'{link}/{WIFI_MAX_QUALITY}'
+                    d['Signal-level'] = str(level)
+    except:
+        pass
+
+    return d
+
+
+def get_temp():
+    """ The first thermal zone temperature, this works on Intel and ARM
+    """
+    try:
+        return round( int( read_file(TEMP_PATH) ) / 1000, 1 )
+    except:
+        return 0.0
+
+
+def get_fans_speed(get_zero_rpm=False):
+    fans = {'fan1':'', 'fan2':'', 'fan3':'', }
+    for path in sorted( glob('/sys/class/hwmon/hwmon*/fan[123]_input') ):
+        try:
+            fan = os.path.basename(path).split('_')[0]
+            x = read_file(path)
+            if (int(x) or get_zero_rpm) and not fans[fan]:
+                fans[fan] = x
+        except:
+            pass
+    return fans
+
+
+class SysmonSampler(object):
+    """ .start()        starts sampling in background
+        .snapshot       the last sample (a dict)
+    """
+
+    def __init__(self, period=5):
+        self.period   = period
+        self.ifaces   = get_wifi_ifaces()
+        self.snapshot = { 'wifi': {}, 'temp': 0.0, 'fans': get_fans_speed() }
+        self.thread   = None
+
+
+    def sample(self):
+        # a new dict is assigned, readers never see a half updated one
+        self.snapshot = { 'wifi': get_wifi(self.ifaces[0]) if self.ifaces else {},
+                          'temp': get_temp(),
+                          'fans': get_fans_speed() }
+        return self.snapshot
+
+
+    def _loop(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print( f'(sysmon) {str(e)}' )
+            sleep(self.period)
+
+
+    def start(self):
+        if not self.thread:
+            self.sample()
+            self.thread = threading.Thread( name='sysmon sampler',
+                                            target=self._loop, daemon=True )
+            self.thread.start()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    Startup timeline instrumentation.
+
+    start.py begins a new timeline, then the processes it spawns (the
+    server, plugins ...) inherit the PEAUDIOSYS_TIMELINE environment
+    variable, so their phases are recorded into the same timeline.
+    The server stops recording when it is first ready.
+
+    The variable holds a run id, which is also written in the run file
+    along with a deadline. Processes only record while their run id is
+    the current one and the deadline has not expired, so that long
+    lived plugins (and their children) stop recording when start.py
+    ends the timeline, or if start.py never ends it.
+
+    The timeline is a JSON lines file under the log folder, one record
+    per phase, times are seconds since the epoch:
+
+        {"proc": "start", "phase": "start_jack_stuff", "start": t1, "end": t2}
+
+    Instant events have start == end.
+
+    When start.py ends, a summary of the run is appended to the history
+    file, so that boot time regressions can be seen across upgrades.
+
+    (i) This module only uses the standard library, so that it can be
+        imported before 'config', whose loading time is also measured.
+"""
+
+import  os
+import  sys
+import  json
+from    time        import  time, strftime, time_ns
+from    contextlib  import  contextmanager
+
+
+UHOME           = os.path.expanduser("~")
+TIMELINE_PATH   = f'{UHOME}/pe.audio.sys/log/start_timeline.jsonl'
+HISTORY_PATH    = f'{UHOME}/pe.audio.sys/log/start_timeline_history.jsonl'
+RUN_PATH        = f'{UHOME}/pe.audio.sys/log/start_timeline.run'
+ENV_VAR         = 'PEAUDIOSYS_TIMELINE'
+
+# Max seconds a run can be recording
+RUN_MAX_TIME    = 300
+
+# The max number of runs to keep in the history file
+HISTORY_MAX     = 200
+
+
+def _read_run():
+    try:
+        with open(RUN_PATH, 'r') as f:
+            return json.loads( f.read() )
+    except:
+        return {}
+
+
+def enabled():
+    """ The run id from the environment must be the current run, on time
+    """
+    run_id = os.environ.get(ENV_VAR)
+    if not run_id:
+        return False
+
+    run = _read_run()
+    return run.get('run') == run_id and time() < run.get('deadline', 0)
+
+
+def _proc_name():
+    return os.path.basename( sys.argv[0] ).replace('.py', '') or 'python'
+
+
+def _write(rec):
+    # One short line per write() in append mode, so that concurrent
+    # writers from several processes do not interleave their records
+    try:
+        with open(TIMELINE_PATH, 'a') as f:
+            f.write( json.dumps(rec) + '\n' )
+    except Exception as e:
+        print( f'(timeline) {str(e)}' )
+
+
+def begin():
+    """ Starts a new timeline, to be called at the very begining of start.py
+    """
+    run_id = f'{os.getpid()}-{time_ns()}'
+    os.environ[ENV_VAR] = run_id
+    try:
+        os.makedirs( os.path.dirname(TIMELINE_PATH), exist_ok=True )
+        with open(TIMELINE_PATH, 'w') as f:
+            f.write('')
+        with open(RUN_PATH, 'w') as f:
+            f.write( json.dumps( {'run': run_id, 'deadline': time() + RUN_MAX_TIME} ) )
+    except Exception as e:
+        print( f'(timeline) {str(e)}' )
+    event('begin')
+
+
+def stop_recording():
+    """ Processes spawned from now on will not record
+    """
+    os.environ.pop(ENV_VAR, None)
+
+
+def record(phase, start, end=None, proc=''):
+
+    if not enabled():
+        return
+
+    _write( { 'proc':   proc or _proc_name(),
+              'phase':  phase,
+              'start':  round(start, 3),
+              'end':    round(end if end is not None else start, 3) } )
+
+
+def event(phase, proc=''):
+    """ An instant event
+    """
+    now = time()
+    record(phase, now, now, proc)
+
+
+@contextmanager
+def phase(name, proc=''):
+    """ Usage:  with phase('something'):
+                    do_something()
+    """
+    t0 = time()
+    try:
+        yield
+    finally:
+        record(name, t0, time(), proc)
+
+
+def load(path=TIMELINE_PATH):
+    """ returns the list of records sorted by start time
+    """
+    recs = []
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    recs.append( json.loads(line) )
+                except:
+                    pass
+    except:
+        pass
+    return sorted( recs, key=lambda x: x["start"] )
+
+
+def summarize(recs):
+    """ returns a dict: date, total seconds and per phase seconds
+    """
+    if not recs:
+        return {}
+
+    t0 = recs[0]["start"]
+
+    return { 'date':    strftime('%Y-%m-%d %H:%M:%S'),
+             'total':   round( max( [ r["end"] for r in recs ] ) - t0, 2 ),
+             'phases':  { f'{r["proc"]}: {r["phase"]}': round(r["end"] - r["start"], 2)
+                          for r in recs if r["end"] > r["start"] } }
+
+
+def end():
+    """ Closes the current timeline, then appends its summary to the history
+    """
+    event('end')
+    stop_recording()
+
+    # Any other process of this run will not record anymore
+    try:
+        os.remove(RUN_PATH)
+    except:
+        pass
+
+    summary = summarize( load() )
+    if not summary:
+        return
+
+    history = load_history()[ -(HISTORY_MAX - 1): ]
+    history.append(summary)
+    try:
+        with open(HISTORY_PATH, 'w') as f:
+            for item in history:
+                f.write( json.dumps(item) + '\n' )
+    except Exception as e:
+        print( f'(timeline) {str(e)}' )
+
+
+def load_history():
+    history = []
+    try:
+        with open(HISTORY_PATH, 'r') as f:
+            for line in f:
+                try:
+                    history.append( json.loads(line) )
+                except:
+                    pass
+    except:
+        pass
+    return history
+
+
+def waterfall(recs, width=50):
+    """ returns a printable waterfall chart of the given records
+    """
+    if not recs:
+        return 'no timeline records'
+
+    t0      = recs[0]["start"]
+    total   = max( [ r["end"] for r in recs ] ) - t0
+    scale   = width / total if total else 0
+    namew   = max( [ len(f'{r["proc"]}: {r["phase"]}') for r in recs ] )
+
+    lines = [ f'{"":{namew}}   start    dur.',
+              f'{"":{namew}}  ------  ------' ]
+
+    for r in recs:
+
+        offset  = r["start"] - t0
+        dur     = r["end"] - r["start"]
+        name    = f'{r["proc"]}: {r["phase"]}'
+        pad     = int( offset * scale )
+
+        if dur:
+            bar = '#' * max( 1, int( dur * scale ) )
+            lines.append( f'{name:{namew}}  {offset:6.2f}  {dur:6.2f}  {" " * pad}{bar}' )
+        else:
+            lines.append( f'{name:{namew}}  {offset:6.2f}          {" " * pad}|' )
+
+    lines.append( f'\ntotal: {total:.2f} s' )
+
+    return '\n'.join(lines)
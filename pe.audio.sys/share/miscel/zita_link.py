@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    Keeps the multiroom zita-njbridge links of a receiver.
+
+    start.py brings up all links at once, then flags the ones whose
+    remote sender did not answer in time (see .zita_link_ports). Those
+    senders are retried here in background, with an increasing delay,
+    so that their links are established as soon as they come online.
+
+    The linked senders are also probed from time to time, because a sender
+    can go away (e.g. it reboots). Then its link is flagged as not linked,
+    so it will be retried.
+"""
+
+import  threading
+from    time    import time, sleep
+
+from    miscel  import read_zita_link_ports, remote_zita_restart, \
+                       remote_zita_check
+
+
+class ZitaLinkKeeper(object):
+    """ .start()        starts retrying the not linked senders in background
+        .pending        {sender addr: next retry time}
+        .probes         {linked sender addr: next probe time}
+    """
+
+    def __init__(self, min_delay=5, max_delay=60, period=1, probe_period=30):
+        self.min_delay      = min_delay
+        self.max_delay      = max_delay
+        self.period         = period
+        self.probe_period   = probe_period
+        self.pending        = {}
+        self.delays         = {}
+        self.probes         = {}
+        self.thread         = None
+
+
+    def retry(self, link):
+
+        addr = link['addr']
+        now  = time()
+
+        if self.pending.setdefault(addr, now) > now:
+            return
+
+        # (i) remote_zita_restart updates the 'linked' flag
+        if remote_zita_restart(addr, link['ctrlport'], link['udpport']) == 'done':
+            print( f'(zita_link) sender {addr} is online, link established' )
+            del self.pending[addr]
+            self.delays.pop(addr, None)
+            return
+
+        delay = min( self.delays.get(addr, self.min_delay / 2) * 2, self.max_delay )
+        self.delays[addr]  = delay
+        self.pending[addr] = time() + delay
+
+
+    def probe(self, link):
+
+        addr = link['addr']
+        now  = time()
+
+        if self.probes.setdefault(addr, now + self.probe_period) > now:
+            return
+
+        self.probes[addr] = now + self.probe_period
+
+        # (i) remote_zita_check clears the 'linked' flag if the link is gone
+        if remote_zita_check(addr, link['ctrlport'], link['udpport']) != 'done':
+            print( f'(zita_link) sender {addr} link is gone, will retry' )
+            del self.probes[addr]
+
+
+    def check(self):
+
+        linked = [ x for x in read_zita_link_ports().values() if x.get('linked') ]
+
+        for addr in list( self.probes ):
+            if addr not in [ x['addr'] for x in linked ]:
+                del self.probes[addr]
+
+        for link in { x['addr']: x for x in linked }.values():
+            self.probe(link)
+
+        links = [ x for x in read_zita_link_ports().values() if x.get('linked') is False ]
+
+        # Senders linked by others (e.g. when selecting a remote source)
+        for addr in list( self.pending ):
+            if addr not in [ x['addr'] for x in links ]:
+                del self.pending[addr]
+                self.delays.pop(addr, None)
+
+        for link in links:
+            self.retry(link)
+
+
+    def _loop(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                print( f'(zita_link) {str(e)}' )
+            sleep(self.period)
+
+
+    def start(self):
+        if not self.thread:
+            self.thread = threading.Thread( name='zita link keeper',
+                                            target=self._loop, daemon=True )
+            self.thread.start()
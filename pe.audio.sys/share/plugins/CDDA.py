@@ -24,6 +24,7 @@ sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
 from    config import CONFIG, MAINFOLDER, USER
 from    miscel import check_Mplayer_config_file, Fmt
+from    proc_registry import spawn
 
 # CD-ROM device
 CDROM_DEVICE = CONFIG['cdrom_device']
@@ -61,8 +62,8 @@ def start():
     cmd = f'mplayer {options} -profile cdda -cdrom-device {CDROM_DEVICE}' \
           f' -input file={input_fifo}'
     with open(redirection_path, 'w') as redirfile:
-        sp.Popen( cmd.split(), shell=False,
-                  stdout=redirfile, stderr=redirfile )
+        spawn( 'mplayer_cdda', cmd.split(), shell=False,
+               stdout=redirfile, stderr=redirfile )
 
 
 def stop():
@@ -112,6 +112,7 @@ MAINFOLDER  = f'{UHOME}/pe.audio.sys'
 sys.path.append(f'{MAINFOLDER}/share/miscel')
 
 from miscel import wait4ports, check_Mplayer_config_file, Fmt, USER
+from proc_registry import spawn
 
 
 CHANNELS_PATH   = f'{UHOME}/.mplayer/channels.conf'
@@ -217,7 +218,7 @@ def start():
     with open(REDIR_PATH, 'w') as f:
         # clearing the file for this session
         f.write('')
-        Popen( cmd.split(), shell=False, stdout=f, stderr=f )
+        spawn( 'mplayer_dvb', cmd.split(), shell=False, stdout=f, stderr=f )
 
 
 def stop():
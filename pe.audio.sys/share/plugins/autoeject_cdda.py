@@ -24,6 +24,9 @@ sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 from    miscel  import  read_state_from_disk, read_metadata_from_disk, \
                         time_diff, get_timestamp, LOG_FOLDER, USER
 
+# Startup dependencies (see start.py)
+DEPENDS = ('server',)
+
 
 def main_loop():
 
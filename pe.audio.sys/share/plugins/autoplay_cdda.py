@@ -25,6 +25,9 @@ sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 from    miscel  import send_cmd, USER, CONFIG
 from    cdda    import dump_cdda_metadata
 
+# Startup dependencies (see start.py)
+DEPENDS = ('server',)
+
 
 # autoplay mode: if False will only load the disc.
 AUTO_PLAY = True
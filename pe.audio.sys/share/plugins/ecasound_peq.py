@@ -43,6 +43,9 @@ import  peq_mod as pm
 
 from    miscel import USER
 
+# Startup dependencies (see start.py)
+DEPENDS = ('brutefir',)
+
 VERBOSE = False
 
 
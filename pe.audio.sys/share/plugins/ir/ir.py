@@ -25,7 +25,8 @@ import  os
 UHOME = os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
-from    miscel import Fmt, send_cmd
+from    fmt    import Fmt
+from    client import send_cmd
 
 
 def irpacket2cmd(p):
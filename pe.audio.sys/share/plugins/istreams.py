@@ -35,6 +35,7 @@ UHOME = os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
 from miscel import check_Mplayer_config_file, Fmt, USER
+from proc_registry import spawn
 
 
 # Mplayer options:
@@ -113,7 +114,8 @@ def start():
     cmd = f'mplayer {options} -profile istreams \
            -input file={input_fifo}'
     with open(redirection_path, 'w') as redirfile:
-        Popen( cmd.split(), shell=False, stdout=redirfile, stderr=redirfile )
+        spawn( 'mplayer_istreams', cmd.split(), shell=False,
+               stdout=redirfile, stderr=redirfile )
 
 
 def stop():
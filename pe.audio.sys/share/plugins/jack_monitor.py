@@ -44,6 +44,9 @@ JACKDLOGPATH = f'{UHOME}/pe.audio.sys/log/jackd.log'
 from    miscel              import send_cmd, read_last_lines, USER
 from    share.miscel        import do_3_beep
 
+# Startup dependencies (see start.py)
+DEPENDS = ('server',)
+
 VERBOSE = False
 
 
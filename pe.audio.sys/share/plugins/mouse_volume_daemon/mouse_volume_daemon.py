@@ -53,7 +53,7 @@ import os
 UHOME   =  os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
-from miscel import send_cmd, read_state_from_disk, USER
+from client import send_cmd, read_state_from_disk, USER
 
 THISDIR =  os.path.dirname( os.path.realpath(__file__) )
 try:
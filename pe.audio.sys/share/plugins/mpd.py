@@ -18,6 +18,7 @@
 """
 import sys
 import os
+import socket
 from subprocess import Popen, call, check_output
 from time import sleep
 from getpass import getuser
@@ -27,6 +28,10 @@ sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
 from miscel import read_mpd_config
 
+# Startup dependencies and the resource provided (see start.py)
+DEPENDS  = ('jack',)
+PROVIDES = 'mpd'
+
 
 def get_mpd_config_path():
     """ If the default MPD config file wants to use a mounted filesystem,
@@ -90,6 +95,20 @@ def check_systemd_service():
         call( tmp, shell=True )
 
 
+def ready():
+    """ MPD listens on its port
+    """
+    try:
+        port = int( read_mpd_config(f'{UHOME}/.mpdconf').get('port', 6600) )
+    except:
+        port = 6600
+    try:
+        with socket.create_connection( ('localhost', port), timeout=.5 ):
+            return True
+    except:
+        return False
+
+
 def stop():
     call( ['pkill', '-u', getuser() , '-KILL', '-f', f'mpd {UHOME}/.mpdconf'] )
 
@@ -19,9 +19,23 @@
     will be displayed in the control web page, as well you can see console
     printouts if running this script with the --verbose option.
 
-    You can also check peaks with timestamp by issuing:
+    How it works:
 
-        tail -F ~/pe.audio.sys/log/brutefir_peaks.log
+        - brutefir.log is polled on a timer and read incrementally
+          from the last read offset, no file watcher is needed.
+
+        - Peaks are aggregated into time windows, keeping the max
+          value per output. When a window closes, Brutefir peak
+          counters are reset ('rpk') through a persistent CLI session,
+          and the window is saved into the peaks history store
+          (see miscel/peaks_store.py):
+
+            ~/pe.audio.sys/log/brutefir_peaks.sqlite
+
+        - History older than 'peaks_retention_days' is purged hourly.
+
+        - Warnings and the BEEP are rate limited, so sustained clipping
+          does not flood the system.
 
 
     A BEEP sound at -10 dB will be played when detecting peaks.
@@ -34,163 +48,220 @@
 
 import  sys
 import  os
-from    subprocess          import Popen, DEVNULL
-from    time                import ctime
-import  threading
-from    watchdog.observers  import Observer
-from    watchdog.events     import FileSystemEventHandler
+from    subprocess          import Popen
+from    time                import time, sleep, strftime, localtime
 
 UHOME = os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
-from    miscel              import send_cmd, read_last_line, USER, LOG_FOLDER
+from    client              import send_cmd, USER
 from    share.miscel        import do_3_beep
+import  peaks_store
+
+# Startup dependencies (see start.py)
+DEPENDS = ('brutefir', 'server')
 
 
-LOG_PATH = f'{LOG_FOLDER}/brutefir_peaks.log'
+POLL_PERIOD     = 0.5           # seconds between brutefir.log reads
+WINDOW          = 5             # seconds to aggregate peaks
+WARN_INTERVAL   = 30            # min seconds between warnings and beeps
+PURGE_INTERVAL  = 3600          # seconds between history purges
 
 VERBOSE = False
 
 
-class MyFileEventHandler(FileSystemEventHandler):
-    """ Subclass that will do something when a file
-        has been modified.
+class LogTail(object):
+    """ Reads new lines from a growing text file, remembering the last
+        read offset.
 
-        'fpath' parameter is expected.
+        If the file shrinks (it was truncated or recreated), reading
+        starts again from the beginning.
     """
 
-    def __init__(self, fpath=''):
-        self.fpath = fpath
+    def __init__(self, fpath):
+        self.fpath   = fpath
+        self.offset  = 0
+        self.partial = ''
 
-    def on_modified(self, event):
-        #print( f'DEBUG: {event.event_type} {event.src_path}' ) # DEBUG
-        if event.src_path == self.fpath:
-            check_bf_log()
 
+    def skip_to_end(self):
+        try:
+            self.offset = os.path.getsize(self.fpath)
+        except:
+            self.offset = 0
+
+
+    def new_lines(self):
 
-def log_peak(peaks):
-    """ peaks is a raw list of peaks, example:
+        try:
+            size = os.path.getsize(self.fpath)
+        except:
+            return []
 
-            [-inf, -inf, -8.6, 2.5, 10.1, -8.8, 1.7, 9.7]
+        if size < self.offset:
+            self.offset  = 0
+            self.partial = ''
+
+        if size == self.offset:
+            return []
+
+        with open(self.fpath, 'r') as f:
+            f.seek(self.offset)
+            data = f.read()
+            self.offset = f.tell()
+
+        lines = (self.partial + data).split('\n')
+
+        # The last item is an incomplete line (or '' if data ended with \n)
+        self.partial = lines.pop()
+
+        return lines
+
+
+class PeakWindow(object):
+    """ Aggregates Brutefir peaks over a time window,
+        keeping the max value per output.
     """
 
-    # Brutefir Outputs MAP example:
-    #   {'0': {'name': 'fr.L', 'delay': 0}, '1': {'name': 'fr.R', 'delay': 0}}
+    def __init__(self):
+        self.clear()
 
-    # Will add the Output ID to make the log human readable
-    peaks_str = ''
 
-    for n, p in enumerate(peaks):
+    def clear(self):
+        self.t_start = 0
+        self.events  = 0
+        self.peaks   = {}
 
-        out_name = BFOUTMAP[str(n)]["name"]
 
-        if 'void' in out_name:
-            continue
+    def add(self, peaks):
+        """ peaks is a raw list of peaks per output, example:
 
-        if p > 0:
-            peaks_str += f'  {out_name.rjust(4)}: {str(p).rjust(4)}'
+                [-inf, -inf, -8.6, 2.5, 10.1, -8.8, 1.7, 9.7]
+        """
 
-        else:
-            peaks_str += f'  {out_name.rjust(4)}:     '
+        if not self.events:
+            self.t_start = time()
 
+        self.events += 1
 
-    with open(LOG_PATH, 'a') as f:
-        f.write( f'{ctime()} {peaks_str}\n' )
+        for n, p in enumerate(peaks):
 
+            if p <= 0:
+                continue
 
-def check_bf_log(reset_bf_peaks=True):
-    """ try to read peak printouts from brutefir.log
-    """
+            out_name = BFOUTMAP.get(str(n), {}).get('name', str(n))
 
-    def send_warning(w):
-        if VERBOSE:
-            print(f'PEAK MONITOR: {w}')
-        send_cmd(f'aux warning clear')
-        send_cmd(f'aux warning set {w}')
-        # Do not reset peak warning
-        # send_cmd(f'aux warning expire 3')
+            if 'void' in out_name:
+                continue
 
+            if p > self.peaks.get(out_name, 0):
+                self.peaks[out_name] = p
 
-    def bf_peak_parse(pkline):
-        """ Parse a peak printout line from Brutefir:
 
-                peak: 0/197/+2.55 1/123/+0.61
+    def is_due(self):
+        return self.events and (time() - self.t_start >= WINDOW)
 
-            returns: a list of peaks in dB per output channel, example:
-            [-inf, -inf, -11.6, -1.7, 9.6, -11.4, -1.2, 10.2]
+
+    def max_info(self):
+        """ returns a string 'PEAK OutID: XX dB' with the most peaking output
         """
-        pks = []
+        if not self.peaks:
+            return ''
+        out_name = max(self.peaks, key=self.peaks.get)
+        return f'PEAK {out_name}: {self.peaks[out_name]} dB'
 
-        try:
-            pks = pkline.split()[1:]
-            pks = [x.split('/')[-1] for x in pks]
-            # round to 1 decimal place
-            pks = [round(float(x), 1) for x in pks]
 
-        except:
-            pass
+def bf_peak_parse(pkline):
+    """ Parse a peak printout line from Brutefir:
 
-        return pks
+            peak: 0/197/+2.55 1/123/+0.61
 
+        returns: a list of peaks in dB per output channel, example:
+        [-inf, -inf, -11.6, -1.7, 9.6, -11.4, -1.2, 10.2]
+    """
+    pks = []
 
+    try:
+        pks = pkline.split()[1:]
+        pks = [x.split('/')[-1] for x in pks]
+        # round to 1 decimal place
+        pks = [round(float(x), 1) for x in pks]
 
-    def get_bf_peak_and_reset(reset=reset_bf_peaks):
-        """ read brutefir.log to find the last peak line,
+    except:
+        pks = []
 
-            returns: a peak info string 'PEAK OutID: XX dB'
-        """
+    return pks
 
-        peaks    = []
-        pMaxInfo = ''
 
-        bf_log_tail = read_last_line(BFLOGPATH)
+def log_window(window):
+    """ Saves the window into the peaks history store
+    """
+    try:
+        peaks_store.add_window( window.t_start, window.events, window.peaks )
+    except Exception as e:
+        print(f'(peak_monitor) error saving peaks: {str(e)}')
 
-        if bf_log_tail.startswith('peak:'):
 
-            peaks = bf_peak_parse( bf_log_tail )
-            # example: [-inf, -inf, -21.3, -3.1, 8.3, -17.4, -3.8, 7.3]
+def send_warning(w):
+    if VERBOSE:
+        print(f'{strftime("%X", localtime())} PEAK MONITOR: {w}')
+    send_cmd(f'aux warning clear')
+    send_cmd(f'aux warning set {w}')
+    # Do not reset peak warning
+    # send_cmd(f'aux warning expire 3')
 
-            if reset:
-                try:
-                    bf_cli('rpk')
-                except:
-                    pass
 
-        if peaks:
+def start():
 
-            try:
-                # find MAX peak
-                pmaxIdx  = max(range(len(peaks)), key=peaks.__getitem__)
-                pmaxdB   = peaks[pmaxIdx]
-                pmaxOut  = BFOUTMAP[ str(pmaxIdx) ]['name']
-                pMaxInfo = f'PEAK {pmaxOut}: {pmaxdB} dB'
+    tail    = LogTail(BFLOGPATH)
+    window  = PeakWindow()
+    bfcli   = CliSession()
 
-            except:
-                pass
+    last_warning_time = 0
+    last_purge_time   = 0
 
-        return pMaxInfo, peaks
+    # Old printouts do not matter
+    tail.skip_to_end()
 
+    while True:
 
-    pMaxInfo, peaks = get_bf_peak_and_reset()
+        for line in tail.new_lines():
 
-    if pMaxInfo:
+            if not line.startswith('peak:'):
+                continue
 
-        job_beep = threading.Thread(target=do_3_beep)
-        job_beep.start()
+            peaks = bf_peak_parse(line)
+            if not peaks:
+                continue
 
-        log_peak( peaks )
+            window.add(peaks)
 
-        send_warning( pMaxInfo )
+            # Warnings and beeps are rate limited
+            if window.peaks and time() - last_warning_time >= WARN_INTERVAL:
+                do_3_beep()
+                send_warning( window.max_info() )
+                last_warning_time = time()
 
+        if window.is_due():
 
-def start():
-    observer = Observer()
-    observer.schedule(event_handler=MyFileEventHandler(fpath=BFLOGPATH),
-                      path=BFLOGPATH,
-                      recursive=False)
-    observer.start()
-    obsloop = threading.Thread( target=observer.join() )
-    obsloop.start()
+            # Brutefir peak printouts are cumulative until reset
+            bfcli.cmd('rpk')
+
+            log_window(window)
+
+            if VERBOSE:
+                print(f'(peak_monitor) {window.events} events: {window.peaks}')
+
+            window.clear()
+
+        if time() - last_purge_time >= PURGE_INTERVAL:
+            try:
+                peaks_store.purge()
+            except Exception as e:
+                print(f'(peak_monitor) error purging peaks: {str(e)}')
+            last_purge_time = time()
+
+        sleep(POLL_PERIOD)
 
 
 def stop():
@@ -200,7 +271,7 @@ def stop():
 if __name__ == "__main__":
 
     try:
-        from brutefir_mod  import cli as bf_cli, get_config_outputs, BFLOGPATH
+        from brutefir_mod  import CliSession, get_config_outputs, BFLOGPATH
         # Brutefir Outputs MAP example:
         #   {'0': {'name': 'fr.L', 'delay': 0}, '1': {'name': 'fr.R', 'delay': 0}}
         BFOUTMAP = get_config_outputs()
@@ -227,4 +298,3 @@ if __name__ == "__main__":
             print(__doc__)
     else:
         print(__doc__)
-
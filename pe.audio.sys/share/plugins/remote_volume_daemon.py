@@ -14,14 +14,21 @@
     A newcoming remote listener machine will need to send 'hello'
     to this daemon at port <peaudiosys_base_port> + 5 (usually 9995)
 
+    The local peaudiosys service pushes its level related journal
+    records to this daemon, as 'journal {record}' commands.
+
+    Remote machines are handled from an asyncio loop: all candidates are
+    probed at once when discovering, then changes are relayed to all of
+    them in parallel, each one through its own persistent session (see
+    share/miscel/server.py) and with its own timeout.
+
 """
 
 import  json
+import  asyncio
 from    subprocess import Popen
-from    time import time
+import  threading
 import  socket
-from    watchdog.observers import Observer
-from    watchdog.events import FileSystemEventHandler
 import  sys
 import  os
 
@@ -30,10 +37,9 @@ sys.path.append( f'{UHOME}/pe.audio.sys/share/miscel' )
 
 import  server
 from    config  import CONFIG, USER
-from    miscel  import send_cmd, get_remote_selected_source, read_last_line
 
-LOG_DIR         = f'{UHOME}/pe.audio.sys/log'
-CMD_LOG_PATH    = f'{LOG_DIR}/peaudiosys_cmd.log'
+# Startup dependencies (see start.py)
+DEPENDS = ('server',)
 
 
 # ------------- USER CONFIG --------------
@@ -41,42 +47,110 @@ CMD_LOG_PATH    = f'{LOG_DIR}/peaudiosys_cmd.log'
 REMOTES_ADDR_RANGE = range(230, 240)
 # ----------------------------------------
 
+# Seconds to wait for a remote answer
+PEER_TIMEOUT    = 1
+
+# Set from the asyncio loop thread (see main_async)
+LOOP            = None
+LOCAL           = None
+JOURNAL_QUEUE   = None
+READY           = threading.Event()
+
+# The remote listening machines {addr: Peer}
+REMOTES         = {}
+
 
-# Generic handler from 'watchdog' for doing actions when a file change occurs
-class file_event_handler(FileSystemEventHandler):
-    """ Will do something when a <fname> change occurs
+class Peer(object):
+    """ A pe.audio.sys server, talked to through a persistent session.
+
+        .ask(cmd)   returns the command result, or an error string.
+
+        If the session is lost or not answered in time, it will be opened
+        again on next ask. Servers not supporting sessions are asked
+        through a new connection per command.
     """
-    # (i) This is an inherited class from the imported one 'FileSystemEventHandler',
-    #     which provides the 'event' propiertie.
-    #     Here we expand the class with our custom parameters:
-    #     'fname' and wanted 'action'
-
-    def __init__(self, fname, action, antibound=True):
-        self.fname      = fname
-        self.action     = action
-        self.antibound  = antibound
-        self.ts         = time()
-
-    def on_modified(self, event):
-        # DEBUG
-        #print( f'(i) event type: {event.event_type}, file: {event.src_path}' )
-        if event.src_path == self.fname:
-            if self.antibound:
-                if (time() - self.ts) > .1:
-                    globals()[self.action]()
-                self.ts = time()
-            else:
-                    globals()[self.action]()
+
+    def __init__(self, addr, port=None, timeout=PEER_TIMEOUT):
+        self.addr       = addr
+        self.port       = port or CONFIG['peaudiosys_port']
+        self.timeout    = timeout
+        self.reader     = None
+        self.writer     = None
+        self.oneshot    = False
+        # An older server not knowing 'set_levels'
+        self.legacy     = False
+        self.lock       = asyncio.Lock()
+
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.addr, self.port)
+        writer.write( b'session\n' )
+        await writer.drain()
+        if (await reader.readline()).strip() != b'"ok"':
+            writer.close()
+            self.oneshot = True
+            return
+        self.reader, self.writer = reader, writer
+
+
+    async def _ask_oneshot(self, cmd):
+        reader, writer = await asyncio.open_connection(self.addr, self.port)
+        writer.write( cmd.encode() )
+        await writer.drain()
+        ans = await reader.read()
+        writer.close()
+        return ans.decode()
+
+
+    async def _ask(self, cmd):
+
+        if not self.writer and not self.oneshot:
+            await self._connect()
+
+        if self.oneshot:
+            return await self._ask_oneshot(cmd)
+
+        self.writer.write( f'{cmd}\n'.encode() )
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError('session closed by peer')
+        return json.loads(line)
 
 
-def get_state():
-    return json.loads( send_cmd('state') )
+    async def ask(self, cmd):
+        async with self.lock:
+            try:
+                return await asyncio.wait_for( self._ask(cmd), self.timeout )
+            except Exception as e:
+                self.close()
+                return f'{self.addr}: {str(e) or type(e).__name__}'
 
 
-def detect_remotes():
-    """ list of remote IPs listening to a source named *remote*
+    async def get_state(self):
+        try:
+            return json.loads( await self.ask('state') )
+        except:
+            return {}
+
+
+    async def is_listening(self):
+        """ Is the remote machine listening to us (a 'remote...' source)?
+        """
+        return 'remote' in (await self.get_state()).get('input', '').lower()
+
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def detect_remotes():
+    """ Remote machines listening to a source named *remote*,
+        all candidate addresses are probed at once.
     """
-    clients = []
+    candidates = []
 
     for n in REMOTES_ADDR_RANGE:
 
@@ -84,106 +158,217 @@ def detect_remotes():
         addr_list[-1] = str(n)
         addr = '.'.join( addr_list )
 
-        if addr == my_ip:
+        if addr != my_ip:
+            candidates.append( Peer(addr) )
+
+    listening = await asyncio.gather( *[ p.is_listening() for p in candidates ] )
+
+    for peer, ok in zip(candidates, listening):
+        if ok:
+            REMOTES[peer.addr] = peer
+        else:
+            peer.close()
+
+
+def levels_cmd(state, keys=('level', 'lu_offset', 'equal_loudness')):
+    """ A single 'set_levels' command from the given state keys
+    """
+    return f'set_levels {json.dumps( { k: state[k] for k in keys } )}'
+
+
+def legacy_levels_cmds(cmd):
+    """ The separate commands equivalent to a 'set_levels' command,
+        for remote servers not knowing it.
+    """
+    levels = json.loads( cmd[len('set_levels '):] )
+    cmds = []
+    for k, v in levels.items():
+        if k == 'equal_loudness':
+            cmds.append( f'loudness {"on" if v else "off"}' )
+        else:
+            cmds.append( f'{k} {v}' )
+    return cmds
+
+
+async def remote_cmds(peer, cmds):
+    """ Sends the commands to a peer if still listening to us,
+        otherwise the peer is forgotten.
+    """
+    if not await peer.is_listening():
+        print( f'(remote_volume) remote {peer.addr} not listening by now :-/' )
+        peer.close()
+        REMOTES.pop(peer.addr, None)
+        print( f'(remote_volume) Updated remote listening machines: {list(REMOTES)}' )
+        return
+
+    cmds = list(cmds)
+
+    while cmds:
+
+        cmd = cmds.pop(0)
+
+        if peer.legacy and cmd.startswith('set_levels '):
+            cmds[0:0] = legacy_levels_cmds(cmd)
+            continue
+
+        print( f'(remote_volume) remote {peer.addr} sending \'{cmd}\'' )
+        result = await peer.ask(cmd)
+
+        if cmd.startswith('set_levels ') and 'unknown command' in str(result):
+            print( f'(remote_volume) remote {peer.addr} does not know '
+                   f'\'set_levels\', using separate commands' )
+            peer.legacy = True
+            cmds[0:0] = legacy_levels_cmds(cmd)
             continue
 
-        if 'remote' in get_remote_selected_source(addr).lower():
-            clients.append(addr)
+        # (i) relative changes are answered with the final applied value
+        if result != 'done' and not is_number(result):
+            print( f'(remote_volume) remote {peer.addr} answered: {result}' )
 
-    return clients
 
+def is_number(x):
+    try:
+        float(x)
+        return True
+    except:
+        return False
 
-def remote_cmd(cli_addr, cmd):
-    print( f'(remote_volume) remote {cli_addr} sending \'{cmd}\'' )
-    send_cmd( cmd, host=cli_addr, verbose=False )
 
+async def fan_out(cmds, peers=None):
+    """ The commands are sent to all peers in parallel
+    """
+    if peers is None:
+        peers = list( REMOTES.values() )
 
-def remote_update_levels(rem_addr):
-    level           = get_state()["level"]
-    lu_offset       = get_state()["lu_offset"]
-    equal_loudness  = get_state()["equal_loudness"]
-    remote_cmd(rem_addr, f'lu_offset {lu_offset}')
-    remote_cmd(rem_addr, f'loudness {equal_loudness}')
-    remote_cmd(rem_addr, f'level {level}')
+    if cmds and peers:
+        await asyncio.gather( *[ remote_cmds(p, cmds) for p in peers ] )
 
 
-# The action triggered by the observer
-def relay_level_changes():
-    """ Notice that only relative level changes will be relayed
+async def remote_update_levels(peers=None):
+    """ Sets our level settings in remote machines, in a single command
     """
+    state = await LOCAL.get_state()
+    if state:
+        await fan_out( [ levels_cmd(state) ], peers )
 
-    # Read last command from the command log file
-    tmp = read_last_line( CMD_LOG_PATH )
-    # e.g.: "2020/10/23 17:16:43; level -1 add; done"
-    last_cmd = tmp.split(';')[1].strip()
 
-    # Filtering commands:
-    wanted_cmd = ''
+async def add_remote(addr):
 
-    # - relative level
-    if ('level' in last_cmd and 'add' in last_cmd):
-        wanted_cmd = last_cmd
+    if addr not in REMOTES:
+        REMOTES[addr] = Peer(addr)
+        print( f'(remote_volume) Updated remote listening machines: {list(REMOTES)}' )
 
-    # - LU_offset (usually a toggle command)
-    if ('lu_offset' in last_cmd):
-        lu_offset       = get_state()["lu_offset"]
-        wanted_cmd      = f'lu_offset {lu_offset}'
+    # set the level settings in remote listener even if already in REMOTES
+    await remote_update_levels( [ REMOTES[addr] ] )
 
-    # - equal loudness (usually a toggle command)
-    if ('loudness' in last_cmd):
-        equal_loudness  = get_state()["equal_loudness"]
-        wanted_cmd      = f'loudness {equal_loudness}'
 
-    # Early return
-    if not wanted_cmd:
-        return
+def batch_cmds(recs):
+    """ The commands to relay from a batch of journal records,
+        and the state keys whose resulting values are to be relayed.
 
-    # Forwarding commands to remotes
-    for rem_addr in remoteClients:
+        Notice that only relative level changes will be relayed.
+    """
+    level_add   = 0.0
+    cmds        = []
+    keys        = []
 
-        # Checking if remote is still listening to us
-        # then updates the level event to remote
-        if 'remote' in get_remote_selected_source(rem_addr):
-            remote_cmd(rem_addr, wanted_cmd)
+    for rec in recs:
 
-        # else purge from remotes list if not listening anymore
-        else:
-            print( f'remote {rem_addr} not listening by now :-/' )
-            remoteClients.remove( rem_addr )
-            print( f'Updated remote listening machines: {remoteClients}' )
+        cmd, args = rec["cmd"], rec["args"]
 
+        # - relative level (a fading ramp is relayed as is)
+        if cmd in ('level', 'volume') and 'add' in args.split():
+            if 'ramp' in args:
+                cmds.append( f'level {args}' )
+            else:
+                try:
+                    level_add += float( args.split()[0] )
+                except:
+                    pass
 
-# Broadcast level settings to all remote machines
-def broadcast_level_settings():
+        # - LU_offset (usually a toggle command)
+        elif cmd == 'lu_offset' and 'lu_offset' not in keys:
+            keys.append('lu_offset')
 
-    for rem_addr in remoteClients:
+        # - equal loudness (usually a toggle command)
+        elif 'loudness' in cmd and 'equal_loudness' not in keys:
+            keys.append('equal_loudness')
 
-        if 'remote' in get_remote_selected_source(rem_addr):
-            remote_update_levels(rem_addr)
-        else:
-            print( f'remote {rem_addr} not listening by now :-/' )
-            remoteClients.remove( rem_addr )
-            print( f'Updated remote listening machines: {remoteClients}' )
+    if round(level_add, 2):
+        cmds.append( f'level {round(level_add, 2)} add' )
+
+    return cmds, keys
+
+
+async def relay_journal():
+    """ Relays the journal records. Records arriving while relaying
+        are merged into the next relay.
+    """
+    while True:
+
+        recs = [ await JOURNAL_QUEUE.get() ]
+        while not JOURNAL_QUEUE.empty():
+            recs.append( JOURNAL_QUEUE.get_nowait() )
+
+        cmds, keys = batch_cmds(recs)
+
+        if keys:
+            state = await LOCAL.get_state()
+            if state:
+                cmds.append( levels_cmd(state, keys) )
+
+        await fan_out(cmds)
+
+
+async def main_async():
+
+    global LOOP, LOCAL, JOURNAL_QUEUE
+
+    LOOP            = asyncio.get_running_loop()
+    LOCAL           = Peer('127.0.0.1')
+    JOURNAL_QUEUE   = asyncio.Queue()
+
+    # (i) the server will wait for this to be READY
+    try:
+        await detect_remotes()
+        print( f'(remote_volume) Detected {len(REMOTES)} '
+               f'remote listening machines: {list(REMOTES)}' )
+
+        # Broadcast level settings to remote clients
+        print( f'(remote_volume) broadcast level settings to remotes ...' )
+        await remote_update_levels()
+
+    finally:
+        READY.set()
+
+    print( f'(remote_volume) Keep relaying level changes to remotes ...' )
+    await relay_journal()
 
 
 # The action called from our instance of <server.py> when receiving messages.
 # (See below 'server.MODULE=...' when initiating <server.py> )
 def do(cmd):
-
+    """ (i) This runs in the server thread, so the work is handed over
+            to the asyncio loop, and the answer is given at once.
+    """
     cli_addr = server.CLIADDR[0]
     result = 'nack'
 
-    # Only 'hello' command is processed
-    if cmd == 'hello':
+    # Journal records, only from the local peaudiosys service
+    if cmd.startswith('journal '):
+        if cli_addr == my_ip or cli_addr.startswith('127.'):
+            try:
+                rec = json.loads( cmd[len('journal '):] )
+                LOOP.call_soon_threadsafe( JOURNAL_QUEUE.put_nowait, rec )
+                result = 'ack'
+            except Exception as e:
+                print( f'(remote_volume) bad journal record: {str(e)}' )
+
+    # The 'hello' command from remote listeners
+    elif cmd == 'hello':
         if cli_addr != my_ip and '127.0.' not in cli_addr:
             print( f'(remote_volume) Received hello from: {cli_addr}' )
-            if cli_addr not in remoteClients:
-                # updating new client into remote clients list
-                remoteClients.append(cli_addr)
-                print( f'(remote_volume) Updated remote listening machines: '
-                       f'{remoteClients}' )
-            # set the level settings in remote listener even if already in remoteClients
-            remote_update_levels(cli_addr)
+            asyncio.run_coroutine_threadsafe( add_remote(cli_addr), LOOP )
             result = 'ack'
         else:
             print( f'(remote_volume) Tas tonto: received \'hello\' '
@@ -216,30 +401,11 @@ if __name__ == "__main__":
     # Retrieving basic data for this to work
     my_hostname     = socket.gethostname()
     my_ip           = socket.gethostbyname(f'{my_hostname}.local')
-    remoteClients   = detect_remotes()
-    print( f'(remote_volume) Detected {len(remoteClients)} '
-           f'remote listening machines: {remoteClients}' )
-
-    # Broadcast level settings to remote clients
-    print( f'(remote_volume) broadcast level settings to remotes ...' )
-    broadcast_level_settings()
-
-    #   WATCHDOG to observe file changes
-    #   https://watchdog.readthedocs.io/en/latest/
-    #   https://stackoverflow.com/questions/18599339/
-    #   python-watchdog-monitoring-file-for-changes
-    #   Use recursive=True to observe also subfolders
-    #   Even observing recursively the CPU load is negligible,
-    #   but we prefer to observe to a single folder.
-    observer = Observer()
-    observer.schedule( file_event_handler(  fname=CMD_LOG_PATH,
-                                            action='relay_level_changes',
-                                            antibound=True ),
-                                            path=LOG_DIR,
-                                            recursive=False )
-    observer.start()
 
-    print( f'(remote_volume) Keep relaying level changes to remotes ...' )
+    # The asyncio loop: discovering, broadcasting then relaying
+    threading.Thread( target=asyncio.run, args=(main_async(),),
+                      daemon=True ).start()
+    READY.wait()
 
 
     # A server that listen for new remote listening clients to emerge
@@ -12,7 +12,7 @@ from watchdog.observers     import  Observer
 from watchdog.events        import  FileSystemEventHandler
 import  jack
 import  subprocess as sp
-from    time                import  sleep, ctime
+from    time                import  sleep
 import  os
 import  sys
 import  threading
@@ -27,6 +27,12 @@ from    miscel      import  *
 
 from    peq_mod     import eca_bypass, eca_load_peq
 
+import  peaks_store
+from    sysmon      import  SysmonSampler
+from    zita_link   import  ZitaLinkKeeper
+from    dispatch    import  command, check_arg
+from    proc_registry import  spawn
+
 
 
 def restart_to_sample_rate(value):
@@ -37,121 +43,30 @@ def restart_to_sample_rate(value):
 def dump_aux_info():
     """ A helper to write AUX_INFO dict to a file to be accesible
         by third party processes
+
+        (i) amp and loudness_monitor items are updated when their files
+            change (see files_event_handler), sysmon is sampled in background.
     """
-    # Dynamic updates
-    AUX_INFO['amp']                     = manage_amp_switch( 'state' )
-    AUX_INFO['loudness_monitor']        = get_loudness_monitor()
-    AUX_INFO['sysmon']                  = get_sysmon('wlan0')
+    AUX_INFO['sysmon'] = SYSMON.snapshot
 
     # Dumping to disk
     with open(AUX_INFO_PATH, 'w') as f:
         f.write( json_dumps(AUX_INFO) )
 
 
-def get_sysmon(w_iface='wlan0'):
-    """ A simple reader of
-            - CPU temperature
-            - wireless link stattus
-    """
-
-    def get_wifi(iface='wlan0'):
-        """ Returns a dict, example:
-
-            {   'Bit-rate-Mb/s': '72.2',
-                'Tx-Power': '31',
-                'Quality': '61/70',
-                'Signal-level': '-49'
-            }
-        """
-        #   $ cat /proc/net/wireless
-        #   Inter-| sta-|   Quality        |   Discarded packets               | Missed | WE
-        #    face | tus | link level noise |  nwid  crypt   frag  retry   misc | beacon | 22
-        #    wlan0: 0000   61.  -49.  -256        0      0      0      0      0        0
-
-
-        #   $ iwconfig wlan0
-        #   wlan0     IEEE 802.11  ESSID:"MOVISTAR_FC50"
-        #             Mode:Managed  Frequency:2.412 GHz  Access Point: 4C:AB:F8:CB:FC:5F
-        #             Bit Rate=72.2 Mb/s   Tx-Power=31 dBm
-        #             Retry short limit:7   RTS thr:off   Fragment thr:off
-        #             Power Management:on
-        #             Link Quality=61/70  Signal level=-49 dBm
-        #             Rx invalid nwid:0  Rx invalid crypt:0  Rx invalid frag:0
-        #             Tx excessive retries:0  Invalid misc:0   Missed beacon:0
-        #
-        #   not connected here:
-        #
-        #   wlan0     IEEE 802.11  ESSID:off/any
-        #             Mode:Managed  Access Point: Not-Associated   Tx-Power=12 dBm
-        #             Retry short limit:7   RTS thr:off   Fragment thr:off
-        #             Power Management:off
-        #
-
-        d = {}
-
-        if not WIFI_DETECTED:
-            return d
-
-        try:
-            tmp = sp.check_output(f'iwconfig {iface}'.split()).decode().split()
-
-            d['iface'] = iface
-
-            for e in tmp:
-                if '=' in e:
-                    k, v = e.split('=')
-                    if k.lower() == 'rate':     k = 'Bit-rate-Mb/s'
-                    if k.lower() == 'level':    k = 'Signal-level'
-                    d[k] = v
-
-        except Exception as e:
-            print(f'(aux.py) get_wifi {str(e)}' )
-
-        return d
-
-
-    def get_temp():
-        """
-        """
-        #   This works on Intel and ARM
-        #   $ cat /sys/class/thermal/thermal_zone0/temp
-        #   74136
-
-        temp = 0.0
-
-        try:
-            tmp = sp.check_output('cat /sys/class/thermal/thermal_zone0/temp'.split()).decode()
-
-            temp = round(int(tmp) / 1000, 1)
+def get_aux_info():
+    AUX_INFO['sysmon'] = SYSMON.snapshot
+    return AUX_INFO
 
-        except Exception as e:
-            print( str(e) )
 
-        return temp
-
-
-    def get_fans_speed(get_zero_rmp=False):
-        """
-        """
-        fans = {'fan1':'', 'fan2':'', 'fan3':'', }
-        hw_dir = '/sys/class/hwmon/hwmon1'
-        for i in 1,2,3:
-            try:
-                with open(f'{hw_dir}/fan{i}_input', 'r') as f:
-                    x = f.read().strip()
-                    if int(x) or get_zero_rmp:
-                        fans[f"fan{i}"] = x
-            except:
-                pass
-
-        return fans
-
-
-
-    return  {   'wifi': get_wifi( w_iface),
-                'temp': get_temp(),
-                'fans': get_fans_speed()
-            }
+def amp_switch(mode):
+    """ A wrapper to keep AUX_INFO updated also if the amp manager
+        does not write the amp state file
+    """
+    result = manage_amp_switch(mode)
+    if result in ('on', 'off'):
+        AUX_INFO['amp'] = result
+    return result
 
 
 def get_web_config():
@@ -206,7 +121,8 @@ def zita_j2n(args):
 
         Feeds the preamp audio to a zita-j2n port pointing to the receiver.
 
-        args: a json tuple string "(dest, udpport, do_stop)"
+        args: a json tuple string "(dest, udpport, mode)"
+              mode: 'start', 'stop' or 'check' (is it running?)
     """
 
     dest, udpport, do_stop = json_loads(args)
@@ -223,6 +139,12 @@ def zita_j2n(args):
         sp.Popen( ['pkill', '-KILL', '-f',  zitapattern] )
         return f'killing {zitajname}'
 
+    # CHECK mode
+    if do_stop == 'check':
+        if process_is_running(f'--jname {zitajname} '):
+            return 'done'
+        return f'{zitajname} not running'
+
     # NORMAL mode
     jcli = jack.Client(name='zitatmp', no_start_server=True)
     jports = jcli.get_ports()
@@ -230,7 +152,7 @@ def zita_j2n(args):
     if not [x for x in jports if zitajname in x.name]:
         zitacmd     = f'zita-j2n --jname {zitajname} {dest} {udpport}'
         with open('/dev/null', 'w') as fnull:
-            sp.Popen( zitacmd.split(), stdout=fnull, stderr=fnull )
+            spawn( zitajname, zitacmd.split(), stdout=fnull, stderr=fnull )
 
     wait4ports(zitajname, timeout=3)
 
@@ -405,117 +327,55 @@ def alert_new_eq_graph(timeout=1):
     return f'alerting for {timeout} s'
 
 
-def get_bf_peaks(only_today=True):
-    """ from brutefir_peaks.log
-    """
-
-    def get_peaks_header(pline):
-        """ Extract output names (2 characters) from a brutefir peaks log line
-            with heading spaces in order to be aligned with the below lines
-
-                                   27   -->    +12
-        Fri Sep 20 12:47:40 2024   lo.L:  5.3  mi.L:  6.2  hi.L: 10.1  lo.R:  5.4  mi.R:  5.5  hi.R: 10.1
-        """
-
-        ptail = pline[27:]
-
-        header = ' ' * 27
-        i = 0
-        channel = ptail[i + 3]
-        while i < len(ptail):
-
-            # add spaces when channel changes
-            if channel != ptail[i + 3]:
-                header += ' ' * 3
-            channel = ptail[i + 3]
-
-            header += ptail[i:i + 12][:2] + '    '
-
-            i += 12
-
-        #                        LO    MI    HI        LO    MI    HI
-        return header.upper()
-
+def get_bf_peaks(arg='today'):
+    """ Query the peaks history store (see miscel/peaks_store.py)
 
-    def remove_labels(pline):
-        """ Extract output peak values from a brutefir peaks log line
-            with spacing in order to be aligned with the header line.
+        arg:    [ today | hour | day | week | all | <seconds> ]  [output]
 
-                                   27   -->    +12
-        Fri Sep 20 12:47:40 2024   lo.L:  5.3  mi.L:  6.2  hi.L: 10.1  lo.R:  5.4  mi.R:  5.5  hi.R: 10.1
-        """
-
-        pdate = pline[:27]
-        ptail = pline[27:]
-
-        values = ''
-        i = 0
-        ch = ptail[i + 3]
-        while i < len(ptail):
-
-            # add spaces when channel changes
-            if ch != ptail[i + 3]:
-                values += ' ' * 3
-            ch = ptail[i + 3]
-
-            values += ptail[i:i + 12][6:]
-
-            i += 12
+        returns JSON rows, one per peak monitor window, and the
+        Brutefir output names ordered as in brutefir_config, example:
 
-        pline = pdate + '   ' + values
-
-        # Fri Sep 20 12:48:02 2024      1.2   2.3  10.1      5.4   5.5  10.1
-        return pline
+            { 'outputs': ['lo.L', 'hi.L', 'lo.R', 'hi.R'],
+              'rows':    [ {'ts': 1726829260.1, 'events': 3,
+                            'peaks': {'lo.L': 5.3, 'hi.L': 10.1}}, ... ] }
+    """
 
+    args   = (arg or 'today').split()
+    rng    = args[0]
+    output = args[1] if args[1:] else None
 
-    result = { 'header': '', 'peaks': [] }
+    result = { 'outputs': [], 'rows': [] }
 
     try:
-        with open(f'{LOG_FOLDER}/brutefir_peaks.log', 'r') as f:
-            peaks = f.read().split('\n')
+        from brutefir_mod import get_config_outputs
+        result["outputs"] = [ x['name'] for x in get_config_outputs().values()
+                              if not 'void' in x['name'] ]
     except:
-        result["header"] = 'Error reading peaks'
-        return result
-
-    # Example:
-    #      0        9          20
-    #   [ 'Thu Sep 19 21:05:19 2024   lo.L:  5.3  mi.L:  5.9 ...',
-    #     'Thu Sep 19 21:05:33 2024   ... ....',
-    #      ... ]
-
-
-    # Prepare the header
-    header = ''
-    if peaks:
-        header = get_peaks_header(peaks[0])
+        pass
 
+    try:
+        result["rows"] = peaks_store.query( since=peaks_store.range_to_since(rng),
+                                            output=output )
+    except Exception as e:
+        return f'error reading peaks: {str(e)}'
 
-    # Let's keep the timestamp and values, removing the 'out.ch:' labels
-    for n, pline in enumerate(peaks):
-        if not pline:
-            continue
-        peaks[n] = remove_labels( pline )
-
-
-    # removing the day, month and year and shorten the header line
-    if only_today:
-
-        header = header[13:]
-
-        #           10        20
-        #           |         |
-        # Fri Sep 20 12:48:02 2024
-        today = ctime()
+    for row in result["rows"]:
+        for out in row["peaks"]:
+            if not out in result["outputs"]:
+                result["outputs"].append(out)
 
-        peaks = [x[11:19] + '  ' + x[27:] for x in peaks
-                         if  x[:10]   == today[:10]
-                         and x[20:24] == today[20:24] ]
+    return result
 
 
-    result["header"] = header
-    result["peaks"]  = peaks
+def get_bf_peaks_summary(arg='today'):
+    """ Per output peaks statistics from the peaks history store
 
-    return result
+        arg:    [ today | hour | day | week | all | <seconds> ]
+    """
+    try:
+        return peaks_store.summary( since=peaks_store.range_to_since(arg or 'today') )
+    except Exception as e:
+        return f'error reading peaks: {str(e)}'
 
 
 def get_help():
@@ -543,34 +403,36 @@ class files_event_handler(FileSystemEventHandler):
         # DEBUG
         #print( f'(aux) event type: {event.event_type}, file: {event.src_path}' )
         if event.src_path == self.wanted_path:
-            dump_aux_info()
 
+            if self.wanted_path == AMP_STATE_PATH:
+                AUX_INFO['amp']              = manage_amp_switch( 'state' )
 
-# auto-started when loading this module
-def init():
+            elif self.wanted_path == LDMON_PATH:
+                AUX_INFO['loudness_monitor'] = get_loudness_monitor()
 
-    def wifi_detect():
+            dump_aux_info()
 
-        try:
-            tmp = sp.check_output(f'ifconfig'.split()).decode().split()
-            if 'wlan' in tmp:
-                print(f'{Fmt.GREEN}(aux.py) wifi detected{Fmt.END}')
-                return True
-            else:
-                print(f'{Fmt.GRAY}(aux.py) wifi NOT detected{Fmt.END}')
-                return False
 
-        except Exception as e:
-            print(f'(aux.py) wifi_detect {str(e)}' )
-            return False
+# auto-started when loading this module
+def init():
 
+    global AUX_INFO, SYSMON, ZITA_KEEPER
 
-    global AUX_INFO, WIFI_DETECTED
+    SYSMON = SysmonSampler( period=CONFIG.get('sysmon_period', 5) )
+    SYSMON.start()
+    if SYSMON.ifaces:
+        print(f'{Fmt.GREEN}(aux.py) wifi detected{Fmt.END}')
+    else:
+        print(f'{Fmt.GRAY}(aux.py) wifi NOT detected{Fmt.END}')
 
-    WIFI_DETECTED = wifi_detect()
+    # Multiroom receiver: retrying in background the remote senders
+    # that were offline at start
+    ZITA_KEEPER = ZitaLinkKeeper()
+    if [ x for x in CONFIG['sources'] if 'remote' in x ]:
+        ZITA_KEEPER.start()
 
-    AUX_INFO = {    'amp':                  'off',
-                    'loudness_monitor':     0.0,
+    AUX_INFO = {    'amp':                  manage_amp_switch( 'state' ),
+                    'loudness_monitor':     get_loudness_monitor(),
                     'last_macro':           '',
                     'warning':              '',
                     'peq_set':              get_peq_in_use(),
@@ -603,83 +465,71 @@ def init():
     observer2.start()
 
 
+# COMMANDS REGISTRY, built once (see miscel/dispatch.py)
+#   'dump': the AUX_INFO file needs to be updated after the command
+_query = lambda f: command(f, readonly=True)
+
+COMMANDS = {
+
+    'peak_monitor_running':         _query( lambda arg: process_is_running('peak_monitor.py') ),
+    'get_bf_today_peaks':           _query( lambda arg: get_bf_peaks('today') ),
+    'get_bf_peaks':                 _query( get_bf_peaks ),
+    'get_bf_peaks_summary':         _query( get_bf_peaks_summary ),
+    'get_macros':                   _query( lambda arg: get_macros() ),
+    'get_loudness_monitor':         _query( lambda arg: get_loudness_monitor() ),
+    'get_lu_monitor':               _query( lambda arg: get_loudness_monitor() ),
+    'info':                         _query( lambda arg: get_aux_info() ),
+    'get_web_config':               _query( lambda arg: get_web_config() ),
+    'get_loudspeaker_sample_rates': _query( lambda arg: get_loudspeaker_sample_rates() ),
+    'help':                         _query( lambda arg: get_help() ),
+
+    'play_url':                     command( play_url,  ('word',) ),
+    'reset_loudness_monitor':       command( lambda arg: manage_lu_monitor('reset') ),
+    'reset_lu_monitor':             command( lambda arg: manage_lu_monitor('reset') ),
+    'set_loudness_monitor_scope':   command( lambda arg: manage_lu_monitor(f'scope={arg}'),
+                                             ('enum', ('album', 'track')) ),
+    'set_lu_monitor_scope':         command( lambda arg: manage_lu_monitor(f'scope={arg}'),
+                                             ('enum', ('album', 'track')) ),
+    'zita_j2n':                     command( zita_j2n ),
+    'restart_to_sample_rate':       command( restart_to_sample_rate, ('float', 1, None) ),
+
+    'amp_switch':                   command( amp_switch,
+                                             ('enum', ('on', 'off', 'toggle', 'state')),
+                                             dump=True ),
+    'run_macro':                    command( run_macro,          dump=True ),
+    'peq_bypass':                   command( peq_bypass,
+                                             ('enum', ('on', 'off', 'toggle', 'get')),
+                                             dump=True ),
+    'peq_load':                     command( peq_load,  ('word',), dump=True ),
+    'warning':                      command( manage_warning_msg,
+                                             ('enum', ('set', 'perm', 'clear', 'get', 'expire')),
+                                             log=False, dump=True ),
+    'alert_new_eq_graph':           command( lambda arg: alert_new_eq_graph(),
+                                             log=False, dump=True )
+}
+
+
 # Interface function for this module
 def do( cmd, arg=None ):
     """ input:  command [, arg]
         output: an execution result string
     """
 
-    cmd = cmd.lower()
-
+    entry = COMMANDS.get( cmd.lower() )
+    if not entry:
+        return f'(aux) bad command \'{cmd}\''
 
-    # Dump AUX_INFO is NOT needed
-    if   cmd == 'peak_monitor_running':
-        result = process_is_running('peak_monitor.py')
+    arg = arg or ''
 
-    elif cmd == 'get_bf_today_peaks':
-        result = get_bf_peaks(only_today=True)
+    err = check_arg( entry["arg"], arg )
+    if err:
+        return f'(aux) {cmd}: {err}'
 
-    elif cmd == 'get_macros':
-        result = get_macros()
-
-    elif cmd == 'play_url':
-        result = play_url(arg)
-
-    elif cmd == 'reset_loudness_monitor' or cmd == 'reset_lu_monitor':
-        result = manage_lu_monitor('reset')
-
-    elif cmd == 'set_loudness_monitor_scope' or cmd == 'set_lu_monitor_scope':
-        result = manage_lu_monitor(f'scope={arg}')
-
-    elif cmd == 'get_loudness_monitor' or cmd == 'get_lu_monitor':
-        result = get_loudness_monitor()
-
-    elif cmd == 'info':
-        result = AUX_INFO
-
-    elif cmd == 'zita_j2n':
-        result = zita_j2n(arg)
-
-    elif cmd == 'get_web_config':
-        result = get_web_config()
-
-    elif cmd == 'get_loudspeaker_sample_rates':
-        result = get_loudspeaker_sample_rates()
-
-    elif cmd == 'restart_to_sample_rate':
-        result = restart_to_sample_rate(arg)
-
-    elif cmd == 'help':
-        result = get_help()
-
-
-    # Dump AUX_INFO is needed
-    else:
-
-        if   cmd == 'amp_switch':
-            result = manage_amp_switch(arg)
-
-        elif cmd == 'run_macro':
-            result = run_macro(arg)
-
-        elif cmd == 'peq_bypass':
-            result = peq_bypass(arg)
-
-        elif cmd == 'peq_load':
-            result = peq_load(arg)
-
-        elif cmd == 'warning':
-            result = manage_warning_msg(arg)
-
-        elif cmd == 'alert_new_eq_graph':
-            result = alert_new_eq_graph()
-
-        else:
-            return f'(aux) bad command \'{cmd}\''
+    result = entry["func"]( arg )
 
+    if entry.get("dump"):
         dump_aux_info()
 
-
     return result
 
 
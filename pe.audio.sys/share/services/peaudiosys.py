@@ -10,86 +10,249 @@
 """
 
 import  json
-from    time                import  strftime
+import  queue
+from    time                import  time
 import  os
 import  sys
+import  threading
 
 UHOME = os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share')
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
-from    services    import  preamp
-from    services    import  players
-from    services    import  aux
+import  timeline
 
-from    config      import  LOG_FOLDER
+with timeline.phase('import preamp'):
+    from    services    import  preamp
+with timeline.phase('import players'):
+    from    services    import  players
+with timeline.phase('import aux'):
+    from    services    import  aux
+
+from    config      import  CONFIG, LOG_FOLDER
 from    fmt         import  Fmt
+from    dispatch    import  must_log
+from    journal     import  Journal
+from    client      import  send_cmd
 
 
-# COMMAND LOG FILE
+# THE COMMANDS JOURNAL, flushed in background to a rotating log file
 logFname = f'{LOG_FOLDER}/peaudiosys_cmd.log'
-if os.path.exists(logFname) and os.path.getsize(logFname) > 10e6:
-    print ( f"{Fmt.RED}(peaudiosys) log file exceeds ~ 10 MB '{logFname}'{Fmt.END}" )
+JOURNAL  = Journal(logFname)
 print ( f"{Fmt.BLUE}(peaudiosys) logging commands in '{logFname}'{Fmt.END}" )
 
 
-# Interface function for this module
-def do( cmd_phrase ):
+# This module is thread safe, so server.py can serve clients concurrently.
+# The preamp module serializes its own state changes (and merges rapid
+# relative level changes from concurrent clients), the players and aux
+# modules are serialized here.
+THREADED  = True
+LOCKS     = { 'player':  threading.Lock(),
+              'aux':     threading.Lock() }
+
+# server.py will pass the client address to do()
+PASS_CLIADDR = True
+
+# The service modules command registries (read only and logging flags)
+REGISTRIES = { 'preamp':  preamp.COMMANDS,
+               'player':  players.COMMANDS,
+               'aux':     aux.COMMANDS }
+
+
+def push_to_remote_volume(rec):
+    """ A journal subscriber that pushes the level related records
+        to the local remote_volume_daemon plugin.
+    """
+    if rec["prefix"] != 'preamp' or \
+       rec["cmd"] not in ('level', 'volume', 'lu_offset', 'loudness',
+                          'eq_loudness', 'equal_loudness'):
+        return
+
+    send_cmd( f'journal {json.dumps(rec)}', sender='peaudiosys', timeout=1,
+              port=CONFIG['peaudiosys_port'] + 5 )
+
+
+if 'remote_volume_daemon.py' in CONFIG['plugins']:
+    JOURNAL.subscribe( push_to_remote_volume )
+
+
+# STATE AND METADATA SUBSCRIBERS, e.g. multiroom receivers mirroring us.
+# (see the session mode in server.py and miscel/mirror.py)
+SUBSCRIBERS = []
+SUBS_LOCK   = threading.Lock()
+LAST_PUSHED = { 'state_version': -1, 'meta': None }
+
+# Updates pending to be sent to a subscriber, it will be dropped if exceeded
+SUBS_QUEUE_SIZE = 100
+
+
+class Subscriber(object):
+    """ Sends the updates from its own thread, so that a stalled receiver
+        will not block the notifier. If its queue overflows, the
+        subscriber is dropped and its session is closed.
+    """
+
+    def __init__(self, send):
+        self.send   = send
+        self.queue  = queue.Queue(maxsize=SUBS_QUEUE_SIZE)
+        self.alive  = True
+        threading.Thread( name='subscriber', target=self._run,
+                          daemon=True ).start()
+
+
+    def put(self, update):
+        """ returns False if the subscriber is to be dropped
+        """
+        if not self.alive:
+            return False
+        try:
+            self.queue.put_nowait(update)
+            return True
+        except queue.Full:
+            self.close()
+            return False
+
+
+    def close(self):
+        self.alive = False
+        # (i) ends the server session (see server.py)
+        close = getattr(self.send, 'close', None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+
+
+    def _run(self):
+        while True:
+            update = self.queue.get()
+            if not self.alive:
+                return
+            try:
+                self.send(update)
+            except Exception as e:
+                print( f'(peaudiosys) subscriber error: {str(e)}' )
+                self.close()
+
 
-    def read_cmd_phrase(cmd_phrase):
+def notify_subscribers(*dummy):
+    """ Queues the state and/or metadata to the subscribers, if changed
+        since the last push. Called on every preamp state change and
+        when the players metadata changes, so it must not block.
+    """
+    if not SUBSCRIBERS:
+        return
 
-        # (i) command phrase SYNTAX must start with an appropriate prefix:
-        #           preamp  command  arg1 ...
-        #           players command  arg1 ...
-        #           aux     command  arg1 ...
-        #     The 'preamp' prefix can be omited
+    with SUBS_LOCK:
 
-        pfx, cmd, argstring = '', '', ''
+        update = {}
 
-        # This is to avoid empty values when there are more
-        # than on space as delimiter inside the cmd_phrase:
-        chunks = [x for x in cmd_phrase.split(' ') if x]
+        if preamp.preamp.state_version != LAST_PUSHED['state_version']:
+            LAST_PUSHED['state_version'] = preamp.preamp.state_version
+            update['state'] = json.loads( preamp.preamp.get_state_json() )
 
-        # If not prefix, will treat as a preamp command kind of
-        if not chunks[0] in ('preamp', 'player', 'aux'):
-            chunks.insert(0, 'preamp')
-        pfx = chunks[0]
+        if players.CURRENT_MD != LAST_PUSHED['meta']:
+            LAST_PUSHED['meta'] = players.CURRENT_MD
+            update['meta'] = players.CURRENT_MD
 
-        if chunks[1:]:
-            cmd = chunks[1]
-        if chunks[2:]:
-            # <argstring> can be compound
-            argstring = ' '.join( chunks[2:] )
+        if not update:
+            return
 
-        return pfx, cmd, argstring
+        for sub in list(SUBSCRIBERS):
+            if not sub.put(update):
+                print( f'(peaudiosys) dropping a stalled subscriber' )
+                SUBSCRIBERS.remove(sub)
 
 
+def subscribe(send):
+    """ send(update) will be called with the changed items, as
+        {'state': {...}, 'meta': {...}}, the first call brings both.
+
+        returns: the function to unsubscribe
+    """
+    sub = Subscriber(send)
+
+    with SUBS_LOCK:
+        sub.put( { 'state':  json.loads( preamp.preamp.get_state_json() ),
+                   'meta':   players.CURRENT_MD } )
+        SUBSCRIBERS.append(sub)
+
+    def unsubscribe():
+        with SUBS_LOCK:
+            if sub in SUBSCRIBERS:
+                SUBSCRIBERS.remove(sub)
+        sub.alive = False
+        # wakes up the sender thread
+        try:
+            sub.queue.put_nowait({})
+        except queue.Full:
+            pass
+
+    return unsubscribe
+
+
+preamp.preamp.state_listeners.append( notify_subscribers )
+players.META_SUBSCRIBERS.append( notify_subscribers )
+
+
+def read_cmd_phrase(cmd_phrase):
+
+    # (i) command phrase SYNTAX must start with an appropriate prefix:
+    #           preamp  command  arg1 ...
+    #           players command  arg1 ...
+    #           aux     command  arg1 ...
+    #     The 'preamp' prefix can be omited
+
+    pfx, cmd, argstring = '', '', ''
+
+    # This is to avoid empty values when there are more
+    # than on space as delimiter inside the cmd_phrase:
+    chunks = [x for x in cmd_phrase.split(' ') if x]
+
+    # If not prefix, will treat as a preamp command kind of
+    if not chunks[0] in ('preamp', 'player', 'aux'):
+        chunks.insert(0, 'preamp')
+    pfx = chunks[0]
+
+    if chunks[1:]:
+        cmd = chunks[1]
+    if chunks[2:]:
+        # <argstring> can be compound
+        argstring = ' '.join( chunks[2:] )
+
+    return pfx, cmd, argstring
+
+
+# Interface function for this module
+def do( cmd_phrase, cliaddr=('', 0) ):
+
     result = f'(peaudiosys) nothing done'
     cmd_phrase = cmd_phrase.strip()
 
     if cmd_phrase:
 
+        t0 = time()
+
         pfx, cmd, args = read_cmd_phrase( cmd_phrase )
         #print('pfx:', pfx, '| cmd:', cmd, '| args:', args) # DEBUG
 
-        result = {  'preamp':   preamp.do,
-                    'player':   players.do,
-                    'aux':      aux.do
-                  }[ pfx ]( cmd, args )
+        if pfx == 'preamp':
+            result = preamp.do( cmd, args )
+
+        else:
+            with LOCKS[pfx]:
+                result = {  'player':   players.do,
+                            'aux':      aux.do
+                          }[ pfx ]( cmd, args )
 
         if type(result) != str:
             result = json.dumps(result)
 
-        # Avoids logging non-relevant commands
-        if  ('state'        not in cmd)  and \
-            ('state'        not in args) and \
-            ('get_'         not in cmd)  and \
-            ('warning'      not in cmd)  and \
-            ('info'         not in cmd):
-
-            logline = f'{strftime("%Y/%m/%d %H:%M:%S")}; {cmd_phrase}; {result}'
-
-            with open(logFname, 'a') as FLOG:
-                    FLOG.write(f'{logline}\n')
+        # Logging as per the command registry of the service module,
+        # (i) the journal does not do any file I/O here
+        if must_log( REGISTRIES[pfx], cmd, args ):
+            JOURNAL.record( pfx, cmd, args, result, duration=time() - t0,
+                            client=cliaddr[0] )
 
     return result
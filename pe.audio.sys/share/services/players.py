@@ -39,6 +39,9 @@ from  miscel                        import  get_spotify_plugin,         \
                                             read_mpd_config,            \
                                             send_cmd, is_IP, Fmt
 
+from  dispatch                      import  command, check_arg
+from  mirror                        import  RemoteMirror
+
 from  players_mod.mpd_mod           import  mpd_control,                \
                                             mpd_meta,                   \
                                             mpd_playlist,               \
@@ -65,6 +68,14 @@ SOURCES = CONFIG["sources"]
 # The runtime metadata variable and the loop refresh period in seconds
 CURRENT_MD          = PLAYER_METATEMPLATE.copy()
 MD_REFRESH_PERIOD   = 2
+MD_LOCK             = threading.Lock()
+
+# Functions to be called as func(md) when CURRENT_MD changes
+META_SUBSCRIBERS    = []
+
+# The mirror of the remote system for a remoteXXXX source {(host, port): RemoteMirror}
+REMOTE_MIRRORS      = {}
+MIRRORS_LOCK        = threading.Lock()
 
 
 def clear_cdda_stuff():
@@ -102,6 +113,56 @@ def clear_cdda_stuff():
 
 
 
+def remote_addr(source):
+    """ For a 'remote.....' named source, it is expected to have
+        an IP address kind of in its jack_pname field:
+            jack_pname:  X.X.X.X:PPPP
+        (i) if not given we assume that the remote pe.audio.sys listen
+            at standard 9990 port
+
+        returns: (host, port), or ('', 0) if not valid
+    """
+    host = SOURCES[source]["jack_pname"].split(':')[0]
+    port = SOURCES[source]["jack_pname"].split(':')[-1]
+
+    if not is_IP(host):
+        return '', 0
+
+    if not port.isdigit():
+        port = 9990
+
+    return host, int(port)
+
+
+def get_remote_mirror(source):
+    """ The mirror of the remote system for the given remote source,
+        mirrors for other remote systems are stopped.
+    """
+    key = remote_addr(source)
+
+    def on_meta(md):
+        # only while the remote source is still selected
+        if read_state_from_disk()['input'] == source:
+            store_meta( add_source_to_meta( md.copy(), source ) )
+
+    with MIRRORS_LOCK:
+
+        for k in [ x for x in REMOTE_MIRRORS if x != key ]:
+            REMOTE_MIRRORS.pop(k).stop()
+
+        if key[0] and key not in REMOTE_MIRRORS:
+            REMOTE_MIRRORS[key] = RemoteMirror( *key, on_meta=on_meta )
+            REMOTE_MIRRORS[key].start()
+
+        return REMOTE_MIRRORS.get(key)
+
+
+def stop_remote_mirrors():
+    with MIRRORS_LOCK:
+        for k in list( REMOTE_MIRRORS ):
+            REMOTE_MIRRORS.pop(k).stop()
+
+
 def remote_get_meta(host, port=9990):
     """ Get metadata from a remote pe.audio.sys system
     """
@@ -133,6 +194,9 @@ def get_meta():
     source      = read_state_from_disk()['input']
     source_port = read_state_from_disk()['input_port']
 
+    if not source.startswith('remote'):
+        stop_remote_mirrors()
+
     if 'librespot' in source or 'spotify' in source.lower():
 
         if get_spotify_plugin() == 'desktop':
@@ -160,21 +224,22 @@ def get_meta():
 
     elif source.startswith('remote'):
 
-        # For a 'remote.....' named source, it is expected to have
-        # an IP address kind of in its jack_pname field:
-        #   jack_pname:  X.X.X.X:PPPP
-        # so this way we can query metadata from the remote address.
-        host = SOURCES[source]["jack_pname"].split(':')[0]
-        port = SOURCES[source]["jack_pname"].split(':')[-1]
-        if is_IP(host):
-            if not port.isdigit():
-                port = 9990
-            md = remote_get_meta( host, port )
-
-    # If there is no artist, let's use the source name
+        # The remote metadata is pushed to the mirror, otherwise
+        # (e.g. an older remote system) it is queried.
+        mirror = get_remote_mirror(source)
+        if mirror and mirror.connected and mirror.meta:
+            md = mirror.meta.copy()
+        elif mirror:
+            md = remote_get_meta( mirror.host, mirror.port )
+
+    return add_source_to_meta(md, source)
+
+
+def add_source_to_meta(md, source):
+    """ If there is no artist, let's use the source name
+    """
     if not md['artist']:
         md['artist'] = f'- {source.upper()} -'
-
     return md
 
 
@@ -221,18 +286,14 @@ def playback_control(cmd, arg=''):
         result = mpd_control(cmd, arg)
 
     elif source.startswith('remote'):
-        # For a 'remote.....' named source, it is expected to have
-        # an IP address kind of in its jack_pname field:
-        #   jack_pname:  X.X.X.X:PPPP
-        # so this way we can query metadata from the remote address.
-        host = SOURCES[source]["jack_pname"].split(':')[0]
-        port = SOURCES[source]["jack_pname"].split(':')[-1]
-
-        # (i) we assume that the remote pe.audio.sys listen at standard 9990 port
-        if is_IP(host):
-            if not port.isdigit():
-                port = 9990
-            result = remote_player_control( cmd=cmd, arg=arg, host=host, port=port )
+
+        # Forwarded through the mirror session if available
+        mirror = get_remote_mirror(source)
+        if mirror:
+            result = mirror.ask( f'player {cmd} {arg}', timeout=.5 )
+            if result is None:
+                result = remote_player_control( cmd=cmd, arg=arg,
+                                                host=mirror.host, port=mirror.port )
 
     return result
 
@@ -301,6 +362,30 @@ def get_all_info():
             }
 
 
+def store_meta(md):
+    """ Updates the global runtime variable CURRENT_MD and its disk file,
+        then notifies the subscribers, only if changed.
+    """
+    global CURRENT_MD
+
+    with MD_LOCK:
+
+        if md == CURRENT_MD:
+            return
+
+        CURRENT_MD = md
+
+        # Save metadata to disk file.
+        with open(PLAYER_META_PATH, 'w') as f:
+            f.write( json.dumps( CURRENT_MD ) )
+
+    for func in META_SUBSCRIBERS:
+        try:
+            func(md)
+        except Exception as e:
+            print( f'(players.py) metadata subscriber error: {str(e)}' )
+
+
 # Autoexec when loading this module
 def loop_getting_metadata():
     """ This init function will thread the storing metadata LOOP FOREVER
@@ -308,16 +393,9 @@ def loop_getting_metadata():
 
     def store_meta_loop(period=2):
 
-        global CURRENT_MD
-
         while True:
 
-            # Update the global runtime variable CURRENT_MD
-            CURRENT_MD = get_meta()
-
-            # Save metadata to disk file.
-            with open(PLAYER_META_PATH, 'w') as f:
-                f.write( json.dumps( CURRENT_MD ) )
+            store_meta( get_meta() )
 
             # Wait for period
             sleep(period)
@@ -328,50 +406,65 @@ def loop_getting_metadata():
     meta_loop.start()
 
 
-# Main interface function for this module
-def do(cmd, arg):
-    """ Entry interface function for a parent server.py listener.
-        - in:   a command phrase
-        - out:  a string result (dicts are json dumped)
+def eject(*dummy):
+    """ (i) Must be a clean eject
     """
+    print(f'{Fmt.MAGENTA}(players.py) ejecting disc...{Fmt.END}')
+    clear_cdda_stuff()
+    Popen( 'eject'.split() )
+    sleep(1)
+    return 'ordered'
 
-    result = f'(players.py) error with {cmd} {arg}'
 
-    if cmd in ( 'state', 'stop', 'pause', 'play', 'next', 'previous',
-                'rew', 'ff', 'play_track'):
-        result = playback_control( cmd, arg )
+def _playback(cmd):
+    return lambda arg: playback_control( cmd, arg )
 
-    elif cmd == 'volume':
-        result = playback_control( cmd, arg )
 
-    elif cmd == 'random_mode':
-        result = random_control(arg)
+def _playlists(cmd):
+    return lambda arg: playlists_control( cmd, arg )
 
-    elif cmd == 'get_meta':
-        result = CURRENT_MD
 
-    elif cmd == 'get_all_info':
-        result = get_all_info()
+# COMMANDS REGISTRY, built once (see miscel/dispatch.py)
+COMMANDS = {
 
-    elif cmd == 'get_cd_track_nums':
-        result = playlists_control( cmd, arg )
+    'state':                command( _playback('state'),                readonly=True ),
+    'get_meta':             command( lambda arg: CURRENT_MD,            readonly=True ),
+    'get_all_info':         command( lambda arg: get_all_info(),        readonly=True ),
+    'get_cd_track_nums':    command( _playlists('get_cd_track_nums'),   readonly=True ),
+    'get_playlist':         command( _playlists('get_playlist'),        readonly=True ),
+    'get_playlists':        command( _playlists('get_playlists'),       readonly=True ),
 
-    elif '_playlist' in cmd:
-        result = playlists_control( cmd, arg )
+    'load_playlist':        command( _playlists('load_playlist'),  ('word',) ),
+    'clear_playlist':       command( _playlists('clear_playlist') ),
+    'random_mode':          command( random_control, ('enum', ('on', 'off', 'toggle', 'get')) ),
+    'volume':               command( _playback('volume') ),
+    'eject':                command( eject )
+}
 
-    # (i) Must be a clean eject
-    elif cmd == 'eject':
+for _cmd in ('stop', 'pause', 'play', 'next', 'previous', 'rew', 'ff', 'play_track'):
+    COMMANDS[_cmd] = command( _playback(_cmd) )
 
-        print(f'{Fmt.MAGENTA}(players.py) ejecting disc...{Fmt.END}')
-        clear_cdda_stuff()
-        Popen( 'eject'.split() )
-        result = 'ordered'
-        sleep(1)
 
-    else:
-        result = f'(players) unknown command \'{cmd}\''
+# Main interface function for this module
+def do(cmd, arg):
+    """ Entry interface function for a parent server.py listener.
+        - in:   a command phrase
+        - out:  a string result (dicts are json dumped)
+    """
 
-    return result
+    entry = COMMANDS.get(cmd)
+
+    if not entry:
+        # Other player specific playlist commands
+        if '_playlist' in cmd:
+            return playlists_control( cmd, arg )
+        return f'(players) unknown command \'{cmd}\''
+
+    err = check_arg( entry["arg"], arg )
+    if err:
+        return f'(players) {cmd}: {err}'
+
+    return entry["func"]( arg )
 
 
 # Autoexec when loading this module
@@ -8,25 +8,39 @@
 """
 
 import  sys
+import  os
+import  json
 from    os.path             import expanduser
+from    time                import sleep
+import  threading
 
 UHOME = expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
-from    config                  import  CONFIG
+from    config                  import  CONFIG, SCENES_PATH
 from    miscel                  import  get_remote_zita_params, \
                                         remote_zita_restart
-from    preamp_mod.core         import  Preamp, Convolver
+from    preamp_mod.core         import  Preamp, Convolver, \
+                                        normalize_state_value
+from    dispatch                import  command, check_arg, is_readonly
+from    brutefir_mod            import  BF_RUNTIME, init as init_brutefir_mod
 
 # INITIATE A PREAMP INSTANCE
 preamp = Preamp()
 if 'powersave' in CONFIG and CONFIG["powersave"] == True:
     preamp.powersave('on')
-preamp.save_state()
+if 'truepeak_guard' in CONFIG and CONFIG["truepeak_guard"] == True:
+    preamp.truepeak_guard('on')
 
 # INITIATE A CONVOLVER INSTANCE (XO and DRC management)
 convolver = Convolver()
 
+# The Brutefir runtime model is verified periodically from here
+BF_RUNTIME.start_verifier()
+
+# Dumping the current EQ graph, if server side PNG graphs are used
+init_brutefir_mod()
+
 # Import CamillaDSP (currently only used for an optional compressor)
 if CONFIG["use_compressor"]:
 
@@ -36,202 +50,502 @@ if CONFIG["use_compressor"]:
 
 # Anyway the compresor stage is baypassed at startup
 preamp.state["compressor"] = 'off'
+preamp.save_state()
 
 
-# Interface function for this module
-def do( cmd, argstring ):
-    """ Processes commands for audio control
+class Coalescer(object):
+    """ Merges relative level, balance, bass and treble changes that arrive
+        within a short time window (e.g. spinning a mouse wheel or holding
+        a remote key), so that they are validated and applied just once.
 
-        (i) The full_command sintax:  <command> [arg [add] ]
-            'arg' is given only with some commands,
-                  as an option for relative values ordering.
+        The first submitter of a batch becomes the leader: it waits for
+        the window to collect further increments from other clients, then
+        applies the accumulated amount per parameter. Every client in the
+        batch receives the final applied value of its parameter, as read
+        back from the preamp state, or the error if nothing was applied.
+
+        If a merged increment is refused (e.g. not enough headroom), the
+        increments are tried one by one as they arrived, so the parameter
+        goes as far as it can.
+
+        (i) Needs a threaded server, otherwise commands arrive one by one
+            and each one will be applied after the window delay.
     """
 
-    def analize_arg_add(argstring):
-        """ returns a tuple ( <arg>, <add:True|False> )
-        """
+    WINDOW = 0.05       # seconds
 
-        arg, add = '', False
+    SETTERS = { 'level':    preamp.set_level,
+                'balance':  preamp.set_balance,
+                'bass':     preamp.set_bass,
+                'treble':   preamp.set_treble }
 
-        args_list = argstring.replace('\r', '').replace('\n', '').split()
 
-        if args_list[0:]:
-            if args_list[-1] == 'add':
-                add = True
-                arg = ' '.join( args_list[:-1] )
-            else:
-                arg = ' '.join( args_list[:] )
+    def __init__(self):
+        self.cond       = threading.Condition()
+        self.pending    = {}        # {param: [increments, ...]}
+        self.batch      = 0         # the batch being collected
+        self.has_leader = False
+        self.results    = {}        # {batch: {param: result}}
 
-        return (arg, add)
 
-    # (i) Below we use *dummy to accommodate the parser mechanism wich
-    # will include two arguments for any call here, even when not necessary.
+    def submit(self, param, value):
 
-    # 'mono' is a former command, here it is redirected to 'midside'
-    def set_mono(x, *dummy):
-        try:
-            x = { 'on':     'mid',
-                  'off':    'off',
-                  'toggle': { 'off':'mid', 'side':'off', 'mid':'off'
-                             } [ preamp.state['midside'] ]
-                } [x]
-            return preamp.set_midside(x)
-        except:
-            return 'bad option'
+        with self.cond:
+
+            self.pending.setdefault(param, []).append(value)
+            my_batch = self.batch
+
+            if self.has_leader:
+                while my_batch not in self.results:
+                    self.cond.wait()
+                return self.results[my_batch][param]
+
+            self.has_leader = True
+
+        # Leader: collecting increments from other clients
+        sleep(self.WINDOW)
+
+        with self.cond:
+            pending, self.pending = self.pending, {}
+            self.batch     += 1
+            self.has_leader = False
+
+        results = self.apply(pending)
+
+        with self.cond:
+            self.results[my_batch] = results
+            # older batches were already read by their clients
+            for b in [x for x in self.results if x < my_batch - 16]:
+                del self.results[b]
+            self.cond.notify_all()
+
+        return results[param]
+
+
+    def apply(self, pending):
+
+        results = {}
+
+        with preamp.lock:
+
+            for param, increments in pending.items():
+
+                try:
+                    setter = self.SETTERS[param]
+                    result = setter( round(sum(increments), 2), True )
 
+                    if result != 'done' and len(increments) > 1:
+                        for inc in increments:
+                            if setter(inc, True) == 'done':
+                                result = 'done'
+                            else:
+                                break
 
-    # The management of the convolver objet needs to update <preamp.state>
-    def set_drc(x, *dummy):
-        result = convolver.set_drc(x)
-        if result == 'done':
-            preamp.state['drc_set'] = x
-            # The drc impulse max gain response and its coeff attenuation are
-            # taken into account when preamp computes the digital headroom
-            drc_headroom = convolver.get_drc_headroom( x )
-            preamp.update_drc_headroom( drc_headroom )
-        return result
+                    # The final applied value is the reply to all clients
+                    if result == 'done':
+                        result = str( preamp.state[param] )
 
+                except Exception as e:
+                    result = f'(preamp) {param} ERROR: {str(e)}'
 
-    def set_xo(x, *dummy):
-        result = convolver.set_xo(x)
-        if result == 'done':
-            preamp.state['xo_set'] = x
-        return result
+                results[param] = result
 
+            preamp.save_state()
 
-    def add_delay(x, *dummy):
-        """ Add outputs delay, typically for multiroom listening
-        """
-        result = convolver.add_delay(float(x))
-        if result == 'done':
-            preamp.state['extra_delay'] = float(x)
-        return result
+        return results
 
 
-    def select_source(x, *dummy):
-        """ A wrapper to ensure the remote zita-j2n audio sender process
-            for remoteXXXX kind of sources
-        """
-        result = preamp.select_source(x)
+COALESCER = Coalescer()
 
-        if result == 'done' and 'remote' in x:
-            raddr, rport, zport = get_remote_zita_params(x)
-            if raddr:
-                remote_zita_restart(raddr, rport, zport)
+# Commands that can be coalesced when ordered as relative changes ('add')
+COALESCABLE = { 'level':    'level',
+                'volume':   'level',
+                'balance':  'balance',
+                'bass':     'bass',
+                'treble':   'treble' }
 
-        return result
+# Served from a threaded server (see server.py)
+THREADED = True
 
+# Audio settings stored in a scene
+SCENE_KEYS = ( 'input', 'xo_set', 'drc_set', 'target', 'level',
+               'equal_loudness', 'lu_offset', 'bass', 'treble',
+               'midside', 'extra_delay', 'compressor' )
 
-    def manage_compressor(x, *dummy):
+# Settings that can be given at once to 'set_levels'
+LEVEL_KEYS = ( 'level', 'balance', 'bass', 'treble', 'lu_offset',
+               'equal_loudness' )
 
-        res = 'not available'
 
-        if not CONFIG["use_compressor"]:
-            return res
+def read_scenes():
+    """ returns the stored scenes dict {name: {key: value, ...}, ...}
+    """
+    try:
+        with open(SCENES_PATH, 'r') as f:
+            return json.loads( f.read() )
+    except:
+        return {}
 
-        x = x.split()
-        oper = arg = ''
-        if x:
-            oper = x[0]
-            if x[1:]:
-                arg = x[1]
 
-        if not oper:
-            if not 'compressor' in preamp.state:
-                preamp.state["compressor"] = 'off'
-            return preamp.state["compressor"]
+def write_scenes(scenes):
+    """ The scenes file is replaced atomically, so that it will not be
+        found half written.
+    """
+    tmp_path = f'{SCENES_PATH}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write( json.dumps(scenes, indent=1) )
+    os.replace(tmp_path, SCENES_PATH)
+
+
+def analize_arg_add(argstring):
+    """ returns a tuple ( <arg>, <add:True|False> )
+    """
 
-        # Proceed and get the result
-        tmp = cdsp.compressor(oper, arg)
+    arg, add = '', False
 
-        # Not a valid result
-        if type(tmp) == str:
-            res = tmp
+    args_list = argstring.replace('\r', '').replace('\n', '').split()
 
-        # a valid result
+    if args_list[0:]:
+        if args_list[-1] == 'add':
+            add = True
+            arg = ' '.join( args_list[:-1] )
         else:
-            active     = tmp["active"]
-            parameters = tmp["parameters"]
+            arg = ' '.join( args_list[:] )
+
+    return (arg, add)
+
+
+# (i) Below we use *dummy to accommodate the parser mechanism wich
+# will include two arguments for any call here, even when not necessary.
+
+# 'mono' is a former command, here it is redirected to 'midside'
+def set_mono(x, *dummy):
+    try:
+        x = { 'on':     'mid',
+              'off':    'off',
+              'toggle': { 'off':'mid', 'side':'off', 'mid':'off'
+                         } [ preamp.state['midside'] ]
+            } [x]
+        return preamp.set_midside(x)
+    except:
+        return 'bad option'
+
+
+# The management of the convolver objet needs to update <preamp.state>
+def set_drc(x, *dummy):
+    result = convolver.set_drc(x)
+    if result == 'done':
+        preamp.state['drc_set'] = x
+        # The drc impulse max gain response and its coeff attenuation are
+        # taken into account when preamp computes the digital headroom
+        drc_headroom = convolver.get_drc_headroom( x )
+        preamp.update_drc_headroom( drc_headroom )
+    return result
+
 
-            if active:
-                res = parameters["ratio"]
-                preamp.state["compressor"] = res
+def set_xo(x, *dummy):
+    result = convolver.set_xo(x)
+    if result == 'done':
+        preamp.state['xo_set'] = x
+    return result
+
+
+def add_delay(x, *dummy):
+    """ Add outputs delay, typically for multiroom listening
+    """
+    result = convolver.add_delay(float(x))
+    if result == 'done':
+        preamp.state['extra_delay'] = float(x)
+    return result
+
+
+def select_source(x, *dummy):
+    """ A wrapper to ensure the remote zita-j2n audio sender process
+        for remoteXXXX kind of sources
+    """
+    result = preamp.select_source(x)
+
+    if result == 'done' and 'remote' in x:
+        raddr, rport, zport = get_remote_zita_params(x)
+        if raddr:
+            remote_zita_restart(raddr, rport, zport)
+
+    return result
 
-            else:
-                res = 'off'
-                preamp.state["compressor"] = res
 
+def manage_compressor(x, *dummy):
+
+    res = 'not available'
+
+    if not CONFIG["use_compressor"]:
         return res
 
+    x = x.split()
+    oper = arg = ''
+    if x:
+        oper = x[0]
+        if x[1:]:
+            arg = x[1]
+
+    if not oper:
+        if not 'compressor' in preamp.state:
+            preamp.state["compressor"] = 'off'
+        return preamp.state["compressor"]
 
-    def print_help(*dummy):
-        return open(f'{UHOME}/pe.audio.sys/doc/peaudiosys.hlp', 'r').read()
+    # Proceed and get the result
+    tmp = cdsp.compressor(oper, arg)
 
+    # Not a valid result
+    if type(tmp) == str:
+        res = tmp
+
+    # a valid result
+    else:
+        active     = tmp["active"]
+        parameters = tmp["parameters"]
+
+        if active:
+            res = parameters["ratio"]
+            preamp.state["compressor"] = res
+
+        else:
+            res = 'off'
+            preamp.state["compressor"] = res
+
+    return res
+
+
+def manage_scene(x, *dummy):
+    """ Stored audio scenes:
+
+            list | save NAME | recall NAME | delete NAME
+
+        (i) Recalling applies the scene differences as a single
+            target state (see Preamp.apply_state)
+    """
+
+    x = x.split()
+    oper = name = ''
+    if x:
+        oper = x[0]
+        name = ' '.join(x[1:])
+
+    scenes = read_scenes()
+
+    if oper == 'list':
+        return list( scenes.keys() )
+
+    if not name:
+        return 'needs a scene name'
+
+    if oper == 'save':
+        scenes[name] = { k: preamp.state[k] for k in SCENE_KEYS
+                                            if k in preamp.state }
+        write_scenes(scenes)
+        return 'done'
+
+    if name not in scenes:
+        return f'unknown scene \'{name}\''
+
+    if oper == 'delete':
+        del scenes[name]
+        write_scenes(scenes)
+        return 'done'
+
+    if oper != 'recall':
+        return 'bad option'
+
+    scene = scenes[name]
+    warnings = []
+    prev_input = preamp.state["input"]
+
+    # Ensure the convolver is running before applying audio settings.
+    if not preamp.state["convolver_runs"]:
+        preamp.switch_convolver('on')
+
+    target = preamp.state.copy()
+    for k in SCENE_KEYS:
+        if k in scene and k not in ('extra_delay', 'compressor'):
+            target[k] = scene[k]
+
+    result = preamp.apply_state(target, convolver=convolver)
+    if result != 'done':
+        warnings.append(result)
+
+    if 'extra_delay' in scene and \
+       scene["extra_delay"] != preamp.state.get("extra_delay"):
+        if add_delay( scene["extra_delay"] ) != 'done':
+            warnings.append( f'extra delay \'{scene["extra_delay"]}\' not valid' )
+
+    if 'compressor' in scene and CONFIG["use_compressor"] and \
+       scene["compressor"] != preamp.state.get("compressor"):
+        if scene["compressor"] == 'off':
+            manage_compressor('off')
+        else:
+            manage_compressor( f'set {scene["compressor"]}' )
+            manage_compressor('on')
+
+    # Ensure the remote zita-j2n audio sender for remoteXXXX sources
+    if preamp.state["input"] != prev_input and 'remote' in preamp.state["input"]:
+        raddr, rport, zport = get_remote_zita_params(preamp.state["input"])
+        if raddr:
+            remote_zita_restart(raddr, rport, zport)
+
+    if not warnings:
+        return 'done'
+    return '; '.join(warnings)
+
+
+def set_levels(x, *dummy):
+    """ Sets some level related settings at once from a JSON dictionary, e.g.:
+
+            set_levels {"level": -20.0, "lu_offset": 6.0, "equal_loudness": true}
+
+        (i) applied as a single target state (see Preamp.apply_state)
+    """
+    try:
+        levels = json.loads(x)
+    except:
+        return 'bad JSON dictionary'
+
+    if type(levels) != dict or not levels:
+        return 'bad JSON dictionary'
+
+    unknown = [ k for k in levels if k not in LEVEL_KEYS ]
+    if unknown:
+        return f'unknown keys: {" ".join(unknown)}'
+
+    target = preamp.state.copy()
+
+    # All values are validated before applying anything
+    for k, v in levels.items():
+        try:
+            key, value = normalize_state_value(k, v)
+            target[key] = value
+        except:
+            return f'bad value for \'{k}\': {v}'
+
+    return preamp.apply_state(target, convolver=convolver)
+
+
+def print_help(*dummy):
+    return open(f'{UHOME}/pe.audio.sys/doc/peaudiosys.hlp', 'r').read()
+
+
+# COMMANDS REGISTRY, built once:
+#   'func':     the function to be called with ( arg, add )
+#   'arg':      the argument schema (see miscel/dispatch.py)
+#   'readonly': if so the state file will not be saved,
+#               neither the command will be logged.
+#   'nolock':   served without waiting for the preamp lock
+SWITCH      = ('on', 'off')
+ONOFF       = ('on', 'off', 'toggle', 'true', 'false')
+
+_query      = lambda f: command(f, readonly=True)
+_bass       = ('float', -preamp.bass_span,   preamp.bass_span)
+_treble     = ('float', -preamp.treble_span, preamp.treble_span)
+_balance    = ('float', -preamp.balance_max, preamp.balance_max)
+
+COMMANDS = {
+
+    'state':            command( preamp.get_state_json, readonly=True, nolock=True ),
+    'status':           command( preamp.get_state_json, readonly=True, nolock=True ),
+    'get_state':        command( preamp.get_state_json, readonly=True, nolock=True ),
+    'state_version':    command( preamp.get_state_version, readonly=True, nolock=True ),
+    'get_inputs':       _query( preamp.get_inputs ),
+    'get_eq':           _query( preamp.get_eq ),
+    'eq_curve':         _query( preamp.get_eq_curve ),
+    'get_eq_curve':     _query( preamp.get_eq_curve ),
+    'get_target_sets':  _query( preamp.get_target_sets ),
+    'get_drc_sets':     _query( convolver.get_drc_sets ),
+    'get_xo_sets':      _query( convolver.get_xo_sets ),
+    'get_bf_runtime':   _query( lambda arg, *dummy: BF_RUNTIME.get( verify=(arg == 'verify') ) ),
+
+    'input':            command( select_source,             ('word',) ),
+    'source':           command( select_source,             ('word',) ),
+    'solo':             command( preamp.set_solo,           ('enum', ('off', 'l', 'left', 'r', 'right')) ),
+    'mono':             command( set_mono,                  ('enum', ('on', 'off', 'toggle')) ),
+    'midside':          command( preamp.set_midside,        ('enum', ('mid', 'side', 'off')) ),
+    'polarity':         command( preamp.set_polarity,       ('enum', ('+', '-', '++', '--', '+-', '-+')) ),
+    'mute':             command( preamp.set_mute,           ('enum', ONOFF) ),
+    'subsonic':         command( preamp.set_subsonic,       ('enum', ('off', 'mp', 'lp', 'toggle', 'rotate')) ),
+    'swap_lr':          command( preamp.swap_lr ),
+    'lr_swap':          command( preamp.swap_lr ),
+
+    'level':            command( preamp.set_level,          ('float',) ),
+    'volume':           command( preamp.set_level,          ('float',) ),
+    'balance':          command( preamp.set_balance,        _balance ),
+    'treble':           command( preamp.set_treble,         _treble ),
+    'bass':             command( preamp.set_bass,           _bass ),
+    'tone_defeat':      command( preamp.set_tone_defeat,    ('enum', ONOFF) ),
+    'loudness':         command( preamp.set_equal_loudness, ('enum', ONOFF) ),
+    'eq_loudness':      command( preamp.set_equal_loudness, ('enum', ONOFF) ),
+    'equal_loudness':   command( preamp.set_equal_loudness, ('enum', ONOFF) ),
+    'lu_offset':        command( preamp.set_lu_offset,      ('float',) ),
+    'set_target':       command( preamp.set_target,         ('word',) ),
+    'set_levels':       command( set_levels ),
+
+    'set_drc':          command( set_drc,                   ('word',) ),
+    'drc':              command( set_drc,                   ('word',) ),
+    'set_xo':           command( set_xo,                    ('word',) ),
+    'xo':               command( set_xo,                    ('word',) ),
+    'add_delay':        command( add_delay,                 ('float', 0, None) ),
+
+    'compressor':       command( manage_compressor ),
+
+    'scene':            command( manage_scene,              ('enum', ('list', 'save', 'recall', 'delete')),
+                                 queries=('list',) ),
+
+    'convolver':        command( preamp.switch_convolver,   ('enum', SWITCH) ),
+    'powersave':        command( preamp.powersave,          ('enum', SWITCH) ),
+    'truepeak_guard':   command( preamp.truepeak_guard,     ('enum', SWITCH) ),
+
+    'help':             _query( print_help )
+}
+
+
+# Interface function for this module
+def do( cmd, argstring ):
+    """ Processes commands for audio control
+
+        (i) The full_command sintax:  <command> [arg [add] ]
+            'arg' is given only with some commands,
+                  as an option for relative values ordering.
+    """
+
+    entry = COMMANDS.get( cmd.lower() )
+    if not entry:
+        return f'(preamp) unknown command: \'{cmd}\''
+
+    # The pre-serialized state is served as is, no need to wait for
+    # pending state changes.
+    if entry.get("nolock"):
+        return entry["func"]()
 
     # extract 'add' option for relative changes
     arg, add = analize_arg_add(argstring)
 
-    # COMMAND PROCESSING by parsing the command to his related function:
-    try:
-        result = {
-
-            'state':            preamp.get_state,
-            'status':           preamp.get_state,
-            'get_state':        preamp.get_state,
-            'get_inputs':       preamp.get_inputs,
-            'get_eq':           preamp.get_eq,
-            'get_target_sets':  preamp.get_target_sets,
-            'get_drc_sets':     convolver.get_drc_sets,
-            'get_xo_sets':      convolver.get_xo_sets,
-
-            'input':            select_source,
-            'source':           select_source,
-            'solo':             preamp.set_solo,
-            'mono':             set_mono,
-            'midside':          preamp.set_midside,
-            'polarity':         preamp.set_polarity,
-            'mute':             preamp.set_mute,
-            'subsonic':         preamp.set_subsonic,
-            'swap_lr':          preamp.swap_lr,
-            'lr_swap':          preamp.swap_lr,
-
-            'level':            preamp.set_level,
-            'volume':           preamp.set_level,
-            'balance':          preamp.set_balance,
-            'treble':           preamp.set_treble,
-            'bass':             preamp.set_bass,
-            'tone_defeat':      preamp.set_tone_defeat,
-            'loudness':         preamp.set_equal_loudness,
-            'eq_loudness':      preamp.set_equal_loudness,
-            'equal_loudness':   preamp.set_equal_loudness,
-            'lu_offset':        preamp.set_lu_offset,
-            'set_target':       preamp.set_target,
-
-            'set_drc':          set_drc,
-            'drc':              set_drc,
-            'set_xo':           set_xo,
-            'xo':               set_xo,
-            'add_delay':        add_delay,
-
-            'compressor':       manage_compressor,
-
-            'convolver':        preamp.switch_convolver,
-            'powersave':        preamp.powersave,
-
-            'help':             print_help
-
-            } [ cmd.lower() ] ( arg, add )
-
-        # ************************************
-        # ** KEEPING UPDATED THE STATE FILE **
-        # ************************************
-        if result:
-            preamp.save_state()
+    err = check_arg( entry["arg"], arg, relative=add )
+    if err:
+        return f'(preamp) {cmd}: {err}'
+
+    # Rapid relative changes are merged
+    # ('level xx ramp Ns add' is not a rapid change, so it will not be merged)
+    if add and cmd.lower() in COALESCABLE and not 'ramp' in arg:
+        return COALESCER.submit( COALESCABLE[cmd.lower()], round(float(arg.split()[0]), 2) )
+
+    # (i) state changes are serialized, the server can be a threaded one
+    with preamp.lock:
+        try:
+            result = entry["func"]( arg, add )
 
-    except KeyError:
-        result = f'(preamp) unknown command: \'{cmd}\''
+            # ************************************
+            # ** KEEPING UPDATED THE STATE FILE **
+            # ************************************
+            if result and not is_readonly(entry, arg):
+                preamp.save_state()
 
-    except Exception as e:
-        result = f'(preamp) {cmd} ERROR: {str(e)}'
+        except Exception as e:
+            result = f'(preamp) {cmd} ERROR: {str(e)}'
 
     return result
@@ -6,7 +6,7 @@
 
 import sys
 import os
-from   subprocess import Popen, check_output
+from   subprocess import Popen
 import json
 import numpy as np
 from   time import sleep
@@ -21,10 +21,11 @@ sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 sys.path.append( THISDIR )
 
 from config import  STATE_PATH, CONFIG, EQ_FOLDER, EQ_CURVES, TONE_MEMO_PATH, \
-                    LSPK_FOLDER, LDMON_PATH, MAINFOLDER
+                    LSPK_FOLDER, MAINFOLDER
 
-from miscel import  read_state_from_disk, read_json_from_file, get_peq_in_use, \
-                    time_sec2mmss, Fmt, calc_gain
+from miscel import  read_state_from_disk, get_peq_in_use, Fmt, calc_gain
+
+from signal_detector import SignalDetector
 
 USE_AMIXER = False
 try:
@@ -36,180 +37,104 @@ except Exception as e:
 
 ZEROS = np.zeros( EQ_CURVES["freqs"].shape[0] )
 
-# Aux to manage the powersave feature (auto start/stop Brutefir process)
-def powersave_loop( convolver_off_driver, convolver_on_driver,
-                    end_loop_flag, reset_elapsed_flag ):
-    """ Loops forever every 1 sec reading the dBFS level on preamp input.
-        If detected signal is below NOISE_FLOOR during MAX_WAIT then stops
-        Brutefir. If signal level raises, then resumes Brutefir.
-
-        Events managed here:
-        convolver_off_driver:   Will set when no detected signal
-        convolver_on_driver:    Will set when detected signal
-        end_loop_flag:          Will check on every loop
-        reset_elapsed_flag:     Will check and clear, useful when switching
-                                to a no signal source to avoid killing brutefir
-                                suddenly (see Preamp.select_source#NewSource)
+# Level ramps control rate (steps per second)
+RAMP_RATE = 20
+
+# The Preamp: audio processor, selector, and system state keeper ===============
+def normalize_state_value(prop, value):
+    """ Translates a config.yml setting (on_init, on_change_input ...)
+        into a state dictionary (key, value).
+        A ValueError is raised if the value is not valid.
     """
+    # Some keys can be formerly named:
+    key = { 'xo': 'xo_set', 'drc': 'drc_set' }.get(prop, prop)
 
+    if key in ('level', 'bass', 'treble', 'balance', 'lu_offset'):
+        value = round( float(value), 2 )
 
-    def read_loudness_monitor():
-        # Lets use LU_M (LU Momentary) from .loudness_monitor
-        d = read_json_from_file(LDMON_PATH, timeout=1)
-        if 'LU_M' in d:
-            LU_M = d["LU_M"]
-        else:
-            LU_M = 0.0
-        dBFS = LU_M - 23.0  # LU_M is referred to -23dBFS
-        return dBFS
+    elif key in ('muted', 'equal_loudness', 'tone_defeat'):
+        value = { 'false': False, 'off': False,
+                  'true' : True,  'on' : True } [ str(value).lower() ]
 
+    elif key == 'subsonic':
+        if value not in ('off', 'mp', 'lp'):
+            raise ValueError
 
-    def loudness_monitor_is_running():
-        try:
-            check_output('pgrep -f loudness_monitor.py'.split()).decode()
-            return True
-        except:
-            return False
-
-
-    # Default values:
-    NOISE_FLOOR = -70
-    MAX_WAIT    =  60
-    # CONFIG values overrides:
-    if "powersave_noise_floor" in CONFIG:
-        NOISE_FLOOR = CONFIG["powersave_noise_floor"]
-    if "powersave_minutes" in CONFIG:
-        MAX_WAIT = CONFIG["powersave_minutes"] * 60
-
-    # Using a level meter, loudness_monitor.py is preferred,
-    # if not available will use level_meter.py
-    loud_mon_available = loudness_monitor_is_running()
-    if loud_mon_available:
-        print( f'(powersave) using \'loudness_monitor.py\'' )
-    else:
-        # Prepare and start a level_meter.Meter instance
-        sys.path.append( f'{MAINFOLDER}/share/audiotools' )
-        from level_meter import Meter
-        meter = Meter(device='pre_in_loop', mode='peak', bar=False)
-        meter.start()
-        print( f'(powersave) using \'level_meter.py\'' )
-
-    # Loop forever each 1 sec will check signal level
-    print(f'(powersave) running')
-    lowSigElapsed = 0
-    while True:
-
-        if reset_elapsed_flag.isSet():
-            lowSigElapsed = 0
-            reset_elapsed_flag.clear()
-
-        # Reading level
-        if loud_mon_available:
-            dBFS = read_loudness_monitor()
-        else:
-            dBFS = meter.L
+    elif key == 'midside':
+        if value not in ('mid', 'side', 'off'):
+            raise ValueError
 
-        # Level detected
-        if dBFS > NOISE_FLOOR:
-            if not bf.is_running():
-                print(f'(powersave) signal detected, requesting to restart Brutefir')
-                convolver_on_driver.set()
-            lowSigElapsed = 0
-        else:
-            lowSigElapsed +=1
+    elif key == 'polarity':
+        value = { '+': '++', '-': '--' }.get(value, value)
+        if value not in ('++', '--', '+-', '-+'):
+            raise ValueError
 
-        # No level detected
-        if dBFS < NOISE_FLOOR and lowSigElapsed >= MAX_WAIT:
-            if bf.is_running():
-                print(f'(powersave) low level during {time_sec2mmss(MAX_WAIT, mode="__m__s")}, '
-                       'requesting to stop Brutefir' )
-                convolver_off_driver.set()
+    elif key == 'solo':
+        value = { 'left': 'l', 'right': 'r' }.get( str(value).lower(),
+                                                   str(value).lower() )
+        if value not in ('off', 'l', 'r'):
+            raise ValueError
 
-        # Break loop
-        if end_loop_flag.isSet():
-            break
+    # (i) input, target, xo_set and drc_set are validated when applied
+    elif key in ('input', 'target', 'xo_set', 'drc_set'):
+        value = str(value)
 
-        sleep(1)
+    else:
+        raise ValueError
+
+    return key, value
 
 
-# The Preamp: audio processor, selector, and system state keeper ===============
 def init_audio_settings():
-    """ Forcing if indicated on config.yml or restoring last state from disk
+    """ Forcing if indicated on config.yml or restoring last state from disk.
+
+        The on_init settings are merged into a target state that is
+        applied at once (see Preamp.apply_state)
     """
 
-    def try_init(prop):
-        """ Try to set a value defined under CONFIG['on_init'][prop]
-            Returns a warning or an empty string
-        """
-        value = CONFIG["on_init"][prop]
+    # temporary Preamp and Convolver instances
+    preamp    = Preamp()
+    convolver = Convolver()
+    warnings  = []
+
+    # DEFAULTS
+    if not 'subsonic' in CONFIG['on_init'] or not CONFIG['on_init']['subsonic']:
+        CONFIG['on_init']['subsonic'] = 'off'
+
+    # Iterate over config.on_init to prepare the target state:
+    target = preamp.state.copy()
+
+    for prop, value in CONFIG['on_init'].items():
 
         # Skipping if not defined
         if value is None:
-            return ''
+            continue
 
         # Manage the special key 'max_level'
         if prop == 'max_level':
-            value = min( value, preamp.state["level"] )
+            value = min( value, target["level"] )
             prop = 'level'
 
-        func = {
-                'xo':               convolver.set_xo,
-                'drc':              convolver.set_drc,
-                'input':            preamp.select_source,
-                'target':           preamp.set_target,
-                'level':            preamp.set_level,
-                'muted':            preamp.set_mute,
-                'bass':             preamp.set_bass,
-                'treble':           preamp.set_treble,
-                'balance':          preamp.set_balance,
-                'subsonic':         preamp.set_subsonic,
-                'equal_loudness':   preamp.set_equal_loudness,
-                'lu_offset':        preamp.set_lu_offset,
-                'midside':          preamp.set_midside,
-                'polarity':         preamp.set_polarity,
-                'solo':             preamp.set_solo
-                }[prop]
-
-        # Some keys can be formerly named:
-        if prop == 'xo':
-            state_prop = 'xo_set'
-        elif prop == 'drc':
-            state_prop = 'drc_set'
-        else:
-            state_prop = prop
+        if prop == 'input':
+            if value != 'none' and value not in preamp.inputs:
+                warnings.append( f'{Fmt.RED}bad {prop}:{value}{Fmt.END}' )
+                continue
+            target = preamp._source_target( value, target )
 
-        # Processing
-        warning = ''
-        if func( value ) == 'done':
-            preamp.state[state_prop] = value
-            print('(on_init)', prop, value)
         else:
-            warning = f'{Fmt.RED}bad {prop}:{value}{Fmt.END}'
-            print('(on_init)', warning)
-            # Using last state
-            value = preamp.state[state_prop]
-            if func( value ) != 'done':
-                # This should never happen:
-                warning = f'{Fmt.RED}{Fmt.BOLD} BAD STATE {prop}:{value}{Fmt.END}'
-
-        return warning
-
-
-    # temporary Preamp and Convolver instances
-    preamp    = Preamp()
-    convolver = Convolver()
-    warnings  = ''
-
+            try:
+                key, value = normalize_state_value(prop, value)
+                target[key] = value
+            except:
+                warnings.append( f'{Fmt.RED}bad {prop}:{value}{Fmt.END}' )
+                continue
 
-    # DEFAULTS
-    if not 'subsonic' in CONFIG['on_init'] or not CONFIG['on_init']['subsonic']:
-        CONFIG['on_init']['subsonic'] = 'off'
+        print('(on_init)', prop, value)
 
-    # Iterate over config.on_init:
-    for prop in CONFIG['on_init']:
-        warning = try_init(prop)
-        if warning:
-            warnings += f'{warning}, '
+    # Applying, forcing all settings because the convolver was just started
+    result = preamp.apply_state( target, convolver=convolver, force=True )
+    if result != 'done':
+        warnings.append( f'{Fmt.RED}{result}{Fmt.END}' )
 
     # saving state to disk, then closing tmp instances
     preamp.save_state()
@@ -220,8 +145,8 @@ def init_audio_settings():
         print( f'{Fmt.BLUE}(core.on_init) done.{Fmt.END}' )
         return 'done'
     else:
-        print( f'(core.on_init) {warnings[:-2]}' )
-        return warnings[:-2]
+        print( f'(core.on_init) {", ".join(warnings)}' )
+        return ', '.join(warnings)
 
 
 def connect_monitors():
@@ -242,13 +167,18 @@ class Preamp(object):
             treble_span
             gain_max        max authorised gain
             balance_max     max authorised balance
+            lock            a reentrant lock to serialize state changes
+                            when served from a threaded server
 
         methods:
 
             save_state      save state dict to disk
 
+            apply_state     applies a whole target state at once
+
             select_source
             set_level
+            ramp_level
             set_balance
             set_bass
             set_treble
@@ -264,6 +194,7 @@ class Preamp(object):
             get_inputs
             get_target_sets
             get_eq
+            get_eq_curve
 
             convolver       stops or resume Brutefir (energy saving)
 
@@ -273,6 +204,9 @@ class Preamp(object):
     # Preamp INIT
     def __init__(self):
 
+        # Serializes state changes
+        self.lock = threading.RLock()
+
         # The available inputs
         self.inputs = CONFIG["sources"]
 
@@ -323,6 +257,14 @@ class Preamp(object):
         self.state["jack_buffer"] = jack.JCLI.blocksize
         self.state["jack_device"] = jack.get_device()
 
+        # The serialized state served to clients (see save_state)
+        self.state_json    = ''
+        self.state_version = 0
+
+        # Functions to be called as func() on every state change,
+        # (i) from inside the state lock, so they must not block.
+        self.state_listeners = []
+
         # UPDATE STATE FILE
         self.save_state()
 
@@ -333,14 +275,30 @@ class Preamp(object):
         # taken into account when Preamp validates the digital headroom
         self.drc_headroom = 0.0
 
+        # Optional true peak guard: a level_meter.Meter instance measuring
+        # the preamp input true peak (see truepeak_guard)
+        self.tp_meter = None
+        self.state["truepeak_guard"] = False
+
+        # The last EQ curves sent to Brutefir, served to the web page
+        # in order to plot the EQ graph (see get_eq_curve)
+        self.eq_curve = {}
+        self.eq_curve_version = 0
+        # The serialized EQ for get_eq
+        self.eq_cache = {}
+        self.eq_cache_version = -1
+
+        # The stop flag (threading.Event) of a running level ramp
+        self.ramp_stop = None
+
         # Powersave
         #   State file info
         self.state["powersave"] = False
         #
-        #   Powersave loop: breaking flag
-        self.ps_end = threading.Event()
+        #   The signal detector (see powersave)
+        self.ps_detector = None
         #
-        #   Powersave loop:reset elapsed low level detected counter flag
+        #   Reset elapsed low level detected counter flag
         self.ps_reset_elapsed = threading.Event()
         #
         #   Convolver driving events
@@ -353,6 +311,8 @@ class Preamp(object):
                 print(f'(core) Thread \'waits for convolver OFF\' received event')
                 self.ps_convolver_off.clear()
                 self.switch_convolver('off')
+                with self.lock:
+                    self.save_state()
         #
         def wait_PS_convolver_on():
             """ Event handler for convolver switch on requests
@@ -363,6 +323,8 @@ class Preamp(object):
                 print(f'(core) Thread \'waits for convolver ON\' received event')
                 self.ps_convolver_on.clear()
                 self.switch_convolver('on')
+                with self.lock:
+                    self.save_state()
         #
         self.ps_convolver_off = threading.Event()
         self.ps_convolver_on  = threading.Event()
@@ -455,6 +417,27 @@ class Preamp(object):
         return ['none'] + sorted(result)
 
 
+    def _loud_index(self, candidate):
+        """ The loudness compensation curve index for the candidate level.
+            Using the previously detected flat curve index and
+            also limiting as per the eq_loud_ceil boolean inside config.yml
+        """
+        index_max   = EQ_CURVES["loud_mag"].shape[0] - 1
+        index_flat  = CONFIG['refSPL']
+        index_min   = 0
+        if CONFIG["eq_loud_ceil"]:
+            index_max = index_flat
+
+        if candidate["equal_loudness"]:
+            index = CONFIG['refSPL'] + candidate["level"]
+        else:
+            index = index_flat
+        index = int(round(index))
+
+        # Clamp index to the available "loudness deepness" curves set
+        return max( min(index, index_max), index_min )
+
+
     def _calc_eq_curve(self, cname, candidate):
         """ Retrieves the tone or loudness curve
             Tone curves depens on candidate-state bass & treble.
@@ -479,21 +462,7 @@ class Preamp(object):
         # Using the previously detected flat curve index and
         # also limiting as per the eq_loud_ceil boolean inside config.yml
         elif cname == 'loud':
-
-            index_max   = EQ_CURVES["loud_mag"].shape[0] - 1
-            index_flat  = CONFIG['refSPL']
-            index_min   = 0
-            if CONFIG["eq_loud_ceil"]:
-                index_max = index_flat
-
-            if candidate["equal_loudness"]:
-                index = CONFIG['refSPL'] + candidate["level"]
-            else:
-                index = index_flat
-            index = int(round(index))
-
-            # Clamp index to the available "loudness deepness" curves set
-            index = max( min(index, index_max), index_min )
+            index = self._loud_index( candidate )
 
 
         return EQ_CURVES[f'{cname}_mag'][index], \
@@ -545,32 +514,66 @@ class Preamp(object):
 
 
     def powersave(self, mode, *dummy):
-        """ on:  Initiate a threaded powersave_loop signal monitor job.
-            off: Flags to break the loop then will termitate the threaded job.
+        """ on:  Starts a signal detector on the preamp input, it will
+                 request to switch off the convolver after a while with
+                 no signal, and to switch it on when the signal arrives.
+            off: Stops the signal detector.
         """
 
         if mode == 'on':
-            ps_job = threading.Thread( name='powersave LOOP',
-                                       target=powersave_loop,
-                                       args=( self.ps_convolver_off,
-                                              self.ps_convolver_on,
-                                              self.ps_end,
-                                              self.ps_reset_elapsed ) )
-            ps_job.start()
+            if not self.ps_detector:
+                kwargs = {}
+                if "powersave_noise_floor" in CONFIG:
+                    kwargs["noise_floor"] = CONFIG["powersave_noise_floor"]
+                if "powersave_minutes" in CONFIG:
+                    kwargs["max_wait"] = CONFIG["powersave_minutes"] * 60
+                # (i) A stopped convolver must be woken up by the first signal
+                self.ps_detector = SignalDetector( on_signal  = self.ps_convolver_on,
+                                                   on_silence = self.ps_convolver_off,
+                                                   reset_flag = self.ps_reset_elapsed,
+                                                   present    = bf.is_running(),
+                                                   **kwargs )
+                self.ps_detector.start()
             self.state["powersave"] = True
 
         elif mode == 'off':
-            self.ps_end.set()
-            # To ensure that powersave_loop 1 sec cicle can detect
-            # the ps_end flag, then terminate itself.
-            sleep(2)
-            self.ps_end.clear()
+            if self.ps_detector:
+                self.ps_detector.stop()
+                self.ps_detector = None
             self.state["powersave"] = False
 
         else:
             return 'bad option'
 
-        self._print_threads()
+        return 'done'
+
+
+    def truepeak_guard(self, mode, *dummy):
+        """ on:  Starts a 4x oversampled true peak meter on the preamp input,
+                 then level changes will be refused if the measured
+                 inter-sample peaks would clip at the convolver output.
+            off: Stops the meter.
+        """
+
+        if mode == 'on':
+            if not self.tp_meter:
+                sys.path.append( f'{MAINFOLDER}/share/audiotools' )
+                from level_meter import Meter
+                hold = CONFIG.get("truepeak_hold", 10)
+                self.tp_meter = Meter(device='pre_in_loop', mode='truepeak',
+                                      bar=False, hold=hold)
+                self.tp_meter.start()
+                print( f'(core) true peak guard running' )
+            self.state["truepeak_guard"] = True
+
+        elif mode == 'off':
+            if self.tp_meter:
+                self.tp_meter.stop()
+                self.tp_meter = None
+            self.state["truepeak_guard"] = False
+
+        else:
+            return 'bad option'
 
         return 'done'
 
@@ -589,6 +592,12 @@ class Preamp(object):
                 Popen(f'pkill -f  "brutefir.real brutefir_config"', shell=True)
                 sleep(2)
                 print(f'{Fmt.BLUE}{Fmt.BOLD}(core) STOPPING BRUTEFIR (!){Fmt.END}')
+                # The EQ will be applied again when resuming Brutefir
+                self.eq_curve = {}
+                bf.BF_RUNTIME.clear()
+                # A running signal detector will wake it up on signal
+                if self.ps_detector:
+                    self.ps_detector.present = False
                 result = 'done'
 
         elif mode == 'on':
@@ -618,15 +627,9 @@ class Preamp(object):
         return result
 
 
-    def _validate( self, candidate ):
-        """ Validates that the given 'candidate' (new state dictionary)
-            does not exceed gain limits
-
-            (i) USE_AMIXER (ALSA Mixer)
-
-                Brutefir will not compute the level value,
-                it will be applied at the sound card output mixer.
-
+    def _headroom( self, candidate ):
+        """ The digital headroom for the given 'candidate' state dictionary,
+            also returns the EQ curves that the candidate needs.
         """
         gmax            = self.gain_max
         gain            = calc_gain( candidate )
@@ -664,6 +667,30 @@ class Preamp(object):
 
         headroom += input_gain
 
+        return headroom, eq_mag, eq_pha
+
+
+    def _validate( self, candidate ):
+        """ Validates that the given 'candidate' (new state dictionary)
+            does not exceed gain limits
+
+            (i) USE_AMIXER (ALSA Mixer)
+
+                Brutefir will not compute the level value,
+                it will be applied at the sound card output mixer.
+
+        """
+        headroom, eq_mag, eq_pha = self._headroom( candidate )
+
+        # The static headroom assumes a 0 dBFS input signal, the optional
+        # true peak guard will refuse to reduce the headroom below the
+        # measured input inter-sample peaks (e.g. +1 dBTP on loud masters).
+        if self.tp_meter and headroom >= 0:
+            tp = self.tp_meter.L_max
+            cur_headroom = self.state.get("gain_headroom", headroom)
+            if headroom < cur_headroom and (headroom - tp) < 0:
+                return f'true peak would clip ({tp} dBTP)'
+
         # APPROVED
         if headroom >= 0:
 
@@ -686,6 +713,8 @@ class Preamp(object):
                     bf.set_gains( candidate, nolevel=True, dBextra=dBpending )
 
             bf.set_eq( eq_mag, eq_pha )
+            self.eq_curve = {'mag': eq_mag, 'pha': eq_pha}
+            self.eq_curve_version += 1
             self.state = candidate
             self.state["gain_headroom"] = round(headroom, 1)
             self.save_tone_memo()
@@ -698,8 +727,23 @@ class Preamp(object):
 
     def save_state(self):
         self.state["convolver_runs"] = bf.is_running()
+        self._update_snapshot()
         with open(STATE_PATH, 'w') as f:
-            f.write( json.dumps( self.state ) )
+            f.write( self.state_json )
+
+
+    def _update_snapshot(self):
+        """ The state is serialized just when it changes, so that
+            the frequent 'state' queries are served as is.
+        """
+        self.state_json     = json.dumps( self.state )
+        self.state_version += 1
+
+        for func in self.state_listeners:
+            try:
+                func()
+            except Exception as e:
+                print( f'(core) state listener error: {str(e)}' )
 
 
     def save_tone_memo(self):
@@ -713,11 +757,36 @@ class Preamp(object):
         return self.state
 
 
+    def get_state_json(self, *dummy):
+        return self.state_json
+
+
+    def get_state_version(self, *dummy):
+        return self.state_version
+
+
     def get_target_sets(self, *dummy):
         return self.target_sets
 
 
     def set_level(self, value, relative=False):
+
+        # 'xx ramp Ns' will fade to the given level
+        if type(value) == str and 'ramp' in value:
+            try:
+                value, duration = value.split('ramp')
+                duration = duration.strip()
+                if duration.endswith('ms'):
+                    duration = float(duration[:-2]) / 1000
+                else:
+                    duration = float(duration.rstrip('s'))
+            except:
+                return 'bad ramp syntax, e.g.: level -30 ramp 2s'
+            return self.ramp_level(value, duration, relative)
+
+        # A level command cancels any running ramp
+        self._cancel_ramp()
+
         candidate = self.state.copy()
         if relative:
             candidate["level"] += round(float(value), 2)
@@ -726,6 +795,87 @@ class Preamp(object):
         return self._validate( candidate )
 
 
+    def ramp_level(self, value, duration, relative=False):
+        """ Fades the level to the given value along 'duration' seconds.
+
+            The Brutefir level stage gains are interpolated at RAMP_RATE
+            steps per second, the EQ stage is updated only when the
+            loudness compensation curve changes. The target level is
+            validated in advance. A new level command cancels the ramp.
+        """
+        self._cancel_ramp()
+
+        target = self.state.copy()
+        if relative:
+            target["level"] += round(float(value), 2)
+        else:
+            target["level"] =  round(float(value), 2)
+
+        headroom, _, _ = self._headroom( target )
+        if headroom < 0:
+            return 'not enough headroom'
+
+        steps = int(duration * RAMP_RATE)
+        if steps < 2:
+            return self._validate( target )
+
+        stop = threading.Event()
+        self.ramp_stop = stop
+        ramp = threading.Thread( target=self._ramp_loop,
+                                 args=(target["level"], steps, stop),
+                                 daemon=True )
+        ramp.start()
+
+        return 'done'
+
+
+    def _ramp_loop(self, level1, steps, stop):
+        """ The level ramp thread (see ramp_level)
+        """
+        with self.lock:
+            level0     = self.state["level"]
+            loud_index = self._loud_index( self.state )
+
+        for i in range(1, steps + 1):
+
+            sleep( 1 / RAMP_RATE )
+
+            with self.lock:
+
+                if stop.is_set():
+                    return
+
+                candidate = self.state.copy()
+                candidate["level"] = round(level0 + (level1 - level0) * i / steps, 2)
+
+                # Full validation (includes EQ) only when loudness curve changes
+                if USE_AMIXER or self._loud_index( candidate ) != loud_index:
+                    loud_index = self._loud_index( candidate )
+                    if self._validate( candidate ) != 'done':
+                        break
+                else:
+                    bf.set_gains( candidate )
+                    self.state["level"] = candidate["level"]
+
+                # Clients will follow the ramp
+                self._update_snapshot()
+
+        with self.lock:
+            if stop.is_set():
+                return
+            # Settles EQ, headroom and tone memo for the final level
+            self._validate( self.state.copy() )
+            self.save_state()
+            if self.ramp_stop is stop:
+                self.ramp_stop = None
+
+
+    def _cancel_ramp(self):
+        if self.ramp_stop:
+            self.ramp_stop.set()
+            self.ramp_stop = None
+
+
     def set_balance(self, value, relative=False):
         candidate = self.state.copy()
         if relative:
@@ -933,70 +1083,45 @@ class Preamp(object):
             return 'bad option'
 
 
-    def get_eq(self, *dummy):
-        freq, mag , pha = bf.read_eq()
-        return { 'band': freq.tolist(), 'mag': mag.tolist(),
-                                        'pha': pha.tolist() }
+    def get_eq(self, mode='', *dummy):
+        """ The Brutefir EQ stage as last applied by the preamp.
 
+            mode 'verify' reads it back from Brutefir, as well if the
+            EQ has not been applied since Brutefir was restarted.
+        """
+        if mode == 'verify' or not self.eq_curve:
+            freq, mag , pha = bf.read_eq()
+            return { 'band': freq.tolist(), 'mag': mag.tolist(),
+                                            'pha': pha.tolist() }
 
-    def select_source(self, source, *dummy):
+        # Brutefir receives 3 decimal places values (see bf.set_eq)
+        if self.eq_cache_version != self.eq_curve_version:
+            self.eq_cache = { 'band': EQ_CURVES["freqs"].tolist(),
+                              'mag':  np.round(self.eq_curve["mag"], 3).tolist(),
+                              'pha':  np.round(self.eq_curve["pha"], 3).tolist() }
+            self.eq_cache_version = self.eq_curve_version
 
-        def try_select(source):
-            """ this is the source selector """
-            w = '' # warnings
+        return self.eq_cache
 
-            # clearing 'preamp' connections
-            jack.clear_preamp()
 
-            # connecting the new SOURCE to PREAMP input
-            # (i) Special case 'remoteXXX' source name can have a ':port' suffix
-            jport = CONFIG["sources"][source]["jack_pname"].split(':')[0]
-            res = jack.connect_bypattern(jport, 'pre_in')
+    def get_eq_curve(self, *dummy):
+        """ The current EQ curves, as sent to Brutefir, for the web page
+            to draw the EQ graph. 'version' changes on each EQ update.
+        """
+        if self.eq_curve:
+            mag = self.eq_curve["mag"]
+            pha = self.eq_curve["pha"]
+        else:
+            _, mag, pha = bf.read_eq()
 
-            if res == 'ordered':
-                self.state["input_port"] = jport
-            else:
-                w += res
+        return { 'version':      self.eq_curve_version,
+                 'linear_phase': CONFIG["bfeq_linear_phase"],
+                 'band':         EQ_CURVES["freqs"].tolist(),
+                 'mag':          np.round(mag, 2).tolist(),
+                 'pha':          np.round(pha, 2).tolist() }
 
 
-            # Trying to set the desired xo and drc for this source
-            c = Convolver()
-            try:
-                xo = CONFIG["sources"][source]["xo"]
-                if xo and c.set_xo( xo ) == 'done':
-                    self.state["xo_set"] = xo
-                elif xo:
-                    if w:
-                        w += '; '
-                    w += f'\'xo:{xo}\' in \'{source}\' is not valid'
-            except:
-                pass
-            try:
-                drc = CONFIG["sources"][source]["drc"]
-                if drc and c.set_drc( drc ) == 'done':
-                    self.state["drc_set"] = drc
-                elif drc:
-                    if w:
-                        w += '; '
-                    w += f'\'drc:{drc}\' in \'{source}\' is not valid'
-            except:
-                pass
-            del(c)
-
-            # end of trying to select the source
-            if not w:
-                return 'done'
-            else:
-                return w # warnings
-
-        def on_change_input_behavior(candidate):
-            try:
-                for option, value in CONFIG["on_change_input"].items():
-                    if value is not None:
-                        candidate[option] = value
-            except:
-                print('(core) config.yml: missing \'on_change_input\' options')
-            return candidate
+    def select_source(self, source, *dummy):
 
         result = 'nothing done'
 
@@ -1013,28 +1138,189 @@ class Preamp(object):
 
         # New source
         else:
-            result = try_select(source)
-            self.state["input"] = source
-            candidate = self.state.copy()
-            # Global audio settings on change input, but ensure the convolver
-            # is running before applying audio settings.
+            # Ensure the convolver is running before applying audio settings.
             if not self.state["convolver_runs"]:
                 self.ps_reset_elapsed.set()
                 self.switch_convolver('on')
-            candidate = on_change_input_behavior(candidate)
-            # Some source specific audio settings overrides global settings
-            # LU offset
-            if 'lu_offset' in CONFIG["sources"][source]:
-                candidate["lu_offset"] = \
-                               CONFIG["sources"][source]["lu_offset"]
-            # Target eq curve
-            if 'target' in CONFIG["sources"][source]:
-                candidate["target"] = CONFIG["sources"][source]["target"]
-            self._validate( candidate )
+            # Reselecting the current source will restore its connections
+            if source == self.state["input"]:
+                self._connect_source(source)
+            result = self.apply_state( self._source_target(source, self.state) )
 
         return result
 
 
+    def _source_target(self, source, state):
+        """ Returns a target state for selecting the given source:
+            global audio settings on change input, then the source
+            specific xo, drc, lu_offset and target settings.
+        """
+        target = state.copy()
+        target["input"] = source
+
+        if source == 'none':
+            return target
+
+        try:
+            for option, value in CONFIG["on_change_input"].items():
+                if value is not None:
+                    try:
+                        key, value = normalize_state_value(option, value)
+                        target[key] = value
+                    except:
+                        print(f'(core) config.yml: bad on_change_input \'{option}\'')
+        except:
+            print('(core) config.yml: missing \'on_change_input\' options')
+
+        # Some source specific audio settings overrides global settings
+        # (i) a zero lu_offset is a valid override, only blanks are skipped
+        for option in ('xo', 'drc', 'lu_offset', 'target'):
+            value = CONFIG["sources"][source].get(option)
+            if value is None or value == '':
+                continue
+            try:
+                key, value = normalize_state_value(option, value)
+                target[key] = value
+            except:
+                print(f'(core) config.yml: bad \'{option}\' in source \'{source}\'')
+
+        return target
+
+
+    def _connect_source(self, source):
+        """ Connects the source jack ports to the preamp input,
+            returns a warning string or ''
+        """
+        # clearing 'preamp' connections
+        jack.clear_preamp()
+
+        if source == 'none':
+            self.state["input_port"] = ''
+            return ''
+
+        # connecting the new SOURCE to PREAMP input
+        # (i) Special case 'remoteXXX' source name can have a ':port' suffix
+        jport = CONFIG["sources"][source]["jack_pname"].split(':')[0]
+        res = jack.connect_bypattern(jport, 'pre_in')
+
+        if res == 'ordered':
+            self.state["input_port"] = jport
+            return ''
+        else:
+            return res
+
+
+    def apply_state(self, target, convolver=None, force=False):
+        """ Applies a whole target state dictionary at once.
+
+            Only the settings that differ from the current state are
+            applied (all of them if 'force'), in this order:
+
+                mute, rewire the input, XO, DRC and subsonic coefficients,
+                a single validation for gains and EQ, unmute.
+
+            Not valid settings are skipped keeping the current ones.
+            Returns 'done' or a warnings string.
+        """
+
+        def changed(key):
+            return force or target.get(key) != self.state.get(key)
+
+
+        # A new target state cancels any running level ramp
+        self._cancel_ramp()
+
+        warnings = []
+
+        # The finally wanted mute state
+        muted = target.get("muted", self.state["muted"])
+
+        # Muting is needed when the audio path changes
+        must_mute = any( [ changed(x) for x in ('input', 'xo_set', 'drc_set', 'subsonic') ] )
+
+        if must_mute:
+            tmp = self.state.copy()
+            tmp["muted"] = True
+            bf.set_gains( tmp, nolevel=USE_AMIXER )
+
+        # (i) Whatever happens, the mute state will be settled
+        try:
+            # Input
+            if changed('input'):
+                if target.get("input") == 'none' or target.get("input") in self.inputs:
+                    w = self._connect_source( target["input"] )
+                    if w:
+                        warnings.append(w)
+                    self.state["input"] = target["input"]
+                else:
+                    warnings.append( f'unknown source \'{target.get("input")}\'' )
+
+            # Coefficients
+            if changed('xo_set') or changed('drc_set'):
+
+                if not convolver:
+                    convolver = Convolver()
+
+                if changed('xo_set') and target.get("xo_set"):
+                    if convolver.set_xo( target["xo_set"] ) == 'done':
+                        self.state["xo_set"] = target["xo_set"]
+                    else:
+                        warnings.append( f'xo set \'{target["xo_set"]}\' not valid' )
+                        if force and self.state["xo_set"]:
+                            convolver.set_xo( self.state["xo_set"] )
+
+                if changed('drc_set') and target.get("drc_set"):
+                    if convolver.set_drc( target["drc_set"] ) == 'done':
+                        self.state["drc_set"] = target["drc_set"]
+                    else:
+                        warnings.append( f'drc set \'{target["drc_set"]}\' not valid' )
+                        if force and self.state["drc_set"]:
+                            convolver.set_drc( self.state["drc_set"] )
+                    # The drc impulse max gain response and its coeff attenuation
+                    # are taken into account when validating the digital headroom
+                    self.drc_headroom = convolver.get_drc_headroom( self.state["drc_set"] )
+
+            if changed('subsonic') and target.get("subsonic"):
+                if bf.set_subsonic( target["subsonic"] ) == 'done':
+                    self.state["subsonic"] = target["subsonic"]
+                else:
+                    warnings.append( f'subsonic \'{target["subsonic"]}\' not available' )
+                    bf.set_subsonic( 'off' )
+                    self.state["subsonic"] = 'off'
+
+            # Gains and EQ, still muted if so
+            candidate = self.state.copy()
+            for key in ( 'level', 'balance', 'bass', 'treble', 'lu_offset',
+                         'equal_loudness', 'target', 'midside', 'polarity', 'solo' ):
+                if key in target:
+                    candidate[key] = target[key]
+
+            if candidate["target"] not in self.target_sets:
+                warnings.append( f'target \'{candidate["target"]}\' not available' )
+                candidate["target"] = self.state["target"]
+
+            candidate["muted"] = must_mute or muted
+
+            result = self._validate( candidate )
+
+            if result != 'done':
+                # keeping the current level
+                warnings.append( f'level {candidate["level"]}: {result}' )
+                candidate["level"] = self.state["level"]
+                self._validate( candidate )
+
+        finally:
+            # Unmute (also if the above was refused or interrupted)
+            if must_mute or self.state["muted"] != muted:
+                self.state["muted"] = muted
+                bf.set_gains( self.state, nolevel=USE_AMIXER )
+
+        if not warnings:
+            return 'done'
+        else:
+            return '; '.join(warnings)
+
+
     def get_inputs(self, *dummy):
         return [ x for x in self.inputs.keys() ]
 
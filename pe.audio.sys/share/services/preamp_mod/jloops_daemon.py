@@ -7,6 +7,20 @@
 """
     A daemon that provides the needed loops
     on Jack to pe.audio.sys to work.
+
+    Each loop keeps its own JACK client name (e.g. 'pre_in_loop'), because
+    the 'client:port' names are used everywhere to connect things.
+
+    Each loop runs in its own process, so that the realtime callback of a
+    loop (the main path 'pre_in_loop' above all) does not share the GIL
+    with the other loops, nor with the control fifo reader thread.
+    The process callback of every loop just copies its prebuilt
+    input/output port pairs.
+
+    Loops can be added or removed at runtime through by the control fifo:
+
+        echo 'add    xxxx_loop' > ~/pe.audio.sys/.jloops_control
+        echo 'remove xxxx_loop' > ~/pe.audio.sys/.jloops_control
 """
 # NOTICE:   This needs JACK to be running.
 #           Also, if jackd is interrupted, this will vanish.
@@ -14,19 +28,24 @@
 import os
 import yaml
 import jack
+import threading
 import multiprocessing as mp
 
 UHOME = os.path.expanduser("~")
+CTRL_PATH = f'{UHOME}/pe.audio.sys/.jloops_control'
+
+# (i) Loop processes are forked, so that they keep this daemon command
+#     line, as 'pkill -f jloops_daemon.py' is used to stop all of them.
+MP = mp.get_context('fork')
 
 
-def jack_loop(clientname, nports=2):
+def jack_loop(clientname, nports, shutdown):
     """ Creates a jack loop with given 'clientname'
         NOTICE: this process will keep running until broken,
-                so if necessary you'll need to thread this when calling here.
+                the 'shutdown' event is set if JACK shuts down.
     """
     # CREDITS:  https://jackclient-python.readthedocs.io/en/0.4.5/examples.html
 
-    # The jack module instance for our looping ports
     client = jack.Client(name=clientname, no_start_server=True)
 
     if client.status.name_not_unique:
@@ -34,45 +53,98 @@ def jack_loop(clientname, nports=2):
         print( f'(jack_loop) \'{clientname}\' already exists in JACK, nothing done.' )
         return
 
-    # Will use the multiprocessing.Event mechanism to keep this alive
-    event = mp.Event()
+    for n in range( nports ):
+        client.inports.register(f'input_{n+1}')
+        client.outports.register(f'output_{n+1}')
+
+    # The port table is built once, the callback does nothing else
+    # than copying each input buffer into its output buffer.
+    pairs = tuple( zip(client.inports, client.outports) )
 
-    # This sets the actual loop that copies frames from our capture to our playback ports
     @client.set_process_callback
     def process(frames):
-        assert len(client.inports) == len(client.outports)
-        assert frames == client.blocksize
-        for i, o in zip(client.inports, client.outports):
+        for i, o in pairs:
             o.get_buffer()[:] = i.get_buffer()
 
-    # If jack shutdowns, will trigger on 'event' so that the below 'whith client' will break.
     @client.set_shutdown_callback
-    def shutdown(status, reason):
+    def on_shutdown(status, reason):
         print('(jack_loop) JACK shutdown!')
         print('(jack_loop) JACK status:', status)
         print('(jack_loop) JACK reason:', reason)
-        # This triggers an event so that the below 'with client' will terminate
-        event.set()
+        shutdown.set()
 
-    # Create the ports
-    for n in range( nports ):
-        client.inports.register(f'input_{n+1}')
-        client.outports.register(f'output_{n+1}')
-    # client.activate() not needed, see below
-
-    # This is the keeping trick
     with client:
-        # When entering this with-statement, client.activate() is called.
-        # This tells the JACK server that we are ready to roll.
-        # Our above process() callback will start running now.
-
         print( f'(jack_loop) running {clientname}' )
         try:
-            event.wait()
+            shutdown.wait()
         except KeyboardInterrupt:
-            print('\n(jack_loop) Interrupted by user')
-        except:
-            print('\n(jack_loop)  Terminated')
+            pass
+
+
+class LoopHost(object):
+    """ .add(name)      starts a loop process with the given JACK client name
+        .remove(name)   terminates a loop process
+        .shutdown       an Event, set if JACK has shut down
+    """
+
+    def __init__(self):
+        self.loops      = {}
+        self.lock       = threading.Lock()
+        self.shutdown   = MP.Event()
+
+
+    def add(self, clientname, nports=2):
+
+        with self.lock:
+
+            loop = self.loops.get(clientname)
+            if loop and loop.is_alive():
+                return
+
+            loop = MP.Process( target=jack_loop,
+                               args=(clientname, nports, self.shutdown),
+                               daemon=True )
+            loop.start()
+            self.loops[clientname] = loop
+
+
+    def remove(self, clientname):
+
+        with self.lock:
+
+            loop = self.loops.pop(clientname, None)
+            if not loop:
+                return
+
+            loop.terminate()
+            loop.join()
+            print( f'(jack_loop) closed {clientname}' )
+
+
+def prepare_control_fifo(fname):
+    if os.path.exists(fname):
+        os.remove(fname)
+    os.mkfifo(fname)
+
+
+def control_fifo_read_loop(fname, host):
+    """ Loop forever listen for runtime commands through by the fifo:
+            'add    <clientname>'
+            'remove <clientname>'
+    """
+    while True:
+        with open(fname) as f:
+            for line in f:
+                try:
+                    action, clientname = line.split()
+                    if action == 'add':
+                        host.add(clientname)
+                    elif action == 'remove':
+                        host.remove(clientname)
+                    else:
+                        raise ValueError(f'bad action \'{action}\'')
+                except Exception as e:
+                    print( f'(jack_loop) bad command \'{line.strip()}\': {str(e)}' )
 
 
 def main():
@@ -80,15 +152,30 @@ def main():
         - a preamp loop
         - as loops as needed from the config.yml sources.
     """
-    # 1st: auto spawn the PREAMP loop ports
-    jloop = mp.Process( target=jack_loop, args=['pre_in_loop', 2] )
-    jloop.start()
+    host = LoopHost()
+
+    # 1st: the PREAMP loop ports
+    host.add('pre_in_loop', 2)
+
     # 2nd: the SOURCE's connection loop ports:
     for source in CONFIG['sources']:
         pname = CONFIG['sources'][source]['jack_pname']
         if 'loop' in pname:
-            jloop = mp.Process( target=jack_loop, args=(pname,) )
-            jloop.start()
+            host.add(pname)
+
+    # Runtime control
+    try:
+        prepare_control_fifo(CTRL_PATH)
+        threading.Thread( target=control_fifo_read_loop, args=(CTRL_PATH, host),
+                          daemon=True ).start()
+    except Exception as e:
+        print( f'(jack_loop) cannot prepare the control fifo: {str(e)}' )
+
+    # Keep alive until JACK shuts down
+    try:
+        host.shutdown.wait()
+    except KeyboardInterrupt:
+        print('\n(jack_loop) Interrupted by user')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+""" A signal presence detector for the powersave feature.
+
+    A JACK client taps the preamp input loop ports, then the signal
+    energy of each JACK block is computed inside the process callback.
+
+    Detection has hysteresis:
+
+        attack:     the signal must stay above the noise floor during
+                    ATTACK_TIME before it is considered as present.
+
+        release:    the signal must stay below the noise floor minus
+                    HYSTERESIS dB during the 'powersave_minutes' setting
+                    before it is considered as gone.
+
+    On each transition the corresponding threading.Event is set,
+    so the waiting jobs are woken up with about one JACK block latency.
+"""
+
+import  jack
+import  numpy as np
+
+
+# Default values, see also config.yml
+NOISE_FLOOR = -70           # dBFS
+MAX_WAIT    =  60           # seconds
+HYSTERESIS  =   3           # dB
+ATTACK_TIME = 0.05          # seconds
+TAP_PORTS   = ('pre_in_loop:output_1', 'pre_in_loop:output_2')
+
+
+class SignalDetector(object):
+    """ .start()    registers the JACK tap and starts detecting
+        .stop()     closes the JACK tap, it takes effect at once
+
+        on_signal:  a threading.Event to set when the signal arrives
+        on_silence: a threading.Event to set when the signal has gone
+        reset_flag: a threading.Event, if set the silence elapsed time
+                    is restarted (e.g. when selecting a new source or
+                    when the convolver was switched on)
+        present:    the initial signal presence, it must be False if the
+                    convolver is not running, so that it will be woken up
+                    by the first signal.
+    """
+
+    def __init__(self, on_signal, on_silence, reset_flag,
+                       noise_floor=NOISE_FLOOR, max_wait=MAX_WAIT,
+                       present=True ):
+
+        self.on_signal      = on_signal
+        self.on_silence     = on_silence
+        self.reset_flag     = reset_flag
+        self.noise_floor    = noise_floor
+
+        # Energy thresholds (mean square) instead of dBFS,
+        # so that no log is computed in the process callback
+        self.attack_ms      = 10 ** ( noise_floor / 10 )
+        self.release_ms     = 10 ** ( (noise_floor - HYSTERESIS) / 10 )
+        self.max_wait       = max_wait
+
+        self.client         = None
+        # If assumed present, a silent startup will be released
+        self.present        = present
+        self.loud_frames    = 0
+        self.quiet_frames   = 0
+
+
+    def start(self):
+
+        self.client = jack.Client('powersave', no_start_server=True)
+
+        fs = self.client.samplerate
+        self.attack_frames  = int( ATTACK_TIME   * fs )
+        self.release_frames = int( self.max_wait * fs )
+
+        self.client.set_process_callback( self._process )
+
+        for n, _ in enumerate(TAP_PORTS):
+            self.client.inports.register(f'in_{n+1}')
+
+        self.client.activate()
+
+        for src, dst in zip(TAP_PORTS, self.client.inports):
+            try:
+                self.client.connect(src, dst)
+            except Exception as e:
+                print( f'(powersave) cannot connect {src}: {str(e)}' )
+
+        print( f'(powersave) running, noise floor {self.noise_floor} dBFS' )
+
+
+    def stop(self):
+        if self.client:
+            self.client.deactivate()
+            self.client.close()
+            self.client = None
+        print( f'(powersave) stopped' )
+
+
+    def _process(self, frames):
+        """ The JACK process callback, keep it light
+        """
+        # The convolver was woken up from outside, lets watch it again
+        if self.reset_flag.is_set():
+            self.reset_flag.clear()
+            self.quiet_frames = 0
+            self.present      = True
+
+        energy = max( [ np.dot(b, b) for b in
+                        [ p.get_array() for p in self.client.inports ] ] ) / frames
+
+        if energy > self.attack_ms:
+            self.loud_frames  += frames
+            self.quiet_frames  = 0
+
+        elif energy < self.release_ms:
+            self.loud_frames   = 0
+            self.quiet_frames += frames
+
+        else:
+            # inside the hysteresis band, nothing changes
+            self.loud_frames   = 0
+
+        if not self.present and self.loud_frames >= self.attack_frames:
+            self.present = True
+            self.on_signal.set()
+
+        elif self.present and self.quiet_frames >= self.release_frames:
+            self.present = False
+            self.on_silence.set()
@@ -64,6 +64,7 @@ var hide_graphs         = true;     // defaults for displaying graphs
 
 var last_eq_params      = {};       // To evaluate if eq curve changed
 var last_drc            = '';       // To evaluate if drc changed
+var last_eq_curve_ver   = -1;       // To evaluate if the eq_curve data changed
 var last_disc           = '';       // Helps on refreshing cd tracks list
 var last_input          = '';       // Helps on refreshing sources playlits
 var last_loudspeaker    = '';       // Will detect if audio processes has beeen
@@ -270,6 +271,14 @@ function init(){
         if (web_config.show_graphs==false){
             return;
         }
+        // Graphs will be drawn from data, so no images are used
+        if (web_config.client_graphs==true){
+            document.getElementById("bfeq_img").style.display    = 'none';
+            document.getElementById("drc_img").style.display     = 'none';
+            document.getElementById("bfeq_canvas").style.display = 'block';
+            document.getElementById("drc_canvas").style.display  = 'block';
+            return;
+        }
         // geat all drc_xxxx.png at once at start, so them will remain in cache.
         const drc_sets = JSON.parse( control_cmd('preamp get_drc_sets') );
         for (const i in drc_sets){
@@ -609,7 +618,7 @@ function page_update() {
 
         // sysmon
         // Example when wifi is not conneted:
-        //  "sysmon": {"wifi": {"Tx-Power": "12"}, "temp": 69.2}}
+        //  "sysmon": {"wifi": {"iface": "wlan0"}, "temp": 69.2, "fans": {...}}
         //
         let sysmon = '';
         const temp = aux_info.sysmon.temp
@@ -638,8 +647,8 @@ function page_update() {
         }
 
         if (! isEmpty(wifi)){
-            if ('Bit-rate-Mb/s' in wifi){
-                sysmon += ' | wifi: ' + wifi['Bit-rate-Mb/s'] + ' Mb/s';
+            if ('Quality' in wifi){
+                sysmon += ' | wifi: ' + wifi['iface'];
                 sysmon += ' quality: ' + wifi['Quality'];
                 sysmon += ' Rx: ' + wifi['Signal-level'] + ' dBm';
             }else{
@@ -706,7 +715,20 @@ function page_update() {
         }
 
 
-        if ( hide_graphs == false ) {
+        if ( hide_graphs == false && web_config.client_graphs == true ) {
+            if (eq_changed() == true) {
+                const eq = JSON.parse( control_cmd('preamp eq_curve') );
+                if (eq.version != last_eq_curve_ver) {
+                    last_eq_curve_ver = eq.version;
+                    draw_eq_graph(eq);
+                }
+            }
+            if (drc_changed() == true) {
+                draw_drc_graph(state.loudspeaker, state.drc_set);
+            }
+        }
+
+        else if ( hide_graphs == false ) {
         // The temporary 'new_eq_graph' flag helps on slow machines because the new PNG graph
         // can take a while after the 'done' is received when issuing some audio command.
             if (eq_changed() == true || aux_info.new_eq_graph == true) {
@@ -1241,6 +1263,110 @@ function omd_graphs_toggle() {
 
 
 
+////////  GRAPHS  ////////
+
+const GRAPH_FREQ_LIMITS = [20, 20000];
+const GRAPH_FREQ_TICKS  = [20, 50, 100, 200, 500, 1e3, 2e3, 5e3, 1e4, 2e4];
+const GRAPH_FREQ_LABELS = ['20', '50', '100', '200', '500', '1K', '2K', '5K', '10K', '20K'];
+
+
+function plot_curves(canvas_id, freqs, curves, dB_limits, dB_ticks){
+    // Draws log freq curves on a canvas, similar to the server PNG graphs.
+    //  curves: [ {'mag': [dB, ...], 'color': 'grey'}, ... ]
+
+    const canvas = document.getElementById(canvas_id);
+    const ctx    = canvas.getContext('2d');
+    const W      = canvas.width;
+    const H      = canvas.height;
+    const pad    = {'left': 25, 'right': 5, 'top': 5, 'bottom': 15};
+
+    const logF0 = Math.log10(GRAPH_FREQ_LIMITS[0]);
+    const logF1 = Math.log10(GRAPH_FREQ_LIMITS[1]);
+
+    function x_pos(f){
+        return pad.left + (Math.log10(f) - logF0) / (logF1 - logF0)
+                          * (W - pad.left - pad.right);
+    }
+    function y_pos(dB){
+        return pad.top + (dB_limits[1] - dB) / (dB_limits[1] - dB_limits[0])
+                         * (H - pad.top - pad.bottom);
+    }
+
+    // same as the page background-color
+    ctx.fillStyle = 'rgb(38, 38, 38)';
+    ctx.fillRect(0, 0, W, H);
+
+    // axes ticks and labels
+    ctx.strokeStyle = 'rgb(70, 70, 70)';
+    ctx.fillStyle   = 'rgb(200, 200, 200)';
+    ctx.font        = '9px sans-serif';
+    ctx.lineWidth   = 1;
+    ctx.beginPath();
+    for (const i in GRAPH_FREQ_TICKS){
+        const x = x_pos(GRAPH_FREQ_TICKS[i]);
+        ctx.moveTo(x, pad.top);
+        ctx.lineTo(x, H - pad.bottom);
+        ctx.textAlign = 'center';
+        ctx.fillText(GRAPH_FREQ_LABELS[i], x, H - 3);
+    }
+    for (const dB of dB_ticks){
+        const y = y_pos(dB);
+        ctx.moveTo(pad.left, y);
+        ctx.lineTo(W - pad.right, y);
+        ctx.textAlign = 'right';
+        ctx.fillText(dB.toString(), pad.left - 3, y + 3);
+    }
+    ctx.stroke();
+
+    // curves
+    ctx.lineWidth = 2;
+    for (const curve of curves){
+        ctx.strokeStyle = curve.color;
+        ctx.beginPath();
+        let started = false;
+        for (const i in freqs){
+            if (freqs[i] < GRAPH_FREQ_LIMITS[0] || freqs[i] > GRAPH_FREQ_LIMITS[1]){
+                continue;
+            }
+            const x = x_pos(freqs[i]);
+            const y = y_pos(curve.mag[i]);
+            if (!started){
+                ctx.moveTo(x, y);
+                started = true;
+            }else{
+                ctx.lineTo(x, y);
+            }
+        }
+        ctx.stroke();
+    }
+}
+
+
+function draw_eq_graph(eq){
+    // eq: the 'preamp eq_curve' response
+    plot_curves('bfeq_canvas', eq.band, [ {'mag': eq.mag, 'color': 'grey'} ],
+                [-9, 21], [-6, 0, 6, 12, 18]);
+}
+
+
+function draw_drc_graph(loudspeaker, drc_set){
+    // Draws the drc_xxxx.json data prepared by drc2png.py
+
+    const myREQ = new XMLHttpRequest();
+    myREQ.open("GET", 'images/' + loudspeaker + '/drc_' + drc_set + '.json', false);
+    myREQ.send();
+
+    try{
+        const drc = JSON.parse(myREQ.responseText);
+        plot_curves('drc_canvas', drc.freqs, [ {'mag': drc.L, 'color': 'steelblue'},
+                                               {'mag': drc.R, 'color': 'indianred'} ],
+                    [-20, 9], [-18, -12, -6, 0, 6]);
+    }catch(e){
+        console.log('error drawing the drc graph', e.message);
+    }
+}
+
+
 ////////  MISCEL INTERNALS  ////////
 
 function control_cmd( cmd ) {
@@ -22,8 +22,14 @@ function page_update(){
     if (peak_monitor_running){
 
         document.getElementById("peaks_monitor_state").innerText = 'Convolver peaks monitor is running ...'
-        const peaks = JSON.parse( control_cmd('aux get_bf_today_peaks') );
-        display_peaks(peaks.header, peaks.peaks);
+
+        // PEAKS_SINCE reduces the query to the last seconds
+        let range = 'today';
+        if (PEAKS_SINCE){
+            range = Math.ceil(Date.now() / 1000 - PEAKS_SINCE).toString();
+        }
+        const peaks = JSON.parse( control_cmd('aux get_bf_peaks ' + range) );
+        display_peaks(peaks.outputs, peaks.rows);
 
     }else{
 
@@ -33,16 +39,44 @@ function page_update(){
 }
 
 
-function display_peaks(header, peaks){
+function format_peaks_line(prefix, outputs, values){
+    // 6 chars columns, 3 extra spaces when the channel changes
+
+    let line = prefix;
+    let channel = '';
 
-    if (PEAKS_SINCE){
-        peaks = peaks.filter( (row) => row.slice(0,8) > PEAKS_SINCE );
+    for (let i in outputs){
+        const ch = outputs[i].split('.').pop();
+        if (channel && ch != channel){
+            line += '   ';
+        }
+        channel = ch;
+        line += values[i].toString().padStart(6);
     }
 
+    return line;
+}
+
+
+function display_peaks(outputs, rows){
+
+    //                LO    MI    HI        LO    MI    HI
+    //  12:48:02     1.2   2.3  10.1       5.4   5.5  10.1
+
+    const header = format_peaks_line( ' '.repeat(8),
+                                      outputs,
+                                      outputs.map( (o) => o.split('.')[0].toUpperCase() ) );
+
     let peaks_str = '';
 
-    for (let file of peaks.reverse()){
-        peaks_str += file + '\n';
+    for (let row of rows.reverse()){
+
+        const time = new Date(row.ts * 1000).toLocaleTimeString('es-ES',
+                        { hour: '2-digit', minute: '2-digit', second: '2-digit' });
+
+        const values = outputs.map( (o) => (o in row.peaks) ? row.peaks[o] : '' );
+
+        peaks_str += format_peaks_line(time, outputs, values) + '\n';
     }
 
     document.getElementById("peaks_hdr").innerText = header;
@@ -52,10 +86,8 @@ function display_peaks(header, peaks){
 
 function omd_clear_old_peaks(){
 
-    let now = new Date();
-
-    // example: '10:11:12'
-    PEAKS_SINCE = now.toLocaleTimeString('es-ES', { hour: '2-digit', minute: '2-digit', second: '2-digit' });
+    // epoch seconds
+    PEAKS_SINCE = Date.now() / 1000;
 }
 
 
@@ -9,11 +9,29 @@
     NOTICE: Even if short lenght IR are used for DRC, thus low resolution
             in low freq correction, the correction curve will be
             oversampled in order to show a smoothed low freq region.
+
+    Outdated DRC sets are processed as follows, with low CPU priority
+    in order not to compete with Brutefir on startup:
+
+        - The spectrum of all impulses is computed at once, as a batched
+          rFFT of the zero padded impulses.
+
+        - Curves are decimated to log spaced points, then they are saved
+          as a compact JSON file that the web page can draw by itself:
+
+            drc_<set>.json  {"freqs": [...], "L": [...dB], "R": [...dB]}
+
+        - PNG files are rendered in a process pool, each worker reuses
+          a single figure and Agg canvas for all its plots.
 """
 
 import  numpy as np
-from    scipy       import signal, fft
-from    matplotlib  import pyplot as plt
+from    matplotlib.figure               import Figure
+from    matplotlib.backends.backend_agg import FigureCanvasAgg
+from    matplotlib                      import style as mpl_style, \
+                                               rcParams as mpl_rcParams
+from    multiprocessing                 import Pool
+import  json
 import  sys
 import  os
 
@@ -33,41 +51,59 @@ WEBCOLOR    = (.15, .15, .15)
 # https://matplotlib.org/2.0.2/examples/color/named_colors.html
 LINERED     = 'indianred'
 LINEBLUE    = 'steelblue'
-plt.style.use('dark_background')
-plt.rcParams.update({'font.size': 6})
+mpl_style.use('dark_background')
+mpl_rcParams.update({'font.size': 6})
 FREQ_LIMITS = [20, 20000]
 FREQ_TICKS  = [20, 50, 100, 200, 500, 1e3, 2e3, 5e3, 1e4, 2e4]
 FREQ_LABELS = ['20', '50', '100', '200', '500', '1K', '2K', '5K', '10K', '20K']
 DB_LIMITS   = [-20, +9]
 DB_TICKS    = [-18, -12, -6, 0, 6]
 DB_LABELS   = ['-18', '-12', '-6', '0', '6']
+# Log spaced points for decimated curves (enough for a 500 px wide graph)
+PLOT_FREQS  = np.logspace( np.log10(FREQ_LIMITS[0]), np.log10(FREQ_LIMITS[1]), 300 )
+# The only worker figure
+FIG         = None
 
 
-def get_spectrum(imp, fs):
+def get_spectra(imps, fs):
+    """ Magnitude spectrum of a bunch of impulses in a single vectorized pass.
 
-    fNyq = fs / 2.0
+        imps:   a list of impulses
+        fs:     sample rate
 
-    # Oversampling short taps IRs to display "hi-res" low freq region.
-    N = int( len(imp) / 2 ) * 8
-    # limit to N <= fs / 5 (a resolution of 5 Hz is enough for this graph)
-    N = int(min(N, fs / 5))
-    try:
-        N = fft.next_fast_len(N)
-    except:
-        print(f'(drc2png) fft.next_fast_len not availble on this scipy version')
+        returns freqs, magdB[impulse, freq]
+    """
 
-    # Semispectrum (whole=False -->  w to Nyquist)
-    w, h = signal.freqz(imp, worN=N, whole=False)
+    # Oversampling short taps IRs to display "hi-res" low freq region,
+    # but limited to a resolution of 5 Hz (enough for this graph).
+    # The FFT length must not truncate the longest impulse.
+    maxlen = max( [len(x) for x in imps] )
+    N = int( min( maxlen * 8, fs / 2.5 ) )
+    N = max( N, maxlen )
+    # next power of 2
+    N = int( 2 ** np.ceil( np.log2(N) ) )
 
-    # Actual freq from normalized freq
-    freqs = w / np.pi * fNyq
+    # Zero padded impulses
+    batch = np.zeros( (len(imps), N), dtype='float32' )
+    for i, imp in enumerate(imps):
+        batch[i, :len(imp)] = imp
+
+    h = np.fft.rfft(batch, n=N, axis=1)
+
+    freqs = np.fft.rfftfreq(N, d=1 / fs)
 
     # Magnitude to dB:
-    magdB = 20 * np.log10(abs(h))
+    magdB = 20 * np.log10( np.maximum( np.abs(h), 1e-9 ) )
 
     return freqs, magdB
 
 
+def decimate(freqs, magdB):
+    """ Resamples curves to the PLOT_FREQS log spaced points
+    """
+    return np.array( [ np.interp(PLOT_FREQS, freqs, m) for m in magdB ] )
+
+
 def read_pcms(drc_set):
 
     def readPCM32(fname):
@@ -139,33 +175,99 @@ def get_coeff_atten(drc_set, ch):
 
 
 def png_is_outdated(drc_set):
-    """ check datetime of drcXXX.png file versus drcXXX.pcm file """
+    """ check datetime of drcXXX.png and drcXXX.json files versus drcXXX.pcm files """
+
+    img_paths = [ f'{IMGFOLDER}/drc_{drc_set}.png', f'{IMGFOLDER}/drc_{drc_set}.json' ]
 
     if drc_set == 'none':
-        png_path = f'{IMGFOLDER}/drc_none.png'
-        if os.path.isfile( png_path ):
+        if all( [os.path.isfile(x) for x in img_paths] ):
             return False
+        return True
 
     for ch in 'L', 'R':
         # pcm path do exists because pcm_sets is derived from the pcm files
         pcm_path = f'{LSPK_FOLDER}/drc.{ch}.{drc_set}.pcm'
-        # png path might not exist
-        png_path = f'{IMGFOLDER}/drc_{drc_set}.png'
-        try:
-            pcm_ctime = os.path.getctime(pcm_path) # the lower one
-            png_ctime = os.path.getctime(png_path)
-            if (png_ctime - pcm_ctime) < 0:
+        # png or json paths might not exist
+        for img_path in img_paths:
+            try:
+                pcm_ctime = os.path.getctime(pcm_path) # the lower one
+                img_ctime = os.path.getctime(img_path)
+                if (img_ctime - pcm_ctime) < 0:
+                    if verbose:
+                        print(f'(drc2png) found old {img_path[-4:]} file for "{drc_set}"')
+                    return True
+            except:
                 if verbose:
-                    print(f'(drc2png) found old PNG file for "{drc_set}"')
+                    print(f'(drc2png) {img_path[-4:]} file for "{drc_set}" not found')
                 return True
-        except:
-            if verbose:
-                print(f'(drc2png) PNG file for "{drc_set}" not found')
-            return True
 
     return False
 
 
+def save_json(drc_set, curves):
+    """ curves: {'L': magdB, 'R': magdB}, decimated to PLOT_FREQS
+    """
+    d = { 'freqs': [ round(x, 1) for x in PLOT_FREQS.tolist() ] }
+    for ch, mag in curves.items():
+        d[ch] = [ round(x, 2) for x in mag.tolist() ]
+
+    fjson = f'{IMGFOLDER}/drc_{drc_set}.json'
+    with open(fjson, 'w') as f:
+        f.write( json.dumps(d, separators=(',', ':')) )
+
+    if verbose:
+        print( f'(drc2png) saved: \'{fjson}\' ' )
+
+
+def init_worker(verbose_mode):
+    """ Each pool worker prepares the only figure to be reused for all plots
+    """
+    global FIG, verbose
+
+    verbose = verbose_mode
+
+    FIG = Figure( figsize=(5, 1.5) )   # 5 inches at 100dpi => 500px wide
+    FigureCanvasAgg(FIG)
+    FIG.set_facecolor( WEBCOLOR )
+
+    ax = FIG.add_subplot()
+    ax.set_facecolor( WEBCOLOR )
+
+    ax.set_xscale('log')
+    ax.set_xlim( FREQ_LIMITS )
+    ax.set_xticks( FREQ_TICKS )
+    ax.set_xticklabels( FREQ_LABELS )
+
+    ax.set_ylim( DB_LIMITS )
+    ax.set_yticks( DB_TICKS )
+    ax.set_yticklabels( DB_LABELS )
+
+    for ch in ('L', 'R'):
+        ax.plot( [], [],
+                 label=ch,
+                 color={'L': LINEBLUE, 'R': LINERED}[ch],
+                 linewidth=3 )
+
+    ax.legend( facecolor=WEBCOLOR, loc='lower right')
+
+
+def plot_png(args):
+    """ Updates the curves of the worker figure, then saves it
+    """
+    drc_set, curves = args
+
+    ax = FIG.axes[0]
+    for line in ax.get_lines():
+        line.set_data( PLOT_FREQS, curves[ line.get_label() ] )
+
+    #ax.set_title( f'DRC: {drc_set}' )
+
+    fpng = f'{IMGFOLDER}/drc_{drc_set}.png'
+    FIG.savefig( fpng, facecolor=WEBCOLOR )
+    if verbose:
+        print( f'(drc2png) saved: \'{fpng}\' ' )
+
+
 def prepare_IMGFOLDER():
     try:
         os.mkdir(IMGFOLDER)
@@ -177,6 +279,13 @@ def prepare_IMGFOLDER():
 
 if __name__ == '__main__':
 
+    # Low priority, this runs on startup concurrently with Brutefir.
+    # (i) Children pool workers will inherit the niceness.
+    try:
+        os.nice(19)
+    except:
+        pass
+
     # Reading drc coeffs inside brutefir_config in order to get coeff attenuation
     bf_coeffs = bf_get_config()["coeffs"]
     BF_DRC_COEFFS = [x for x in bf_coeffs if x["name"].startswith('drc')]
@@ -201,57 +310,43 @@ if __name__ == '__main__':
 
     # Get DRC sets names
     drc_sets = get_drc_sets()
-
-    # Do plot png files from pcm files
     drc_sets.append('none')
-    for drc_set in drc_sets:
 
-        # Check for outdated PNG file
-        if not png_is_outdated(drc_set):
-            if verbose:
-                print(f'(drc2png) found PNG file for {LOUDSPEAKER}: {drc_set}')
-            continue
-        else:
+    # Check for outdated PNG files
+    todo_sets = []
+    for drc_set in drc_sets:
+        if png_is_outdated(drc_set):
             if verbose:
                 print(f'(drc2png) processing PNG file for {LOUDSPEAKER}: {drc_set}')
+            todo_sets.append(drc_set)
+        elif verbose:
+            print(f'(drc2png) found PNG file for {LOUDSPEAKER}: {drc_set}')
 
-        fig, ax = plt.subplots()
-        fig.set_figwidth( 5 )   # 5 inches at 100dpi => 500px wide
-        fig.set_figheight( 1.5 )
-        fig.set_facecolor( WEBCOLOR )
-        ax.set_facecolor( WEBCOLOR )
+    if not todo_sets:
+        sys.exit()
 
-        ax.set_xscale('log')
-        ax.set_xlim( FREQ_LIMITS )
-        ax.set_xticks( FREQ_TICKS )
-        ax.set_xticklabels( FREQ_LABELS )
+    # Each IR has the following fields: fs, imp, drc_set, channel
+    IRs = []
+    for drc_set in todo_sets:
+        if drc_set != 'none':
+            IRs += read_pcms( drc_set )
+        else:
+            IRs += diracs()
 
-        ax.set_ylim( DB_LIMITS )
-        ax.set_yticks( DB_TICKS )
-        ax.set_yticklabels( DB_LABELS )
+    # All spectra at once
+    freqs, magdB = get_spectra( [IR["imp"] for IR in IRs], FS )
+    magdB = decimate(freqs, magdB)
 
-        #ax.set_title( f'DRC: {drc_set}' )
+    # Group curves by drc set
+    jobs = {}
+    for IR, mag in zip(IRs, magdB):
+        atten = get_coeff_atten( IR["drc_set"], IR["channel"] )
+        jobs.setdefault( IR["drc_set"], {} )[ IR["channel"] ] = mag - atten
 
-        if drc_set != 'none':
-            IRs = read_pcms( drc_set )
-        else:
-            IRs = diracs()
-
-        # Each IR has the following fields: fs, imp, drc_set, channel
-        for IR in IRs:
-            freqs, magdB = get_spectrum( IR["imp"], FS )
-            atten = get_coeff_atten( IR["drc_set"], IR["channel"] )
-            magdB -= atten
-            ax.plot(freqs, magdB,
-                    label=f'{IR["channel"]}',
-                    color={'L': LINEBLUE, 'R': LINERED}
-                          [ IR["channel"] ],
-                    linewidth=3
-                    )
-
-        ax.legend( facecolor=WEBCOLOR, loc='lower right')
-        fpng = f'{IMGFOLDER}/drc_{drc_set}.png'
-        plt.savefig( fpng, facecolor=WEBCOLOR )
-        if verbose:
-            print( f'(drc2png) saved: \'{fpng}\' ' )
-        #plt.show()
+    for drc_set, curves in jobs.items():
+        save_json(drc_set, curves)
+
+    # Rendering PNGs
+    nproc = max( 1, min( len(jobs), (os.cpu_count() or 1) - 1, 2 ) )
+    with Pool( processes=nproc, initializer=init_worker, initargs=(verbose,) ) as pool:
+        pool.map( plot_png, jobs.items() )
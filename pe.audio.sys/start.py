@@ -17,16 +17,28 @@
 """
 
 import  subprocess as sp
+import  shlex
+import  ast
+import  importlib.util
 from    time import sleep, time, ctime, gmtime, strftime
 from    json import dumps as json_dumps
 from    types import SimpleNamespace
+import  threading
 import  os
 import  sys
 
 UHOME = os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
-from miscel import *
+import timeline
+
+# The startup timeline begins before loading the rest of modules
+if sys.argv[1:2] in (['all'], ['server']):
+    timeline.begin()
+
+with timeline.phase('import miscel'):
+    from miscel import *
+import proc_registry
 
 
 # Init plugins (to run first)
@@ -42,6 +54,133 @@ INIT_PLUGINS = (
 )
 
 
+# Plugins are launched in parallel as soon as their dependencies are ready,
+# as declared by each plugin (see plugin_declarations). The system resources:
+#   'jack'      JACK ports are accesible
+#   'brutefir'  Brutefir is running
+#   'server'    the 'peaudiosys' server answers to the 'state' command
+# Any other resource is provided by some plugin.
+DEFAULT_DEPENDS = ('jack',)
+
+# Max seconds to wait for a resource to be ready
+RESOURCE_TIMEOUT = 30
+
+# The end of the last sequential startup phase, see mark()
+LAST_MARK   = time()
+
+# Resources readiness: { name: {'event': threading.Event, 'ready': bool} }
+RESOURCES   = {}
+RES_LOCK    = threading.Lock()
+
+
+def mark(phase):
+    """ Records a sequential startup phase, from the previous mark until now
+    """
+    global LAST_MARK
+    now = time()
+    timeline.record(phase, LAST_MARK, now)
+    print(f'{Fmt.GRAY}(start) {phase}: {now - LAST_MARK:.2f} s{Fmt.END}')
+    LAST_MARK = now
+
+
+# Readiness checks, they must be quick.
+# Plugins providing a resource add here their own ready() function.
+READINESS_PROBES = {
+    'jack':     jack_lsp,
+    'brutefir': lambda: process_is_running('brutefir'),
+    'server':   lambda: 'loudspeaker' in send_cmd('state', timeout=1)
+}
+
+
+def plugin_declarations(pname):
+    """ A Python plugin can declare at module level:
+
+            DEPENDS = ('brutefir', 'server')    resources needed to start it
+            PROVIDES = 'mpd'                    a resource it provides
+            def ready(): ...                    the provided resource probe
+
+        DEPENDS and PROVIDES are read as literals, without importing
+        the plugin. Plugins not declaring DEPENDS just need JACK.
+
+        returns: (depends, provides)
+    """
+    depends, provides = DEFAULT_DEPENDS, ''
+
+    try:
+        with open(f'{MAINFOLDER}/share/plugins/{pname}', 'r') as f:
+            tree = ast.parse( f.read() )
+    except:
+        # not a Python plugin
+        return depends, provides
+
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            if not isinstance(target, ast.Name):
+                continue
+            try:
+                if target.id == 'DEPENDS':
+                    depends = tuple( ast.literal_eval(node.value) )
+                elif target.id == 'PROVIDES':
+                    provides = ast.literal_eval(node.value)
+            except Exception as e:
+                print(f'{Fmt.RED}(start) plugin: {pname} bad {target.id}: {str(e)}{Fmt.END}')
+
+    return depends, provides
+
+
+def add_plugin_probe(pname, resource):
+    """ Imports the plugin providing a resource, to probe it by its ready()
+    """
+    try:
+        spec = importlib.util.spec_from_file_location(
+                        pname.replace('.py', '').replace('-', '_'),
+                        f'{MAINFOLDER}/share/plugins/{pname}' )
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        READINESS_PROBES[resource] = mod.ready
+    except Exception as e:
+        print(f'{Fmt.RED}(start) plugin: {pname} cannot probe \'{resource}\': {str(e)}{Fmt.END}')
+        READINESS_PROBES[resource] = lambda: False
+
+
+def watch_resource(name, timeout=RESOURCE_TIMEOUT):
+    """ Polls the readiness probe of a resource in background,
+        the resource event is set when ready or when timed out.
+    """
+    with RES_LOCK:
+        if name in RESOURCES:
+            return RESOURCES[name]
+        res = {'event': threading.Event(), 'ready': False}
+        RESOURCES[name] = res
+
+    def poll():
+        tries = int(timeout / .1)
+        while tries:
+            if READINESS_PROBES[name]():
+                res["ready"] = True
+                timeline.event(f'{name} ready')
+                break
+            sleep(.1)
+            tries -= 1
+        if not tries:
+            print(f'{Fmt.BOLD}(start) \'{name}\' NOT ready after {timeout} s{Fmt.END}')
+        res["event"].set()
+
+    threading.Thread(target=poll, daemon=True).start()
+
+    return res
+
+
+def wait_resource(name, timeout=RESOURCE_TIMEOUT):
+    """ (bool)
+    """
+    res = watch_resource(name, timeout)
+    res["event"].wait()
+    return res["ready"]
+
+
 def start_zita_link():
     """ A LAN audio connection based on zita-njbridge from Fons Adriaensen.
 
@@ -74,36 +213,54 @@ def start_zita_link():
 
     zita_link_ports = {}
 
-
     for item in REMOTES:
 
         source_name, raddr, rport = item
-        print( f'(start) Running zita-njbridge for: {source_name}' )
 
-        # Trying to RUN THE REMOTE SENDER zita-j2n (*)
-        remote_zita_restart(raddr, rport, UDP_PORT)
-
-        # Append the UPD_PORT to zita_link_ports
-        zita_link_ports[source_name] = {'addr': raddr, 'udpport': UDP_PORT}
-
-        # RUN LOCAL RECEIVER:
-        local_zita_restart(raddr, UDP_PORT, ZITA_BUFFER_MS)
+        zita_link_ports[source_name] = { 'addr':      raddr,
+                                         'ctrlport':  rport,
+                                         'udpport':   UDP_PORT,
+                                         'linked':    False }
 
         # (i) zita will use 2 consecutive ports, so let's space by 10
         UDP_PORT += 10
 
     # (*) Saving the zita's UDP PORTS for future use because
     #     the remote sender could not be online at the moment ...
-    with open(f'{MAINFOLDER}/.zita_link_ports', 'w') as f:
-        d = json_dumps( zita_link_ports )
-        f.write(d)
+    write_zita_link_ports( zita_link_ports )
 
 
-def stop_zita_link():
+    def bring_up(source_name, link):
 
-    for item in REMOTES:
+        print( f'(start) Running zita-njbridge for: {source_name}' )
 
-        _, raddr, rport = item
+        # RUN LOCAL RECEIVER, it does not need the sender to be online:
+        local_zita_restart(link['addr'], link['udpport'], ZITA_BUFFER_MS)
+
+        # Trying to RUN THE REMOTE SENDER zita-j2n, with a short timeout
+        result = remote_zita_restart(link['addr'], link['ctrlport'], link['udpport'])
+        if result != 'done':
+            print( f'{Fmt.GRAY}(start) remote sender for \'{source_name}\' not '
+                   f'available ({result}), will be retried in background{Fmt.END}' )
+
+
+    # One thread per remote, so that boot time does not depend on how many
+    # of them are reachable. Offline senders are retried later by the
+    # ZitaLinkKeeper from the 'aux' service.
+    threads = []
+    for source_name, link in zita_link_ports.items():
+        t = threading.Thread( target=bring_up, args=(source_name, link),
+                              daemon=True )
+        t.start()
+        threads.append(t)
+
+    for t in threads:
+        t.join()
+
+
+def stop_zita_link():
+
+    def stop(raddr, rport):
 
         # REMOTE
         zargs = json_dumps( (get_my_ip(), None, 'stop') )
@@ -115,6 +272,16 @@ def stop_zita_link():
         zitapattern  = f'zita-n2j --jname {zitajname}'
         sp.call( ['pkill', '-KILL', '-u', USER, '-f',  zitapattern] )
 
+    # All remotes at once, offline ones will just time out
+    threads = []
+    for _, raddr, rport in REMOTES:
+        t = threading.Thread( target=stop, args=(raddr, rport), daemon=True )
+        t.start()
+        threads.append(t)
+
+    for t in threads:
+        t.join()
+
 
 def start_brutefir():
     """ runs Brutefir, connects to pream_in_loop and resets
@@ -227,7 +394,8 @@ def stop_processes(mode):
         sp.Popen(f'pkill -KILL -u {USER} -f jackd >/dev/null 2>&1', shell=True)
 
     # This optimizes instead of a fixed sleep
-    wait4jackdkilled()
+    with timeline.phase('wait4jackdkilled'):
+        wait4jackdkilled()
 
 
 def run_init_plugins():
@@ -244,9 +412,51 @@ def run_init_plugins():
 
 
 def run_plugins(mode='start'):
-    """ (void)
+    """ When starting, the plugins are launched in parallel from background
+        threads, each one waiting for its dependencies to be ready.
+
+        returns: the list of launcher threads
     """
 
+    def launch(plugin, pname, cmd, deps, provides):
+
+        t_begin = time()
+
+        for dep in deps:
+            if not wait_resource(dep):
+                print(f'{Fmt.BOLD}(start) plugin: {plugin} launched '
+                      f'without \'{dep}\'{Fmt.END}')
+
+        print(f'(start) starting plugin: {plugin} ...')
+        try:
+            # (i) Plugins can be Python, Bash, etc, so they run by their
+            #     shebang. No shell is used, so that the registered pid
+            #     is the plugin one.
+            proc_registry.spawn( f'plugin {pname}', shlex.split(cmd),
+                                 stdout=sys.stdout, stderr=sys.stderr )
+        except Exception as e:
+            print(f'{Fmt.BOLD}(start) plugin: {plugin} {str(e)}{Fmt.END}')
+
+        # (i) this phase includes the waiting for dependencies
+        timeline.record(f'plugin {pname}', t_begin, time())
+
+        if provides:
+            watch_resource( provides )
+
+
+    threads = []
+
+    # The resources provided by plugins must be probed
+    # before any plugin waits for them.
+    declarations = {}
+    if mode == 'start':
+        for plugin in CONFIG['plugins']:
+            pname = plugin.split()[0]
+            declarations[pname] = plugin_declarations(pname)
+            provides = declarations[pname][1]
+            if provides and provides not in READINESS_PROBES:
+                add_plugin_probe(pname, provides)
+
     for plugin in CONFIG['plugins']:
 
         if plugin in INIT_PLUGINS:
@@ -265,13 +475,20 @@ def run_plugins(mode='start'):
 
         if mode == 'start':
 
-            try:
-                # (i) we need shell because plugins can be Python, Bash, etc...
-                res = sp.Popen(cmd, shell=True, stdout=sys.stdout, stderr=sys.stderr).returncode
-            except Exception as e:
-                res = str(e)
-
-            print(f'(start) starting plugin: {plugin} ...')
+            deps, provides = declarations[pname]
+            for dep in deps:
+                if dep in READINESS_PROBES:
+                    watch_resource(dep)
+                else:
+                    print(f'{Fmt.RED}(start) plugin: {plugin} needs unknown '
+                          f'\'{dep}\'{Fmt.END}')
+            deps = [ d for d in deps if d in READINESS_PROBES ]
+
+            t = threading.Thread( target=launch,
+                                  args=(plugin, pname, cmd, deps, provides),
+                                  daemon=True )
+            t.start()
+            threads.append(t)
 
         elif mode == 'stop':
 
@@ -285,6 +502,8 @@ def run_plugins(mode='start'):
         else:
             pass
 
+    return threads
+
 
 def check_state_file():
     """ restores a copy of .state if it was damaged by a sudden power break out
@@ -322,6 +541,7 @@ def prepare_drc_graphs():
         (void)
     """
     print(f'(start) processing drc sets to web/images/{LOUDSPEAKER} in background')
+    timeline.event('drc2png launched')
     sp.Popen(f'python3 {MAINFOLDER}/share/www/scripts/drc2png.py -q', shell=True)
 
 
@@ -436,9 +656,11 @@ if __name__ == "__main__":
 
     # THE 'peaudiosys_ctrl' SERVER must be always ON
     peaudiosys_ctrl_on()
+    mark('state file, remotes and ctrl server')
 
     # STOPPING ALL THE STAFF
     stop_processes(mode)
+    mark('stop_processes')
     if mode in ('stop', 'shutdown'):
         # RESTORING USB_DAC_WATCHDOG
         usb_dac_watchdog('start')
@@ -447,6 +669,7 @@ if __name__ == "__main__":
 
     # INIT PLUGINS.
     run_init_plugins()
+    mark('run_init_plugins')
 
     # STARTING:
     if mode in ('all'):
@@ -456,6 +679,7 @@ if __name__ == "__main__":
         if  jack_stuff != 'done':
             print(f'{Fmt.BOLD}(start) Problems starting JACK: {jack_stuff}{Fmt.END}')
             sys.exit()
+        mark('start_jack_stuff')
 
         # PIPEWIRE needs to reconnect to this new JACK
         if process_is_running('pipewire'):
@@ -465,10 +689,12 @@ if __name__ == "__main__":
             except Exception as e:
                 print(f'{Fmt.BOLD}(start) Problems restarting PipeWire: {str(e)}{Fmt.END}')
                 sys.exit()
+            mark('PipeWire reload')
 
         # INIT AUDIO by importing 'core' temporally (needs JACK to be running)
         import share.services.preamp_mod.core as core
         print(f'{Fmt.MAGENTA}(start) Managing a temporary \'core\' instance.{Fmt.END}')
+        mark('import core')
 
         # - BRUTEFIR
         bfstart = start_brutefir()
@@ -477,22 +703,27 @@ if __name__ == "__main__":
         else:
             print(f'({Fmt.BOLD}start) Problems starting BRUTEFIR: {bfstart}')
             sys.exit()
+        mark('start_brutefir')
 
         # - CamillaDSP (currently used only for an optional compressor)
         if CONFIG["use_compressor"]:
             import  camilla_dsp
             # Inits CamillaDSP with the compressor bypassed, standalone process (Popen)
             camilla_dsp._init(compressor='off')
+            mark('CamillaDSP init')
 
         # Optional REMOTE SOURCES
         if REMOTES:
             start_zita_link()
+            mark('start_zita_link')
 
         # - RESTORE ON_INIT AUDIO settings
         core.init_audio_settings()
+        mark('init_audio_settings')
 
         # - PREAMP  -->  MONITORS
         core.connect_monitors()
+        mark('connect_monitors')
 
         # If necessary will prepare DRC GRAPHS for use of the web page
         if CONFIG["web_config"]["show_graphs"]:
@@ -502,13 +733,14 @@ if __name__ == "__main__":
         print(f'{Fmt.MAGENTA}(start) Closing the temporary \'core\' instance.{Fmt.END}')
 
 
-    # PLUGINS
+    # PLUGINS, launched in background as per their dependencies
+    plugin_threads = []
     if mode in ('all'):
-        run_plugins()
+        plugin_threads = run_plugins()
 
-    # RUN THE 'peaudiosys' SERVER
+    # RUN THE 'peaudiosys' SERVER, at the same time
     manage_server(mode='start', service='peaudiosys')
-    if not peaudiosys_server_is_running():
+    if not wait_resource('server'):
         print(f'{Fmt.BOLD}(start) PANIC: \'peaudiosys\' service is down. Bye.{Fmt.END}')
         sys.exit()
 
@@ -520,10 +752,21 @@ if __name__ == "__main__":
                 print( f'{Fmt.BLUE}(start) triyng macro \'{mname}\'{Fmt.END}' )
                 sp.Popen( f'{MAINFOLDER}/macros/{mname}', shell=True )
 
+    # Waiting for all plugins to be launched, then music is playable
+    for t in plugin_threads:
+        t.join()
+    if 'mpd' in RESOURCES:
+        wait_resource('mpd')
+    timeline.event('music playable')
+
     # RESTORING USB_DAC_WATCHDOG
     usb_dac_watchdog('start')
 
     # END
+    if timeline.enabled():
+        timeline.end()
+        print(f'{Fmt.BLUE}(start) startup timeline (see bin/peaudiosys_startup_timeline.py):{Fmt.END}')
+        print( timeline.waterfall( timeline.load() ) )
     print(f'{Fmt.BOLD}{Fmt.BLUE}(start) END.{Fmt.END}')
 
     sys.exit()